@@ -5,6 +5,7 @@ from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_cors import CORS
 from .config import config
+import click
 import datetime
 import logging  # 添加logging模块导入
 import os  # 添加os模块导入
@@ -194,6 +195,15 @@ def create_app(config_name=None):
             # 只对需要登录的页面进行重定向
             # 数据集列表等页面不需要登录，所以不应该强制重定向
 
+    @app.before_request
+    def start_background_services():
+        # inline 模式下由 Web 进程内的 worker 线程执行评估任务队列（进程重启后首个请求时恢复）
+        from app.services.job_queue import ensure_embedded_worker
+        ensure_embedded_worker(app)
+        # 系统模型由后台线程定期同步，页面请求只读数据库
+        from app.services.model_service import start_system_model_refresher
+        start_system_model_refresher(app)
+
     @app.after_request
     def after_request(response):
         # 添加缓存控制头，防止缓存问题
@@ -305,4 +315,47 @@ def create_app(config_name=None):
             init_database_data()
             print("数据库初始化完成")
 
+    @app.cli.command('backfill-perf-results')
+    def backfill_perf_results():
+        """为历史性能评估任务回填结构化结果表"""
+        from app.services.perf_service import PerformanceEvaluationService
+        with app.app_context():
+            filled = PerformanceEvaluationService.backfill_structured_results()
+            print(f"已回填 {filled} 个性能评估任务的结构化结果")
+
+    @app.cli.command('clear-cache')
+    @click.argument('namespace')
+    def clear_cache(namespace):
+        """清空跨进程共享缓存的指定命名空间（如 system_models）"""
+        from app.utils.shared_cache import get_cache
+        with app.app_context():
+            get_cache(namespace).invalidate_all()
+            print(f"已清空共享缓存: {namespace}")
+
+    @app.cli.command('job-queue-check')
+    @click.option('--timeout', default=15.0, show_default=True, help='等待探测任务被领取的秒数')
+    def job_queue_check(timeout):
+        """自检：worker 空轮询之后新入队的任务能否被领取执行"""
+        from app.services.job_worker import check_queue_pickup
+        with app.app_context():
+            if not check_queue_pickup(app, timeout=timeout):
+                raise click.ClickException(f"探测任务在 {timeout} 秒内未被领取，worker 可能一直读取旧的数据库快照")
+            print("任务队列自检通过：空轮询后入队的任务已被领取执行")
+
+    @app.cli.command('completion-cache')
+    @click.option('--clear', is_flag=True, help='清空缓存并重置统计')
+    def completion_cache(clear):
+        """查看模型回复缓存的命中统计"""
+        import json
+        from app.utils.completion_cache import get_completion_cache
+        with app.app_context():
+            cache = get_completion_cache()
+            if cache is None:
+                print("模型回复缓存未启用（COMPLETION_CACHE_ENABLED=false）")
+                return
+            if clear:
+                cache.clear()
+                print("已清空模型回复缓存")
+            print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+
     return app
@@ -2,36 +2,72 @@ from evalscope.benchmarks.benchmark import BENCHMARK_MAPPINGS, BenchmarkMeta
 from evalscope.benchmarks.data_adapter import DataAdapter  
 from evalscope.constants import OutputType  
 from evalscope.metrics import LLMJudge, Metric, mean, metric_registry
+import hashlib
 import json
 from typing import Any, List, Union
 import os.path
 from collections import defaultdict
 from evalscope.utils.io_utils import jsonl_to_list
+from flask import current_app, has_app_context
 from jinja2 import Environment, FileSystemLoader
 import os
 import re
 from app.models import Dataset
+from app.utils.completion_cache import get_completion_cache, is_cacheable, make_cache_key
+from app.utils.shared_cache import get_cache
+from app.utils.template_cache import CompiledTemplateCache, template_hash
+
+# 评审结论缓存的命名空间
+JUDGE_VERDICT_CACHE_NAMESPACE = 'judge_verdicts'
+
+
+def _create_template_environment() -> Environment:
+    """自定义数据集模板的 Jinja2 环境"""
+    template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+    env = Environment(loader=FileSystemLoader(template_dir))
+
+    # 注册自定义过滤器
+    env.filters['from_json'] = lambda x: json.loads(x) if isinstance(x, str) else x
+    env.filters['to_json'] = lambda x: json.dumps(x, ensure_ascii=False)
+    env.filters['regex_search'] = lambda text, pattern: re.search(pattern, text).group(0) if re.search(pattern, text) else None
+    return env
+
+
+# 进程内共享的已编译模板，按模板内容哈希缓存
+compiled_templates = CompiledTemplateCache(_create_template_environment)
+
+
+def call_judge(judge: LLMJudge, prompt: str, system_prompt: str) -> str:
+    """调用评审模型；评审参数可复现（temperature 为 0 或指定 seed）时复用回复缓存"""
+    completion_cache = get_completion_cache()
+    generation_config = getattr(judge, 'generation_config', None) or {}
+    cache_key = None
+    if completion_cache is not None and is_cacheable(generation_config):
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': prompt}]
+        cache_key = make_cache_key(getattr(judge, 'api_url', ''), getattr(judge, 'model_id', ''), messages, generation_config)
+        cached = completion_cache.get(cache_key)
+        if cached is not None:
+            return cached['content']
+    response = judge(prompt, system_prompt)
+    # evalscope 在评审调用失败时返回空字符串，不缓存
+    if cache_key and response:
+        completion_cache.set(cache_key, {'content': response})
+    return response
   
 # 动态创建DataAdapter类  
 class CustomDatasetAdapter(DataAdapter): 
     def __init__(self, **kwargs):
-        # 初始化模板环境
-        template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
-        self.env = Environment(loader=FileSystemLoader(template_dir))
-        
-        # 注册自定义过滤器
-        self.env.filters['from_json'] = lambda x: json.loads(x) if isinstance(x, str) else x
-        self.env.filters['to_json'] = lambda x: json.dumps(x, ensure_ascii=False)
-        self.env.filters['regex_search'] = lambda text, pattern: re.search(pattern, text).group(0) if re.search(pattern, text) else None
-        
+        # 模板环境在进程内共享
+        self.env = compiled_templates.env
+
         # 加载模板
         template_content = kwargs.get('template_content')
         if not template_content:
             raise ValueError("自定义数据集必须提供 Jinja2 模板内容")
             
         try:
-            # 从字符串加载模板
-            self.template = self.env.from_string(template_content)
+            # 从字符串加载模板（相同内容只编译一次）
+            self.template = compiled_templates.get_template(template_content)
             
             # 验证必需的宏是否存在
             required_macros = ['gen_prompt', 'get_gold_answer', 'match', 'parse_pred_result', 'get_config']
@@ -43,16 +79,35 @@ class CustomDatasetAdapter(DataAdapter):
             if missing_macros:
                 raise ValueError(f"模板缺少以下必需的宏：{', '.join(missing_macros)}")
             
-            # 从模板获取配置
-            config = json.loads(self.template.module.get_config())
-            self.llm_as_a_judge = config.get('llm_as_a_judge', False)
+            # 从模板获取配置（解析结果共享，只读）
+            self.template_config = compiled_templates.get_config(template_content)
+            self.llm_as_a_judge = self.template_config.get('llm_as_a_judge', False)
             kwargs['llm_as_a_judge'] = self.llm_as_a_judge
                 
         except Exception as e:
             raise ValueError(f"加载 Jinja2 模板失败：{str(e)}")
         
+        # 评审结论缓存：模板内容决定评审提示词和结论的解析方式，模板变化后旧结论自然失效。
+        # evalscope 的评审线程没有应用上下文，缓存在构造时（run_task 所在线程）获取
+        self.template_hash = template_hash(template_content)
+        self.verdict_cache = None
+        self.verdict_cache_ttl = 0
+        if has_app_context():
+            self.verdict_cache_ttl = int(current_app.config.get('JUDGE_VERDICT_CACHE_TTL_SECONDS', 0))
+            if self.verdict_cache_ttl > 0:
+                self.verdict_cache = get_cache(JUDGE_VERDICT_CACHE_NAMESPACE)
+
         super().__init__(**kwargs)
 
+    def _verdict_cache_key(self, judge: LLMJudge, judge_inputs: dict) -> str:
+        payload = {
+            'judge_model': getattr(judge, 'model_id', ''),
+            'judge_api_url': getattr(judge, 'api_url', ''),
+            'template_hash': self.template_hash,
+            'inputs': judge_inputs,
+        }
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
     def load(self, dataset_name_or_path: str = None, subset_list: list = None, **kwargs) -> dict:
         dataset_name_or_path = dataset_name_or_path or self.dataset_id
         subset_list = subset_list or self.subset_list
@@ -128,9 +183,8 @@ class CustomDatasetAdapter(DataAdapter):
                 history = raw_input.get('history', []) if raw_input else []
                 question_keys = ['question', 'prompt', 'query', 'user']
                 question = next((raw_input.get(key) for key in question_keys if raw_input and raw_input.get(key)), '')
-                config = json.loads(self.template.module.get_config())
-                judge_system_prompt = config.get('judge_system_prompt', '')
-                judge_prompt_template = config.get('judge_prompt', '')
+                judge_system_prompt = self.template_config.get('judge_system_prompt', '')
+                judge_prompt_template = self.template_config.get('judge_prompt', '')
                 
                 # 动态检测模板中使用的占位符
                 format_params = {}
@@ -144,11 +198,22 @@ class CustomDatasetAdapter(DataAdapter):
                     format_params['system_prompt'] = system_prompt or ''
                 if '{history}' in judge_prompt_template:
                     format_params['history'] = '\n'.join(history) if history else ''
-                
+
+                # 结论只取决于评审提示词中实际用到的字段，先查评审结论缓存
+                cache_key = None
+                if self.verdict_cache is not None:
+                    cache_key = self._verdict_cache_key(judge, format_params)
+                    cached_verdict = self.verdict_cache.get(cache_key)
+                    if cached_verdict is not None:
+                        return cached_verdict
+
                 judge_prompt = judge_prompt_template.format(**format_params)
-                judge_response = judge(judge_prompt, judge_system_prompt)
-                result = self.template.module.llm_match(judge_response)
-                return json.loads(result)
+                judge_response = call_judge(judge, judge_prompt, judge_system_prompt)
+                verdict = json.loads(self.template.module.llm_match(judge_response))
+                # 评审调用失败（返回空）时的结论不缓存
+                if cache_key and judge_response:
+                    self.verdict_cache.set(cache_key, verdict, ttl=self.verdict_cache_ttl)
+                return verdict
             else:
                 return super().llm_match(gold, pred, judge, **kwargs)
         except Exception as e:
@@ -181,6 +246,8 @@ class CustomDatasetAdapter(DataAdapter):
         """
         try:
             self.template = self.env.get_template(template_name)
+            if hasattr(self.template.module, 'get_config'):
+                self.template_config = json.loads(self.template.module.get_config())
         except Exception as e:
             raise ValueError(f"加载模板 {template_name} 失败：{str(e)}")
 
@@ -201,16 +268,11 @@ def register_custom_dataset_benchmark(dataset_id: int):
     template_content = dataset.jinja2_template
     if template_content:
         try:
-            # 创建临时环境来解析配置
-            temp_env = Environment()
-            temp_env.filters['from_json'] = lambda x: json.loads(x) if isinstance(x, str) else x
-            temp_env.filters['to_json'] = lambda x: json.dumps(x, ensure_ascii=False)
-            temp_env.filters['regex_search'] = lambda text, pattern: re.search(pattern, text).group(0) if re.search(pattern, text) else None
-
-            temp_template = temp_env.from_string(template_content)
-            if hasattr(temp_template.module, 'get_config'):
-                config = json.loads(temp_template.module.get_config())
-                metric_list = config.get('metric_list', ['AverageAccuracy'])
+            # 与适配器共用已编译的模板和解析好的配置
+            template = compiled_templates.get_template(template_content)
+            if hasattr(template.module, 'get_config'):
+                config = compiled_templates.get_config(template_content)
+                metric_list = list(config.get('metric_list', ['AverageAccuracy']))
         except Exception as e:
             print(f"警告：无法从模板中读取配置，使用默认 metric_list: {e}")
     
@@ -56,6 +56,8 @@ class Config:
 
     SYSTEM_PROVIDER_API_KEY = os.environ.get('SYSTEM_PROVIDER_API_KEY')
     SYSTEM_PROVIDER_BASE_URL = os.environ.get('SYSTEM_PROVIDER_BASE_URL')
+    # 后台同步系统模型的间隔（秒），0 表示不启动后台同步
+    SYSTEM_MODELS_REFRESH_SECONDS = int(os.environ.get('SYSTEM_MODELS_REFRESH_SECONDS', 600))
     
     # 文件上传配置 - 使用动态路径获取
     DATA_UPLOADS_DIR = get_uploads_dir()
@@ -64,6 +66,53 @@ class Config:
     # 文件大小限制配置
     DATASET_MAX_FILE_SIZE = int(os.environ.get('DATASET_MAX_FILE_SIZE', 50 * 1024 * 1024))  # 50MB
 
+    # 评估任务执行方式：inline（Web进程内的 worker 线程执行队列任务）或 queue（由独立的 worker.py 执行）
+    EVAL_JOB_MODE = os.environ.get('EVAL_JOB_MODE', 'inline')
+    EVAL_JOB_LEASE_SECONDS = int(os.environ.get('EVAL_JOB_LEASE_SECONDS', 90))
+    EVAL_JOB_MAX_ATTEMPTS = int(os.environ.get('EVAL_JOB_MAX_ATTEMPTS', 3))
+    EVAL_WORKER_CONCURRENCY = int(os.environ.get('EVAL_WORKER_CONCURRENCY', 2))
+    # 跨进程共享缓存：sqlite（默认，本机多进程共享）或 redis（需安装 redis 包）
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH') or os.path.join(get_outputs_dir(), '.cache', 'shared_cache.sqlite3')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 100000))
+    # 评估结果导出为 xlsx 的行数上限：xlsx 要全部写完才开始输出，未指定格式且超过上限时改为导出 csv
+    EXPORT_XLSX_MAX_ROWS = int(os.environ.get('EXPORT_XLSX_MAX_ROWS', 20000))
+
+    # 出站 HTTP 连接池：单主机并发连接上限、连接池满时最长等待时间（秒）、空闲回收时间（秒）、最多保留的客户端数
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+    HTTP_POOL_TIMEOUT_SECONDS = int(os.environ.get('HTTP_POOL_TIMEOUT_SECONDS', 30))
+    HTTP_POOL_IDLE_SECONDS = int(os.environ.get('HTTP_POOL_IDLE_SECONDS', 300))
+    HTTP_MAX_CLIENTS = int(os.environ.get('HTTP_MAX_CLIENTS', 64))
+    # 数据集模板中 http.request 对单个主机的每秒请求数上限（每个进程分别计算），0 表示不限制
+    HTTP_HOST_RATE_LIMIT = float(os.environ.get('HTTP_HOST_RATE_LIMIT', 10))
+
+    # RAG 数据集上传后的后台补全：并发线程数、单行补全失败后的重试次数与首次重试等待（秒，之后按次数翻倍）
+    RAG_ENRICH_CONCURRENCY = int(os.environ.get('RAG_ENRICH_CONCURRENCY', 8))
+    RAG_ENRICH_MAX_RETRIES = int(os.environ.get('RAG_ENRICH_MAX_RETRIES', 2))
+    RAG_ENRICH_RETRY_BACKOFF_SECONDS = float(os.environ.get('RAG_ENRICH_RETRY_BACKOFF_SECONDS', 1.0))
+
+    # 对话历史窗口：单个模型的历史 token 预算（可被会话中的模型配置覆盖）、最多回溯的消息数、
+    # 是否去掉历史助手消息中的 <think> 推理过程
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', 8000))
+    CHAT_HISTORY_MAX_MESSAGES = int(os.environ.get('CHAT_HISTORY_MAX_MESSAGES', 50))
+    CHAT_HISTORY_STRIP_REASONING = os.environ.get('CHAT_HISTORY_STRIP_REASONING', 'true').lower() == 'true'
+
+    # 确定性模型调用（temperature 为 0 或指定 seed）的回复缓存，默认关闭；容量按字节数 LRU 淘汰
+    COMPLETION_CACHE_ENABLED = os.environ.get('COMPLETION_CACHE_ENABLED', 'false').lower() == 'true'
+    COMPLETION_CACHE_PATH = os.environ.get('COMPLETION_CACHE_PATH') or os.path.join(get_outputs_dir(), '.cache', 'completion_cache.sqlite3')
+    COMPLETION_CACHE_MAX_BYTES = int(os.environ.get('COMPLETION_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    # 评审模型的 temperature，未设置时使用服务端默认值；设为 0 后评审调用可以使用回复缓存
+    EVAL_JUDGE_TEMPERATURE = float(os.environ['EVAL_JUDGE_TEMPERATURE']) if os.environ.get('EVAL_JUDGE_TEMPERATURE') else None
+
+    # 自定义数据集评审结论缓存的有效期（秒），0 表示不缓存
+    JUDGE_VERDICT_CACHE_TTL_SECONDS = int(os.environ.get('JUDGE_VERDICT_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+    # 准入控制：运行中评估任务数上限（全局 / 单用户 / 单模型端点），0 表示不限制
+    EVAL_MAX_RUNNING_JOBS = int(os.environ.get('EVAL_MAX_RUNNING_JOBS', 8))
+    EVAL_MAX_JOBS_PER_USER = int(os.environ.get('EVAL_MAX_JOBS_PER_USER', 2))
+    EVAL_MAX_JOBS_PER_ENDPOINT = int(os.environ.get('EVAL_MAX_JOBS_PER_ENDPOINT', 2))
+
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
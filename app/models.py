@@ -88,6 +88,8 @@ class ChatMessage(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=get_beijing_time)
     settings_snapshot = db.Column(db.JSON, nullable=True) 
+    # 作为历史消息发送时的 token 数（助手消息不含推理过程），用于按预算截取对话历史
+    token_count = db.Column(db.Integer, nullable=True)
 
     session = db.relationship('ChatSession', back_populates='messages')
     model = db.relationship('AIModel', back_populates='chat_messages')
@@ -128,6 +130,12 @@ class Dataset(db.Model):
     format = db.Column(db.String(50), nullable=False, default='QA', server_default='QA')
     jinja2_template = db.Column(LONGTEXT, nullable=True)  # 修改为存储模板内容
     is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    # RAG 数据集上传后由后台任务调用模板补全字段：pending / running / completed / failed，无需补全时为空；
+    # 补全期间 is_active 为 False，完成后自动启用
+    enrich_status = db.Column(db.String(20), nullable=True)
+    enrich_total = db.Column(db.Integer, nullable=True)
+    enrich_completed = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    enrich_error = db.Column(db.Text, nullable=True)
     
     # 多对多关系到 DatasetCategory
     categories = db.relationship("DatasetCategory", 
@@ -161,6 +169,9 @@ class ModelEvaluation(db.Model):
     completed_at = db.Column(db.DateTime, nullable=True)
     result_summary = db.Column(db.JSON, nullable=True)
     limit = db.Column(db.Integer, nullable=True)
+    # 进度：总 prompt 数在任务开始时计算一次，已完成数随 review 文件增量入库更新
+    total_prompts = db.Column(db.Integer, nullable=True)
+    completed_prompts = db.Column(db.Integer, nullable=False, default=0)
     user = db.relationship('User', back_populates='evaluation_effectiveness')
     model = db.relationship('AIModel', foreign_keys=[model_id], back_populates='evaluations')
     judge_model = db.relationship('AIModel', foreign_keys=[judge_model_id], back_populates='judge_evaluations')
@@ -276,6 +287,8 @@ class ModelEvaluationResult(db.Model):
     model_answer = db.Column(db.Text, nullable=False)
     score = db.Column(db.Float, nullable=True)
     feedback = db.Column(db.Text, nullable=True)
+    # 入库时用数据集adapter格式化好的完整用户提示，结果页与导出直接使用
+    user_prompt = db.Column(db.Text, nullable=True)
     
     evaluation = db.relationship('ModelEvaluation', back_populates='evaluation_results')
     dataset = db.relationship('Dataset', backref=db.backref('evaluation_results', lazy='dynamic'))  # 添加与Dataset的关系
@@ -314,6 +327,12 @@ class PerformanceEvalTask(db.Model):
     batch_config = db.Column(db.Text, nullable=True)  # 批量测试配置（JSON格式）
     batch_results = db.Column(db.Text, nullable=True)  # 批量测试结果（JSON格式）
 
+    # 最新一次滑动窗口指标快照的序号（JSON格式，{"seq": n}），快照本身逐条写入 PerfTelemetrySnapshot
+    live_metrics = db.Column(db.JSON, nullable=True)
+
+    # 延迟与token数分布的可合并草图（二进制，见 app/services/perf_sketch.py），用于按需计算任意分位数
+    metric_sketches = db.Column(db.LargeBinary(length=(2 ** 24) - 1), nullable=True)
+
     # 关联到用户
     user = db.relationship('User', backref=db.backref('model_efficiency', lazy='dynamic'))
 
@@ -357,6 +376,122 @@ class PerformanceEvalTask(db.Model):
         import json
         self.batch_results = json.dumps(results, ensure_ascii=False)
 
+class PerformanceEvalResult(db.Model):
+    """性能评估结构化结果：每个任务（批量任务按测试配置）一行，指标为带索引的数值列，便于SQL筛选与排行"""
+    __tablename__ = 'model_efficiency_result'
+    __table_args__ = (
+        db.Index('ix_perf_result_model_concurrency_time', 'model_name', 'concurrency', 'completed_at'),
+        db.Index('ix_perf_result_dataset_time', 'dataset_name', 'completed_at'),
+        db.Index('ix_perf_result_user_time', 'user_id', 'completed_at'),
+        db.UniqueConstraint('task_id', 'config_index', name='uq_perf_result_task_config'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('model_efficiency.id', ondelete='CASCADE'), nullable=False, index=True)
+    config_index = db.Column(db.Integer, nullable=False, default=0)  # 单任务为0，批量任务为测试配置序号
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    model_name = db.Column(db.String(150), nullable=False)
+    dataset_name = db.Column(db.String(150), nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    # 测试配置
+    concurrency = db.Column(db.Integer, nullable=True)
+    num_requests = db.Column(db.Integer, nullable=True)
+    min_prompt_length = db.Column(db.Integer, nullable=True)
+    max_prompt_length = db.Column(db.Integer, nullable=True)
+    max_tokens = db.Column(db.Integer, nullable=True)
+    engine = db.Column(db.String(20), nullable=True)
+
+    # Metrics.* 汇总指标
+    time_taken = db.Column(db.Float, nullable=True)
+    total_requests = db.Column(db.Integer, nullable=True)
+    succeed_requests = db.Column(db.Integer, nullable=True)
+    failed_requests = db.Column(db.Integer, nullable=True)
+    output_token_throughput = db.Column(db.Float, nullable=True)
+    total_token_throughput = db.Column(db.Float, nullable=True)
+    request_throughput = db.Column(db.Float, nullable=True)
+    avg_latency = db.Column(db.Float, nullable=True)
+    avg_ttft = db.Column(db.Float, nullable=True)
+    avg_tpot = db.Column(db.Float, nullable=True)
+    avg_input_tokens = db.Column(db.Float, nullable=True)
+    avg_output_tokens = db.Column(db.Float, nullable=True)
+    avg_package_latency = db.Column(db.Float, nullable=True)
+    avg_package_per_request = db.Column(db.Float, nullable=True)
+
+    # PercentileMetrics.* 分位数（秒）
+    ttft_p50 = db.Column(db.Float, nullable=True)
+    ttft_p90 = db.Column(db.Float, nullable=True)
+    ttft_p99 = db.Column(db.Float, nullable=True)
+    itl_p50 = db.Column(db.Float, nullable=True)
+    itl_p90 = db.Column(db.Float, nullable=True)
+    itl_p99 = db.Column(db.Float, nullable=True)
+    tpot_p50 = db.Column(db.Float, nullable=True)
+    tpot_p90 = db.Column(db.Float, nullable=True)
+    tpot_p99 = db.Column(db.Float, nullable=True)
+    latency_p50 = db.Column(db.Float, nullable=True)
+    latency_p90 = db.Column(db.Float, nullable=True)
+    latency_p99 = db.Column(db.Float, nullable=True)
+
+    task = db.relationship('PerformanceEvalTask', backref=db.backref(
+        'structured_results', lazy='dynamic', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<PerformanceEvalResult task={self.task_id} config={self.config_index} model={self.model_name}>'
+
+class PerfTelemetrySnapshot(db.Model):
+    """运行中性能评估任务的滑动窗口指标快照：每次写库追加一行，每个任务只保留最近的若干条"""
+    __tablename__ = 'model_efficiency_telemetry'
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'seq', name='uq_perf_telemetry_task_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('model_efficiency.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=get_beijing_time)
+
+    task = db.relationship('PerformanceEvalTask', backref=db.backref(
+        'telemetry_snapshots', lazy='dynamic', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<PerfTelemetrySnapshot task={self.task_id} seq={self.seq}>'
+
+class EvalJob(db.Model):
+    """持久化任务队列：评估任务由独立的 worker 进程领取执行（见 app/services/job_queue.py）"""
+    __tablename__ = 'eval_job'
+    __table_args__ = (
+        db.Index('ix_eval_job_claim', 'status', 'available_at', 'priority'),
+        db.Index('ix_eval_job_target', 'job_type', 'target_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(30), nullable=False)  # model_eval / rag_eval / perf_eval / perf_batch / dataset_enrich
+    target_id = db.Column(db.Integer, nullable=False)  # 对应评估记录的ID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    payload = db.Column(db.JSON, nullable=True)  # 执行参数
+
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / succeeded / failed
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    available_at = db.Column(db.DateTime, nullable=False, default=get_beijing_time)  # 重试退避：在此之前不可领取
+
+    endpoint = db.Column(db.String(255), nullable=True)  # 被调用模型的 api_base_url，用于单端点并发上限
+    endpoints = db.Column(db.JSON, nullable=True)  # 调用的全部模型端点（多模型批量压测有多个），endpoint 为其中第一个
+
+    worker_id = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=get_beijing_time)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<EvalJob {self.id} {self.job_type}:{self.target_id} {self.status}>'
+
 def init_database_data():
     """
     初始化数据库数据
@@ -1,6 +1,8 @@
 # 数据集管理相关API
 from flask import Blueprint, request, current_app
 from app.models import Dataset
+from app.services.dataset_service import DatasetService
+from app.utils.line_index import build_line_index, get_file_kind, remove_line_index
 from app.routes.api.common import (
     api_response, api_error, api_auth_required,
     get_current_api_user, validate_json_data, paginate_query
@@ -216,6 +218,7 @@ def api_delete_dataset(dataset_id):
             import os
             try:
                 os.remove(dataset.download_url)
+                remove_line_index(dataset.download_url)
             except Exception as e:
                 current_app.logger.warning(f"删除数据集文件失败: {e}")
 
@@ -269,6 +272,7 @@ def api_get_dataset_data(dataset_id):
         # 读取数据集文件（限制预览行数）
         limit = int(request.args.get('limit', 100))
         limit = min(limit, 1000)  # 最大1000行
+        page = max(1, int(request.args.get('page', 1)))
 
         try:
             import json
@@ -278,22 +282,28 @@ def api_get_dataset_data(dataset_id):
             if not file_path or not os.path.exists(file_path):
                 return api_error('数据集文件不存在', 404)
 
-            data_preview = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for i, line in enumerate(f):
-                    if i >= limit:
-                        break
-                    try:
-                        data_preview.append(json.loads(line.strip()))
-                    except json.JSONDecodeError:
-                        continue
+            if get_file_kind(file_path):
+                # JSONL / CSV 通过行偏移索引直接读取目标页
+                data_preview, total_records = DatasetService._load_local_dataset(file_path, page, limit)
+            else:
+                data_preview = []
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for i, line in enumerate(f):
+                        if i >= limit:
+                            break
+                        try:
+                            data_preview.append(json.loads(line.strip()))
+                        except json.JSONDecodeError:
+                            continue
+                total_records = len(data_preview)  # 无索引的文件只统计预览数据
 
             return api_response(
                 success=True,
                 data={
                     'preview': data_preview,
                     'total_shown': len(data_preview),
-                    'total_records': len(data_preview),  # 暂时使用预览数据长度
+                    'total_records': total_records,
+                    'page': page,
                     'limit': limit
                 }
             )
@@ -369,6 +379,10 @@ def api_upload_dataset():
                         except json.JSONDecodeError:
                             continue
 
+            # 建立行偏移索引，供分页预览使用
+            if get_file_kind(file_path):
+                build_line_index(file_path)
+
             # 创建数据集记录
             dataset = Dataset(
                 name=name,
@@ -405,6 +419,7 @@ def api_upload_dataset():
             # 如果处理失败，删除已上传的文件
             try:
                 os.remove(file_path)
+                remove_line_index(file_path)
             except:
                 pass
             raise e
@@ -5,6 +5,7 @@ from app.routes.api.common import (
     api_response, api_error, api_auth_required, 
     get_current_api_user, validate_json_data, paginate_query
 )
+from app.services.job_queue import get_queue_info, JOB_MODEL_EVAL
 
 bp = Blueprint('eval_api', __name__, url_prefix='/evaluations')
 
@@ -194,7 +195,8 @@ def api_get_evaluation(evaluation_id):
             'error_message': evaluation.error_message,
             'created_at': evaluation.created_at.isoformat() if evaluation.created_at else None,
             'updated_at': evaluation.updated_at.isoformat() if evaluation.updated_at else None,
-            'completed_at': evaluation.completed_at.isoformat() if evaluation.completed_at else None
+            'completed_at': evaluation.completed_at.isoformat() if evaluation.completed_at else None,
+            'queue': get_queue_info(JOB_MODEL_EVAL, evaluation.id)
         }
         
         return api_response(success=True, data=eval_data)
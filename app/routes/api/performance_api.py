@@ -1,10 +1,13 @@
 # 性能评估相关API
 from flask import Blueprint, request, current_app
-from app.models import PerformanceEvalTask, AIModel, Dataset
+from app.models import PerformanceEvalTask, PerformanceEvalResult, AIModel, Dataset
 from app.routes.api.common import (
     api_response, api_error, api_auth_required, get_current_api_user, validate_json_data
 )
-from app.services.perf_service import PerformanceEvaluationService, BatchPerformanceEvaluationService
+from app.services.perf_service import PerformanceEvaluationService, BatchPerformanceEvaluationService, RANKING_METRICS
+from app.services.perf_engine import validate_engine_options
+from app.services.perf_sketch import parse_quantiles
+from app.services.job_queue import dispatch_job, get_queue_info, JOB_PERF_EVAL, JOB_PERF_BATCH, PRIORITY_CLASSES
 from app import db
 from app.utils import get_beijing_time
 from sqlalchemy import and_, or_
@@ -94,7 +97,11 @@ def api_get_performance_task(task_id):
             'status': task.status,
             'created_at': task.created_at.isoformat() if task.created_at else None,
             'completed_at': task.completed_at.isoformat() if task.completed_at else None,
-            'results': task.results if hasattr(task, 'results') else None
+            'queue': get_queue_info(JOB_PERF_BATCH if task.is_batch_task() else JOB_PERF_EVAL, task.id),
+            'results': [
+                PerformanceEvaluationService.result_to_dict(row)
+                for row in task.structured_results.order_by(PerformanceEvalResult.config_index)
+            ]
         }
         
         return api_response(success=True, data=task_dict)
@@ -103,6 +110,146 @@ def api_get_performance_task(task_id):
         current_app.logger.error(f"获取性能评估任务详情API错误: {e}")
         return api_error('获取任务详情失败', 500)
 
+@bp.route('/tasks/<int:task_id>/telemetry', methods=['GET'])
+@api_auth_required
+def api_get_performance_task_telemetry(task_id):
+    """获取运行中性能评估任务的实时滑动窗口指标（增量轮询，since为上次收到的最大seq）"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+        
+        task = PerformanceEvaluationService.get_task_by_id(task_id, user_id=user.id)
+        if not task:
+            return api_error('任务不存在或无权限访问', 404)
+        
+        since = request.args.get('since', 0, type=int)
+        live_metrics = task.live_metrics or {}
+        
+        return api_response(
+            success=True,
+            data={
+                'task_id': task.id,
+                'status': task.status,
+                'seq': live_metrics.get('seq', 0),
+                'snapshots': PerformanceEvaluationService.get_telemetry_snapshots(task.id, since)
+            }
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"获取性能评估实时指标API错误: {e}")
+        return api_error('获取实时指标失败', 500)
+
+@bp.route('/tasks/<int:task_id>/quantiles', methods=['GET'])
+@api_auth_required
+def api_get_performance_task_quantiles(task_id):
+    """按需计算任务的任意分位数（q=0.5,0.99,0.999 或 p50,p99.9；metrics=ttft,latency）"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+        
+        task = PerformanceEvaluationService.get_task_by_id(task_id, user_id=user.id)
+        if not task:
+            return api_error('任务不存在或无权限访问', 404)
+        
+        try:
+            quantiles = parse_quantiles(request.args.get('q'))
+        except ValueError as e:
+            return api_error(f'分位数参数错误: {e}', 400)
+        fields = [f for f in request.args.get('metrics', '').split(',') if f.strip()] or None
+        
+        result = PerformanceEvaluationService.get_task_quantiles(task, quantiles, fields)
+        if result is None:
+            return api_error('该任务没有保存指标分布数据', 404)
+        
+        return api_response(success=True, data={'task_id': task.id, 'quantiles': result})
+        
+    except Exception as e:
+        current_app.logger.error(f"获取性能评估分位数API错误: {e}")
+        return api_error('获取分位数失败', 500)
+
+@bp.route('/tasks/compare', methods=['GET'])
+@api_auth_required
+def api_compare_performance_tasks():
+    """对比多个任务的分位数（task_ids=1,2,3），merge=true 时返回合并后的整体分布"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+        
+        try:
+            task_ids = [int(t) for t in request.args.get('task_ids', '').split(',') if t.strip()]
+            quantiles = parse_quantiles(request.args.get('q'))
+        except ValueError as e:
+            return api_error(f'参数错误: {e}', 400)
+        if not task_ids:
+            return api_error('task_ids 不能为空', 400)
+        fields = [f for f in request.args.get('metrics', '').split(',') if f.strip()] or None
+        
+        tasks = PerformanceEvalTask.query.filter(
+            PerformanceEvalTask.id.in_(task_ids),
+            PerformanceEvalTask.user_id == user.id
+        ).all()
+        if len(tasks) != len(set(task_ids)):
+            return api_error('部分任务不存在或无权限访问', 404)
+        
+        merge = request.args.get('merge', 'false').lower() in ('1', 'true', 'yes')
+        result = PerformanceEvaluationService.compare_task_quantiles(tasks, quantiles, fields, merge=merge)
+        
+        return api_response(success=True, data=result)
+        
+    except Exception as e:
+        current_app.logger.error(f"对比性能评估任务API错误: {e}")
+        return api_error('对比任务失败', 500)
+
+@bp.route('/rankings', methods=['GET'])
+@api_auth_required
+def api_get_performance_rankings():
+    """按模型排行某项指标的最优值（metric、concurrency、dataset、days、limit）"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+        
+        metric = request.args.get('metric', 'output_token_throughput')
+        if metric not in RANKING_METRICS:
+            return api_error(f"不支持的排行指标，可选: {', '.join(RANKING_METRICS)}", 400)
+        
+        rankings = PerformanceEvaluationService.get_rankings(
+            user_id=user.id,
+            metric=metric,
+            concurrency=request.args.get('concurrency', type=int),
+            dataset_name=request.args.get('dataset', '').strip() or None,
+            days=request.args.get('days', 30, type=int),
+            limit=min(request.args.get('limit', 20, type=int), 100)
+        )
+        
+        return api_response(success=True, data={'metric': metric, 'rankings': rankings})
+        
+    except Exception as e:
+        current_app.logger.error(f"获取性能排行API错误: {e}")
+        return api_error('获取性能排行失败', 500)
+
+@bp.route('/tasks/<int:task_id>/abort', methods=['POST'])
+@api_auth_required
+def api_abort_performance_task(task_id):
+    """中止运行中的性能评估任务"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+        
+        success = PerformanceEvaluationService.request_abort(task_id, user_id=user.id)
+        if success:
+            return api_response(success=True, message='已请求中止任务')
+        else:
+            return api_error('任务不存在或当前状态无法中止', 400)
+        
+    except Exception as e:
+        current_app.logger.error(f"中止性能评估任务API错误: {e}")
+        return api_error('中止任务失败', 500)
+
 @bp.route('/tasks', methods=['POST'])
 @api_auth_required
 @validate_json_data(['model_id', 'dataset_id', 'concurrency', 'num_requests'])
@@ -147,6 +294,17 @@ def api_create_performance_task():
             if not dataset:
                 return api_error('数据集未找到或无权限使用', 404)
         
+        # 验证压测引擎与到达速率（可选）
+        if data.get('priority') is not None and data['priority'] not in PRIORITY_CLASSES:
+            return api_error(f"不支持的优先级: {data['priority']}", 400)
+        if data.get('rate') is not None and (not isinstance(data['rate'], (int, float)) or data['rate'] <= 0):
+            return api_error('rate 必须是大于0的数字', 400)
+        if data.get('num_workers') is not None and (not isinstance(data['num_workers'], int) or data['num_workers'] < 1):
+            return api_error('num_workers 必须是大于0的整数', 400)
+        engine_error = validate_engine_options(data.get('engine'), data.get('num_workers'))
+        if engine_error:
+            return api_error(engine_error, 400)
+        
         # 创建性能评估任务
         task = PerformanceEvaluationService.create_performance_eval_task(
             model_id=data['model_id'],
@@ -161,17 +319,19 @@ def api_create_performance_task():
         
         # 启动评估任务
         try:
-            PerformanceEvaluationService.run_performance_evaluation(
-                task.id,
-                data['model_id'],
-                data['dataset_id'],
-                data['concurrency'],
-                data['num_requests'],
-                min_prompt_length=data.get('min_prompt_length'),
-                max_prompt_length=data.get('max_prompt_length'),
-                max_tokens=data.get('max_tokens'),
-                extra_args=data.get('extra_args')
-            )
+            dispatch_job(JOB_PERF_EVAL, task.id, user_id=user.id, payload={
+                'model_id': data['model_id'],
+                'dataset_id': data['dataset_id'],
+                'concurrency': data['concurrency'],
+                'num_requests': data['num_requests'],
+                'min_prompt_length': data.get('min_prompt_length'),
+                'max_prompt_length': data.get('max_prompt_length'),
+                'max_tokens': data.get('max_tokens'),
+                'extra_args': data.get('extra_args'),
+                'engine': data.get('engine'),
+                'rate': data.get('rate'),
+                'num_workers': data.get('num_workers'),
+            }, priority=data.get('priority'))
         except Exception as e:
             current_app.logger.error(f"启动性能评估任务失败: {e}")
             # 如果启动失败，更新任务状态
@@ -369,6 +529,20 @@ def api_create_batch_performance_task():
         if not model:
             return api_error('模型未找到或无权限使用', 404)
 
+        # 额外参与对比的模型（可选），不同端点可并发执行
+        extra_model_ids = data.get('model_ids') or []
+        if not isinstance(extra_model_ids, list):
+            return api_error('model_ids 必须是数组', 400)
+        if extra_model_ids:
+            accessible_count = AIModel.query.filter(
+                AIModel.id.in_(extra_model_ids),
+                (AIModel.is_system_model == True) | (AIModel.user_id == user.id)
+            ).count()
+            if accessible_count != len(set(extra_model_ids)):
+                return api_error('部分模型未找到或无权限使用', 404)
+        if data.get('priority') is not None and data['priority'] not in PRIORITY_CLASSES:
+            return api_error(f"不支持的优先级: {data['priority']}", 400)
+
         # 验证数据集权限（-1表示使用内置openqa数据集）
         if data['dataset_id'] != -1:
             dataset = Dataset.query.filter(
@@ -407,6 +581,10 @@ def api_create_batch_performance_task():
                 if field not in config:
                     return api_error(f'第{i+1}个测试配置缺少必要字段: {field}', 400)
 
+            engine_error = validate_engine_options(config.get('engine'), config.get('num_workers'))
+            if engine_error:
+                return api_error(f'第{i+1}个测试配置无效: {engine_error}', 400)
+
         # 创建批量性能评估任务
         task = BatchPerformanceEvaluationService.create_batch_performance_eval_task(
             user_id=user.id,
@@ -414,7 +592,10 @@ def api_create_batch_performance_task():
             dataset_id=data['dataset_id'],
             test_configurations=test_configurations,
             name=data.get('name'),
-            description=data.get('description')
+            description=data.get('description'),
+            extra_model_ids=data.get('model_ids'),
+            parallel_endpoints=bool(data.get('parallel_endpoints', False)),
+            config_timeout_seconds=data.get('config_timeout_seconds')
         )
 
         if not task:
@@ -422,11 +603,10 @@ def api_create_batch_performance_task():
 
         # 启动批量评估任务
         try:
-            BatchPerformanceEvaluationService.run_batch_performance_evaluation(
-                task.id,
-                data['model_id'],
-                data['dataset_id']
-            )
+            dispatch_job(JOB_PERF_BATCH, task.id, user_id=user.id, payload={
+                'model_id': data['model_id'],
+                'dataset_id': data['dataset_id'],
+            }, priority=data.get('priority'))
         except Exception as e:
             current_app.logger.error(f"启动批量性能评估任务失败: {e}")
             # 如果启动失败，更新任务状态
@@ -477,6 +657,20 @@ def api_create_batch_task_from_script():
         if not model:
             return api_error('模型未找到或无权限使用', 404)
 
+        # 额外参与对比的模型（可选），不同端点可并发执行
+        extra_model_ids = data.get('model_ids') or []
+        if not isinstance(extra_model_ids, list):
+            return api_error('model_ids 必须是数组', 400)
+        if extra_model_ids:
+            accessible_count = AIModel.query.filter(
+                AIModel.id.in_(extra_model_ids),
+                (AIModel.is_system_model == True) | (AIModel.user_id == user.id)
+            ).count()
+            if accessible_count != len(set(extra_model_ids)):
+                return api_error('部分模型未找到或无权限使用', 404)
+        if data.get('priority') is not None and data['priority'] not in PRIORITY_CLASSES:
+            return api_error(f"不支持的优先级: {data['priority']}", 400)
+
         # 验证数据集权限
         if data['dataset_id'] != -1:
             dataset = Dataset.query.filter(
@@ -535,7 +729,10 @@ def api_create_batch_task_from_script():
             dataset_id=data['dataset_id'],
             test_configurations=test_configurations,
             name=task_name,
-            description=data.get('description', f'基于脚本样式参数的批量压测，共{len(test_configurations)}个测试配置')
+            description=data.get('description', f'基于脚本样式参数的批量压测，共{len(test_configurations)}个测试配置'),
+            extra_model_ids=data.get('model_ids'),
+            parallel_endpoints=bool(data.get('parallel_endpoints', False)),
+            config_timeout_seconds=data.get('config_timeout_seconds')
         )
 
         if not task:
@@ -543,11 +740,10 @@ def api_create_batch_task_from_script():
 
         # 启动批量评估任务
         try:
-            BatchPerformanceEvaluationService.run_batch_performance_evaluation(
-                task.id,
-                data['model_id'],
-                data['dataset_id']
-            )
+            dispatch_job(JOB_PERF_BATCH, task.id, user_id=user.id, payload={
+                'model_id': data['model_id'],
+                'dataset_id': data['dataset_id'],
+            }, priority=data.get('priority'))
         except Exception as e:
             current_app.logger.error(f"启动批量性能评估任务失败: {e}")
             task.status = 'failed'
@@ -576,3 +772,22 @@ def api_create_batch_task_from_script():
     except Exception as e:
         current_app.logger.error(f"从脚本创建批量性能评估任务API错误: {e}")
         return api_error('创建批量任务失败', 500)
+
+@bp.route('/batch-tasks/<int:task_id>/resume', methods=['POST'])
+@api_auth_required
+def api_resume_batch_performance_task(task_id):
+    """从最后完成的测试配置之后继续执行批量任务"""
+    try:
+        user = get_current_api_user()
+        if not user:
+            return api_error('用户未找到', 404)
+
+        resumed, message = BatchPerformanceEvaluationService.resume_batch_performance_evaluation(task_id, user.id)
+        if not resumed:
+            return api_error(message, 400)
+
+        return api_response(success=True, data={'task_id': task_id}, message=message)
+
+    except Exception as e:
+        current_app.logger.error(f"续跑批量性能评估任务API错误: {e}")
+        return api_error('续跑批量任务失败', 500)
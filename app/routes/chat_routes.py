@@ -1,10 +1,17 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, current_app, session as flask_session
 from flask_login import login_required, current_user
 from app import db
-from app.models import AIModel, ChatSession, ChatMessage
+from app.models import AIModel, ChatSession
 from app.services import chat_service, model_service
+from app.utils import get_beijing_time
 import json # For SSE data formatting
-from datetime import datetime
+import queue
+import threading
+
+# 合并队列中的消息类型：正常响应块、生成器结束、读取时抛出异常
+_STREAM_CHUNK = 'chunk'
+_STREAM_END = 'end'
+_STREAM_ERROR = 'error'
 
 bp = Blueprint('chat', __name__, url_prefix='/chat')
 
@@ -75,6 +82,23 @@ def view_chat_session(session_id):
                            saved_configs=saved_configs,
                            title=f"对话: {session.session_name}")
 
+def _pump_model_stream(model_id, generator, merge_queue, stop_event):
+    """在独立线程中读取一个模型的流式生成器，把每个响应块立即放入合并队列"""
+    try:
+        for chunk_data in generator:
+            if stop_event.is_set():
+                break
+            merge_queue.put((model_id, _STREAM_CHUNK, chunk_data))
+            if chunk_data.get("is_final_chunk"):
+                break
+        else:
+            merge_queue.put((model_id, _STREAM_END, None))
+    except Exception as e:
+        merge_queue.put((model_id, _STREAM_ERROR, e))
+    finally:
+        # 关闭生成器以释放底层 HTTP 流
+        generator.close()
+
 @bp.route('/session/<int:session_id>/send', methods=['POST'])
 @login_required
 def send_message(session_id):
@@ -115,27 +139,21 @@ def send_message(session_id):
         if not has_access:
             return jsonify({"error": f"您无权访问模型 (ID: {model_id})。"}), 403
 
-    # 保存模型配置到会话
-    save_success = chat_service.save_session_model_configs(session_id, model_configs)
-    if not save_success:
-        current_app.logger.warning(f"保存会话 {session_id} 模型配置失败，但继续处理消息")
-
-    # 1. 保存用户消息
-    user_chat_message = chat_service.add_message_to_session(session_id, model_id=None, role='user', content=user_message_content)
-    if not user_chat_message:
-        return jsonify({"error": "保存用户消息失败。"}), 500
-
-    # 2. 准备对话历史
-    db_messages_history = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp.desc()).limit(20).all()
-    api_call_history = []
-    for msg in reversed(db_messages_history):
-        if msg.role in ['user', 'assistant']:
-            api_call_history.append({"role": msg.role, "content": msg.content})
+    # 1. 按每个模型的 token 预算准备对话历史（用户消息与模型回复在本轮结束后一并保存）
+    sent_at = get_beijing_time()
+    history_candidates = chat_service.load_history_candidates(session_id)
+    model_histories = {}
+    for model_config in model_configs:
+        token_budget = model_config.get('history_token_budget') or current_app.config['CHAT_HISTORY_TOKEN_BUDGET']
+        strip_reasoning = model_config.get('strip_reasoning', current_app.config['CHAT_HISTORY_STRIP_REASONING'])
+        model_histories[model_config.get('id')] = chat_service.build_history_window(
+            history_candidates, user_message_content, int(token_budget), strip_reasoning_content=bool(strip_reasoning)
+        )
 
     # 获取应用实例，用于后续的上下文管理
     _app = current_app._get_current_object()
 
-    # 3. 使用SSE流式返回多个模型的响应
+    # 2. 使用SSE流式返回多个模型的响应
     def generate_sse_stream():
         # 为每个模型创建一个响应生成器
         model_generators = {}
@@ -148,7 +166,7 @@ def send_message(session_id):
                 # 创建每个模型的流式响应生成器
                 model_generator = chat_service.call_openai_compatible_api(
                     model_id, 
-                    api_call_history,
+                    model_histories[model_id],
                     system_prompt=model_config.get('system_prompt'),
                     temperature=model_config.get('temperature'),
                     stream=True
@@ -159,188 +177,161 @@ def send_message(session_id):
                     'accumulated_content': [],
                     'error': None,
                     'settings_snapshot': None,
-                    'is_done': False,
-                    'last_processed': 0  # 添加时间戳，跟踪上次处理时间
+                    'is_done': False
                 }
 
+        # 每个模型一个读取线程，把响应块放入同一个合并队列；
+        # 主循环按到达顺序立即转发，慢模型不会阻塞其他模型的输出
+        merge_queue = queue.Queue()
+        stop_event = threading.Event()
+        for model_id, model_data in model_generators.items():
+            threading.Thread(
+                target=_pump_model_stream,
+                args=(model_id, model_data['generator'], merge_queue, stop_event),
+                name=f'chat-stream-{session_id}-{model_id}',
+                daemon=True
+            ).start()
+
+        def save_chat_turn():
+            """用户消息、各模型回复和模型配置在一个事务中写入"""
+            replies = []
+            for model_id, model_data in model_generators.items():
+                if model_data['error']:
+                    # 保存错误信息
+                    error_details = f"模型API错误: {model_data['error'].get('details', model_data['error'].get('error'))}"
+                    replies.append({'model_id': model_id, 'role': 'system', 'content': error_details,
+                                    'settings_snapshot': model_data['settings_snapshot']})
+                    continue
+                # 优先使用final_content（包含推理格式），否则使用accumulated_content
+                full_assistant_response = model_data.get('final_content') or "".join(model_data['accumulated_content'])
+                if full_assistant_response:
+                    replies.append({'model_id': model_id, 'role': 'assistant', 'content': full_assistant_response,
+                                    'settings_snapshot': model_data['settings_snapshot']})
+            with _app.app_context():
+                if chat_service.save_chat_turn(session_id, user_message_content, replies,
+                                               model_configs=model_configs, sent_at=sent_at):
+                    _app.logger.info(f"已保存会话 {session_id} 的本轮对话，模型回复 {len(replies)} 条")
+
         # 跟踪已完成的模型数量
         completed_models = 0
         total_models = len(model_generators)
-        current_time = datetime.now().timestamp()
-
-        # 更新所有模型的初始处理时间
-        for model_data in model_generators.values():
-            model_data['last_processed'] = current_time
 
-        # 轮询所有模型的生成器，直到所有模型都完成
-        while completed_models < total_models:
-            current_time = datetime.now().timestamp()
-            processed_any = False
-            
-            # 按上次处理时间排序，优先处理等待时间最长的模型
-            sorted_models = sorted(
-                model_generators.items(), 
-                key=lambda x: x[1]['last_processed']
-            )
-            
-            for model_id, model_data in sorted_models:
+        try:
+            while completed_models < total_models:
+                model_id, kind, chunk_data = merge_queue.get()
+                model_data = model_generators[model_id]
                 if model_data['is_done']:
-                    continue  # 跳过已完成的模型
-
-                try:
-                    # 尝试获取下一个响应块，设置较短的超时时间避免一个模型阻塞其他模型
-                    chunk_data = next(model_data['generator'])
-                    processed_any = True
-                    model_data['last_processed'] = current_time
-                    
-                    # 添加模型标识到响应中
-                    chunk_data['model_id'] = model_id
-                    chunk_data['model_name'] = model_data['name']
-                    
-                    if chunk_data.get("error"):
-                        model_data['error'] = chunk_data
-                        model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
-                        model_data['is_done'] = True
-                        completed_models += 1
-                        
-                        # 发送错误事件
-                        sse_event = {
-                            "model_id": model_id,
-                            "model_name": model_data['name'],
-                            "error": chunk_data.get("error"),
-                            "details": chunk_data.get("details"),
-                            "settings_snapshot": chunk_data.get("settings_snapshot")
-                        }
-                        yield f"data: {json.dumps(sse_event)}\n\n"
-                    
-                    elif chunk_data.get("is_final_chunk"):
-                        model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
-                        model_data['is_done'] = True
-                        completed_models += 1
-                        
-                        # 优先使用chat_service返回的full_content（可能包含推理格式）
-                        final_full_content = chunk_data.get("full_content")
-                        if not final_full_content:
-                            final_full_content = "".join(model_data['accumulated_content'])
-                        
-                        # 将最终内容存储用于数据库保存
-                        model_data['final_content'] = final_full_content
-                        
-                        # 发送最终块事件
-                        sse_event = {
-                            "model_id": model_id,
-                            "model_name": model_data['name'],
-                            "content_piece": "",
-                            "is_final_chunk": True,
-                            "full_content": final_full_content,
-                            "settings_snapshot": model_data['settings_snapshot'],
-                            "has_reasoning": chunk_data.get("has_reasoning", False)
-                        }
-                        yield f"data: {json.dumps(sse_event)}\n\n"
-                    
-                    else:
-                        content_piece = chunk_data.get("content_piece", "")
-                        reasoning_piece = chunk_data.get("reasoning_piece", "")
-                        
-                        if content_piece:
-                            model_data['accumulated_content'].append(content_piece)
-                        
-                        model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
-                        
-                        # 如果有推理内容，发送推理片段事件
-                        if reasoning_piece:
-                            sse_event = {
-                                "model_id": model_id,
-                                "model_name": model_data['name'],
-                                "reasoning_piece": reasoning_piece,
-                                "is_final_chunk": False,
-                                "settings_snapshot": model_data['settings_snapshot']
-                            }
-                            yield f"data: {json.dumps(sse_event)}\n\n"
-                        
-                        # 如果有常规内容，发送内容片段事件
-                        if content_piece:
-                            sse_event = {
-                                "model_id": model_id,
-                                "model_name": model_data['name'],
-                                "content_piece": content_piece,
-                                "is_final_chunk": False,
-                                "settings_snapshot": model_data['settings_snapshot']
-                            }
-                            yield f"data: {json.dumps(sse_event)}\n\n"
-                
-                except StopIteration:
+                    continue
+
+                if kind == _STREAM_ERROR:
+                    # 读取生成器时抛出异常
+                    _app.logger.error(f"处理模型 {model_id} 响应时发生错误: {chunk_data}")
+                    model_data['is_done'] = True
+                    completed_models += 1
+
+                    # 发送错误事件
+                    sse_event = {
+                        "model_id": model_id,
+                        "model_name": model_data['name'],
+                        "error": "处理错误",
+                        "details": str(chunk_data)
+                    }
+                    yield f"data: {json.dumps(sse_event)}\n\n"
+
+                elif kind == _STREAM_END:
                     # 生成器已经耗尽，但没有接收到最终块标记
-                    if not model_data['is_done']:
-                        model_data['is_done'] = True
-                        completed_models += 1
-                        processed_any = True
-                        
-                        # 发送隐式最终块事件
+                    model_data['is_done'] = True
+                    completed_models += 1
+
+                    # 发送隐式最终块事件
+                    sse_event = {
+                        "model_id": model_id,
+                        "model_name": model_data['name'],
+                        "is_final_chunk": True,
+                        "full_content": "".join(model_data['accumulated_content']),
+                        "settings_snapshot": model_data['settings_snapshot']
+                    }
+                    yield f"data: {json.dumps(sse_event)}\n\n"
+
+                elif chunk_data.get("error"):
+                    model_data['error'] = chunk_data
+                    model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
+                    model_data['is_done'] = True
+                    completed_models += 1
+
+                    # 发送错误事件
+                    sse_event = {
+                        "model_id": model_id,
+                        "model_name": model_data['name'],
+                        "error": chunk_data.get("error"),
+                        "details": chunk_data.get("details"),
+                        "settings_snapshot": chunk_data.get("settings_snapshot")
+                    }
+                    yield f"data: {json.dumps(sse_event)}\n\n"
+
+                elif chunk_data.get("is_final_chunk"):
+                    model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
+                    model_data['is_done'] = True
+                    completed_models += 1
+
+                    # 优先使用chat_service返回的full_content（可能包含推理格式）
+                    final_full_content = chunk_data.get("full_content")
+                    if not final_full_content:
+                        final_full_content = "".join(model_data['accumulated_content'])
+
+                    # 将最终内容存储用于数据库保存
+                    model_data['final_content'] = final_full_content
+
+                    # 发送最终块事件
+                    sse_event = {
+                        "model_id": model_id,
+                        "model_name": model_data['name'],
+                        "content_piece": "",
+                        "is_final_chunk": True,
+                        "full_content": final_full_content,
+                        "settings_snapshot": model_data['settings_snapshot'],
+                        "has_reasoning": chunk_data.get("has_reasoning", False),
+                        "timing": (model_data['settings_snapshot'] or {}).get("timing")
+                    }
+                    yield f"data: {json.dumps(sse_event)}\n\n"
+
+                else:
+                    content_piece = chunk_data.get("content_piece", "")
+                    reasoning_piece = chunk_data.get("reasoning_piece", "")
+
+                    if content_piece:
+                        model_data['accumulated_content'].append(content_piece)
+
+                    model_data['settings_snapshot'] = chunk_data.get("settings_snapshot")
+
+                    # 如果有推理内容，发送推理片段事件
+                    if reasoning_piece:
                         sse_event = {
                             "model_id": model_id,
                             "model_name": model_data['name'],
-                            "is_final_chunk": True,
-                            "full_content": "".join(model_data['accumulated_content']),
+                            "reasoning_piece": reasoning_piece,
+                            "is_final_chunk": False,
                             "settings_snapshot": model_data['settings_snapshot']
                         }
                         yield f"data: {json.dumps(sse_event)}\n\n"
-                
-                except Exception as e:
-                    # 处理异常
-                    _app.logger.error(f"处理模型 {model_id} 响应时发生错误: {e}")
-                    if not model_data['is_done']:
-                        model_data['is_done'] = True
-                        completed_models += 1
-                        processed_any = True
-                        
-                        # 发送错误事件
+
+                    # 如果有常规内容，发送内容片段事件
+                    if content_piece:
                         sse_event = {
                             "model_id": model_id,
                             "model_name": model_data['name'],
-                            "error": "处理错误",
-                            "details": str(e)
+                            "content_piece": content_piece,
+                            "is_final_chunk": False,
+                            "settings_snapshot": model_data['settings_snapshot']
                         }
                         yield f"data: {json.dumps(sse_event)}\n\n"
-            
-            # 如果这次循环没有处理任何模型数据，添加短暂延迟避免CPU空转
-            if not processed_any:
-                from time import sleep
-                sleep(0.01)  # 10毫秒延迟
-            
-        # 循环结束后，发送所有模型完成的信号（已在循环外）
+        finally:
+            # 客户端断开连接时通知读取线程尽快停止，不再继续消耗上游的流；
+            # 已收到的内容照常保存，先落库再通知前端本轮完成
+            stop_event.set()
+            save_chat_turn()
+
         yield f"data: {json.dumps({'all_models_completed': True})}\n\n"
-        
-        # 所有模型已完成，保存所有模型的响应到数据库（只保存一次）
-        with _app.app_context():
-            for model_id, model_data in model_generators.items():
-                if model_data['error']:
-                    # 保存错误信息
-                    error_details = f"模型API错误: {model_data['error'].get('details', model_data['error'].get('error'))}"
-                    chat_service.add_message_to_session(
-                        session_id, 
-                        model_id=model_id, 
-                        role='system', 
-                        content=error_details,
-                        settings_snapshot=model_data['settings_snapshot']
-                    )
-                    _app.logger.info(f"已记录模型 {model_id} 的系统错误: {error_details}")
-                else:
-                    # 保存正常响应
-                    # 优先使用final_content（包含推理格式），否则使用accumulated_content
-                    full_assistant_response = model_data.get('final_content')
-                    if not full_assistant_response:
-                        full_assistant_response = "".join(model_data['accumulated_content'])
-                    
-                    if full_assistant_response:
-                        chat_service.add_message_to_session(
-                            session_id, 
-                            model_id=model_id, 
-                            role='assistant', 
-                            content=full_assistant_response,
-                            settings_snapshot=model_data['settings_snapshot']
-                        )
-                        _app.logger.info(f"已记录模型 {model_id} 的助手消息。长度: {len(full_assistant_response)}")
 
     return Response(generate_sse_stream(), mimetype='text/event-stream')
 
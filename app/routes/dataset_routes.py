@@ -4,6 +4,11 @@ from app import db # 数据库实例
 from app.models import Dataset, DatasetCategory # 数据模型
 from app.forms import CustomDatasetForm # Import the new form
 from app.services.dataset_service import DatasetService
+from app.services.job_queue import dispatch_job, get_queue_info, JOB_DATASET_ENRICH
+from app.utils.line_index import build_line_index, get_file_kind, remove_line_index
+from app.services.rag_enrichment import (
+    needs_enrichment, get_enrichment_progress, ENRICH_PENDING, ENRICH_RUNNING, ENRICH_FAILED
+)
 import json # For parsing sample_data_json
 import os # For os.path.join
 from werkzeug.utils import secure_filename # For secure filenames
@@ -227,51 +232,16 @@ def add_custom_dataset():
                         # 处理JSONL文件
                         validated_lines = 0
                         
-                        # 如果是RAG格式，并且有jinja2模板，则处理数据集项
-                        if form.format.data == 'RAG' and form.jinja2_template.data:
-                            # 创建临时文件用于存储处理后的数据
-                            temp_file_path = os.path.join(upload_dir, f"temp_{new_filename}")
-                            processed_count = 0
-                            
-                            with open(file_path, 'r', encoding='utf-8') as f_in, open(temp_file_path, 'w', encoding='utf-8') as f_out:
-                                for i, line in enumerate(f_in):
-                                    try:
-                                        item = json.loads(line.strip())
-                                        # 处理RAG数据集项，填充缺失的字段
-                                        processed_item = DatasetService.process_rag_dataset_item(
-                                            item, 
-                                            form.jinja2_template.data
-                                        )
-                                        if not processed_item:
-                                            flash(f'Jinja2模板渲染失败，请检查模板是否正确', 'error')
-                                            return render_template('datasets/add_custom_dataset.html', 
-                                                                title='添加自定义数据集', 
-                                                                form=form,
-                                                                custom_template=custom_template,
-                                                                rag_template=rag_template)
-                                        # 写入处理后的数据
-                                        f_out.write(json.dumps(processed_item, ensure_ascii=False) + '\n')
-                                        processed_count += 1
-                                        validated_lines += 1
-                                    except json.JSONDecodeError:
-                                        # 如果解析失败，则写入原始行
-                                        f_out.write(line)
-                                        continue
-                            
-                            # 替换原始文件
-                            os.replace(temp_file_path, file_path)
-                            current_app.logger.info(f"已处理 {processed_count} 条RAG数据集项")
-                        else:
-                            # 常规处理，只验证JSON格式
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                for i, line in enumerate(f):
-                                    if i >= 5:  # 只检查前5行
-                                        break
-                                    try:
-                                        json.loads(line.strip())
-                                        validated_lines += 1
-                                    except json.JSONDecodeError:
-                                        continue
+                        # 只验证JSON格式；RAG数据集需要补全的字段在保存后由后台任务处理
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            for i, line in enumerate(f):
+                                if i >= 5:  # 只检查前5行
+                                    break
+                                try:
+                                    json.loads(line.strip())
+                                    validated_lines += 1
+                                except json.JSONDecodeError:
+                                    continue
                         
                         # 检查是否有有效数据
                         if validated_lines == 0:
@@ -399,8 +369,23 @@ def add_custom_dataset():
                 jinja2_template=form.jinja2_template.data if form.format.data in ['CUSTOM', 'RAG'] else None,
                 categories=category_objects
             )
+            # RAG数据集需要调用模板补全字段时，先保存为未启用状态，补全完成后自动启用
+            enrich = needs_enrichment(form.format.data, form.jinja2_template.data, file_path)
+            if enrich:
+                new_dataset.is_active = False
+                new_dataset.enrich_status = ENRICH_PENDING
+            elif get_file_kind(file_path):
+                # 建立行偏移索引，供分页预览使用；补全的数据集在补全完成后建立
+                try:
+                    build_line_index(file_path)
+                except Exception as e:
+                    current_app.logger.warning(f"建立数据集行索引失败，将在首次预览时重建: {e}")
             db.session.add(new_dataset)
             db.session.commit()
+            if enrich:
+                dispatch_job(JOB_DATASET_ENRICH, new_dataset.id, user_id=current_user.id)
+                flash(f'自定义数据集 " {new_dataset.name} " 已添加，正在后台补全数据，完成后自动启用（可在“显示全部”中查看进度）', 'success')
+                return redirect(url_for('datasets.datasets_list', show_all=1))
             flash(f'自定义数据集 " {new_dataset.name} " 已成功添加!', 'success')
             return redirect(url_for('datasets.datasets_list'))
         except ValueError as ve:
@@ -556,6 +541,13 @@ def toggle_dataset_active(dataset_id):
     """
     dataset = Dataset.query.get_or_404(dataset_id)
     
+    # 后台补全完成前数据不完整，不允许启用
+    if not dataset.is_active and dataset.enrich_status in (ENRICH_PENDING, ENRICH_RUNNING, ENRICH_FAILED):
+        return jsonify({
+            'success': False,
+            'message': f'数据集 "{dataset.name}" 的后台数据补全尚未完成，无法启用'
+        }), 409
+    
     # 切换状态
     dataset.is_active = not dataset.is_active
     
@@ -575,6 +567,18 @@ def toggle_dataset_active(dataset_id):
             'message': f'操作失败: {str(e)}'
         }), 500
 
+@bp.route('/<int:dataset_id>/enrich_status')
+def dataset_enrich_status(dataset_id):
+    """
+    API端点：RAG数据集后台补全的进度
+    """
+    dataset = Dataset.query.get_or_404(dataset_id)
+    progress = get_enrichment_progress(dataset)
+    queue_info = get_queue_info(JOB_DATASET_ENRICH, dataset.id)
+    if queue_info:
+        progress.update(queue_info)
+    return jsonify(progress)
+
 @bp.route('/<int:dataset_id>/delete', methods=['DELETE'])
 @login_required
 def delete_dataset(dataset_id):
@@ -634,6 +638,7 @@ def delete_dataset(dataset_id):
         if dataset.download_url and os.path.exists(dataset.download_url):
             try:
                 os.remove(dataset.download_url)
+                remove_line_index(dataset.download_url)
                 current_app.logger.info(f"已删除数据集文件: {dataset.download_url}")
             except Exception as file_error:
                 current_app.logger.warning(f"删除数据集文件失败: {file_error}")
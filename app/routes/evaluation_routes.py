@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, abort, make_response
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, abort, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from app.models import AIModel, Dataset, ModelEvaluationResult, ModelEvaluationDataset
 from app.services.evaluation_service import EvaluationService
+from app.services.job_queue import get_queue_info, JOB_MODEL_EVAL
+from app.services import result_export
 import json
 from math import ceil # 用于分页计算
 from sqlalchemy import or_, and_
@@ -226,7 +228,8 @@ def api_evaluation_status(evaluation_id):
         "status": evaluation.status,
         "created_at": evaluation.created_at.isoformat(),
         "completed_at": evaluation.completed_at.isoformat() if evaluation.completed_at else None,
-        "result_summary": evaluation.result_summary
+        "result_summary": evaluation.result_summary,
+        "queue": get_queue_info(JOB_MODEL_EVAL, evaluation.id)
     })
 
 @bp.route('/api/progress/<int:evaluation_id>')
@@ -323,13 +326,14 @@ def view_detailed_results(evaluation_id):
         search_query=search_query,
         min_score=min_score,
         max_score=max_score,
-        total_results=total_results 
+        total_results=total_results,
+        export_formats=result_export.get_available_formats()
     )
 
 @bp.route('/export/<int:evaluation_id>', methods=['GET'])
 @login_required
 def export_to_excel(evaluation_id):
-    """导出评估结果到Excel"""
+    """导出评估结果（format: xlsx / csv / parquet；未指定时结果不多导出 xlsx，否则导出 csv）"""
     evaluation = EvaluationService.get_evaluation_by_id(evaluation_id, current_user.id)
     
     if not evaluation:
@@ -340,37 +344,41 @@ def export_to_excel(evaluation_id):
         flash('评估结果仅在评估成功完成后可用。', 'warning')
         return redirect(url_for('evaluations.view_evaluation', evaluation_id=evaluation_id))
 
-    try:
-        # 获取筛选参数
-        search_query = request.args.get('search_query', None, type=str)
-        min_score = request.args.get('min_score', None, type=float)
-        max_score = request.args.get('max_score', None, type=float)
-        
-        # 导出Excel
-        excel_data = EvaluationService.export_evaluation_results_to_excel(
-            evaluation_id=evaluation_id,
-            user_id=current_user.id,
-            search_query=search_query,
-            min_score=min_score,
-            max_score=max_score
-        )
-        
-        if not excel_data:
-            flash('没有找到符合条件的评估结果。', 'warning')
-            return redirect(url_for('evaluations.view_detailed_results', evaluation_id=evaluation_id))
-        
-        # 生成安全的文件名，只使用ASCII字符
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"evaluation_{evaluation_id}_{timestamp}.xlsx"
-        
-        # 创建响应，使用ASCII编码的文件名
-        response = make_response(excel_data)
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        
-        return response
-        
-    except Exception as e:
-        current_app.logger.error(f"导出评估结果到Excel失败: {str(e)}")
-        flash(f'导出评估结果到Excel时发生错误: {str(e)}', 'error')
-        return redirect(url_for('evaluations.view_detailed_results', evaluation_id=evaluation_id)) 
\ No newline at end of file
+    requested_format = request.args.get('format', None, type=str)
+    if requested_format and requested_format.lower() not in result_export.get_available_formats():
+        flash(f'不支持的导出格式: {requested_format}', 'error')
+        return redirect(url_for('evaluations.view_detailed_results', evaluation_id=evaluation_id))
+
+    # 获取筛选参数
+    search_query = request.args.get('search_query', None, type=str)
+    min_score = request.args.get('min_score', None, type=float)
+    max_score = request.args.get('max_score', None, type=float)
+
+    query = result_export.build_results_query(evaluation_id, search_query, min_score, max_score)
+    row_count = query.count()
+    if row_count == 0:
+        flash('没有找到符合条件的评估结果。', 'warning')
+        return redirect(url_for('evaluations.view_detailed_results', evaluation_id=evaluation_id))
+
+    # xlsx 要全部写完才开始输出，结果较多时默认导出 csv，显式要求 xlsx 时拒绝
+    xlsx_max_rows = current_app.config.get('EXPORT_XLSX_MAX_ROWS', result_export.DEFAULT_XLSX_MAX_ROWS)
+    export_format = result_export.choose_export_format(requested_format, row_count, xlsx_max_rows)
+    if export_format == result_export.FORMAT_XLSX and row_count > xlsx_max_rows:
+        flash(f'结果共 {row_count} 条，超过 Excel 导出上限 {xlsx_max_rows} 条，请导出为 CSV 或 Parquet。', 'warning')
+        return redirect(url_for('evaluations.view_detailed_results', evaluation_id=evaluation_id))
+
+    # 生成安全的文件名，只使用ASCII字符
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"evaluation_{evaluation_id}_{timestamp}.{export_format}"
+
+    # 边查询边写，内存占用只与分批大小有关
+    chunks = result_export.stream_evaluation_results(
+        evaluation_id,
+        export_format=export_format,
+        search_query=search_query,
+        min_score=min_score,
+        max_score=max_score
+    )
+    response = Response(stream_with_context(chunks), mimetype=result_export.EXPORT_MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response 
\ No newline at end of file
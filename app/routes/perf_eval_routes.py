@@ -4,6 +4,7 @@ from app import db
 from app.models import PerformanceEvalTask, AIModel, Dataset
 from app.forms import PerformanceEvalForm
 from app.services.perf_service import PerformanceEvaluationService
+from app.services.job_queue import dispatch_job, JOB_PERF_EVAL
 from sqlalchemy import and_, or_
 
 perf_eval_bp = Blueprint('perf_eval', __name__, url_prefix='/perf_eval')
@@ -63,17 +64,16 @@ def create():
             
             if task:
                 # 启动评估任务
-                PerformanceEvaluationService.run_performance_evaluation(
-                    task.id, 
-                    form.model_name.data, 
-                    form.dataset_name.data, 
-                    form.concurrency.data, 
-                    form.num_requests.data,
-                    min_prompt_length=form.min_prompt_length.data,
-                    max_prompt_length=form.max_prompt_length.data,
-                    max_tokens=form.max_tokens.data,
-                    extra_args=form.extra_args.data
-                )
+                dispatch_job(JOB_PERF_EVAL, task.id, user_id=current_user.id, payload={
+                    'model_id': form.model_name.data,
+                    'dataset_id': form.dataset_name.data,
+                    'concurrency': form.concurrency.data,
+                    'num_requests': form.num_requests.data,
+                    'min_prompt_length': form.min_prompt_length.data,
+                    'max_prompt_length': form.max_prompt_length.data,
+                    'max_tokens': form.max_tokens.data,
+                    'extra_args': form.extra_args.data,
+                })
                 flash(f'性能评估任务已创建并开始执行，任务ID: {task.id}', 'success')
                 return redirect(url_for('perf_eval.results', task_id=task.id, source='create'))
             else:
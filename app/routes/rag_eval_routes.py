@@ -3,10 +3,9 @@ from flask_login import login_required, current_user
 from app import db
 from app.models import AIModel, Dataset, RAGEvaluation, RAGEvaluationDataset, RAGEvaluationResult
 from app.forms import RAGEvaluationForm
-from app.services.rag_evaluation_service import RAGEvaluationService
+from app.services.job_queue import dispatch_job, get_queue_info, JOB_RAG_EVAL
 from datetime import datetime
 from sqlalchemy import or_, and_
-import threading
 
 bp = Blueprint('rag_eval', __name__, url_prefix='/rag-evaluation')
 
@@ -151,16 +150,8 @@ def create():
             evaluation_id = evaluation.id
             evaluation_name = evaluation.name
             
-            # 启动后台评估任务
-            app = current_app._get_current_object()  # 获取应用实例
-            def run_evaluation():
-                with app.app_context():
-                    RAGEvaluationService.run_evaluation_async(evaluation_id)
-            
-            # 在后台线程中运行评估
-            eval_thread = threading.Thread(target=run_evaluation)
-            eval_thread.daemon = True
-            eval_thread.start()
+            # 提交到评估任务队列（inline 模式下在后台线程中运行）
+            dispatch_job(JOB_RAG_EVAL, evaluation_id, user_id=current_user.id)
             
             flash(f'RAG评估任务 "{evaluation_name}" 已创建成功，正在后台运行！', 'success')
             return redirect(url_for('rag_eval.history'))
@@ -233,7 +224,8 @@ def get_status(evaluation_id):
     return jsonify({
         'status': evaluation.status,
         'completed_at': evaluation.completed_at.isoformat() if evaluation.completed_at else None,
-        'result_summary': evaluation.result_summary
+        'result_summary': evaluation.result_summary,
+        'queue': get_queue_info(JOB_RAG_EVAL, evaluation.id)
     })
 
 @bp.route('/result/<int:result_id>')
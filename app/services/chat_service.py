@@ -2,11 +2,20 @@ from flask import current_app
 from app import db
 from app.models import ChatSession, ChatMessage, AIModel
 from app.services import model_service # To get decrypted API keys and model details
-import openai # Import the OpenAI library
 import traceback # For detailed error logging
 from openai import APIConnectionError, RateLimitError, AuthenticationError, APIStatusError
 import json # 用于序列化模型配置
+import re
+import time
+from sqlalchemy import bindparam
 from app.utils import get_beijing_time
+from app.utils.http_clients import get_openai_client
+from app.utils.token_counter import count_tokens, MESSAGE_TOKEN_OVERHEAD
+from app.utils.completion_cache import get_completion_cache, is_cacheable, make_cache_key
+
+# 流式输出中推理模型回复的存储格式：<think>推理过程</think><answer>答案</answer>
+REASONING_ANSWER_PATTERN = re.compile(r'<think.*?>[\s\S]*?</think>\s*<answer>([\s\S]*?)</answer>')
+REASONING_PATTERN = re.compile(r'<think.*?>[\s\S]*?</think>')
 
 def create_chat_session(user_id, session_name=None):
     """创建一个新的对话会话。"""
@@ -57,7 +66,8 @@ def add_message_to_session(session_id, model_id, role, content, settings_snapsho
         model_id=model_id, # Can be None if it's a user message before model selection, or system message for UI
         role=role, # 'user', 'assistant', 'system' (for prompts)
         content=content,
-        settings_snapshot=settings_snapshot # Store model settings at the time of this message pair
+        settings_snapshot=settings_snapshot, # Store model settings at the time of this message pair
+        token_count=count_history_tokens(role, content)
     )
     db.session.add(message)
     
@@ -73,6 +83,135 @@ def add_message_to_session(session_id, model_id, role, content, settings_snapsho
         current_app.logger.error(f"向会话 {session_id} 添加消息失败: {e}")
         return None
 
+def save_chat_turn(session_id, user_content, replies, model_configs=None, sent_at=None):
+    """在一个事务中保存一轮多模型对话：用户消息、各模型回复以及会话的模型配置。
+
+    Args:
+        session_id (int): 会话ID
+        user_content (str): 用户消息内容
+        replies (list): 模型回复列表，每项包含 model_id、role（'assistant' 或 'system'）、content、settings_snapshot
+        model_configs (list): 本轮使用的模型配置，提供时一并写入会话配置
+        sent_at (datetime): 用户发送消息的时间，保证用户消息排在本轮回复之前
+
+    Returns:
+        bool: 保存成功返回True，否则返回False
+    """
+    try:
+        session = ChatSession.query.get(session_id)
+        if not session:
+            current_app.logger.error(f"保存会话 {session_id} 的对话失败: 会话不存在")
+            return False
+
+        now = get_beijing_time()
+        messages = [ChatMessage(session_id=session_id, model_id=None, role='user',
+                                content=user_content, timestamp=sent_at or now,
+                                token_count=count_history_tokens('user', user_content))]
+        for reply in replies:
+            messages.append(ChatMessage(
+                session_id=session_id,
+                model_id=reply['model_id'],
+                role=reply['role'],
+                content=reply['content'],
+                timestamp=now,
+                settings_snapshot=reply.get('settings_snapshot'),
+                token_count=count_history_tokens(reply['role'], reply['content'])
+            ))
+        db.session.add_all(messages)
+
+        if model_configs:
+            # 重新赋值整个字典，确保 SQLAlchemy 检测到 JSON 列的变化
+            new_config_data = dict(session.config_data) if session.config_data else {}
+            new_config_data['model_configs'] = model_configs
+            session.config_data = new_config_data
+        session.updated_at = now
+
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"保存会话 {session_id} 的对话失败: {e}")
+        return False
+
+def strip_reasoning(content):
+    """去掉助手消息中的推理过程，只保留答案部分"""
+    if not content or '<think' not in content:
+        return content
+    match = REASONING_ANSWER_PATTERN.search(content)
+    if match:
+        return match.group(1).strip()
+    return REASONING_PATTERN.sub('', content).strip()
+
+def count_history_tokens(role, content):
+    """计算消息作为对话历史发送时的 token 数（助手消息不含推理过程），即 ChatMessage.token_count"""
+    return count_tokens(strip_reasoning(content) if role == 'assistant' else content)
+
+def load_history_candidates(session_id, limit=None):
+    """加载会话中最近的 user/assistant 消息（按时间升序），用于按模型截取对话历史。
+
+    缺少 token_count 的历史消息（字段上线前写入的数据）在这里补算并批量回写，之后不再重复计算。
+
+    Returns:
+        list: [{'role', 'content', 'token_count'}, ...]
+    """
+    limit = limit or current_app.config.get('CHAT_HISTORY_MAX_MESSAGES', 50)
+    messages = ChatMessage.query.filter(
+        ChatMessage.session_id == session_id,
+        ChatMessage.role.in_(['user', 'assistant'])
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit).all()
+
+    candidates, backfill = [], []
+    for msg in reversed(messages):
+        token_count = msg.token_count
+        if token_count is None:
+            token_count = count_history_tokens(msg.role, msg.content)
+            backfill.append({'_id': msg.id, 'token_count': token_count})
+        candidates.append({'role': msg.role, 'content': msg.content, 'token_count': token_count})
+
+    if backfill:
+        try:
+            table = ChatMessage.__table__
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('_id')).values(token_count=bindparam('token_count')),
+                backfill
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"回写会话 {session_id} 的消息 token 数失败: {e}")
+    return candidates
+
+def build_history_window(candidates, user_content, token_budget, strip_reasoning_content=True):
+    """从最新的消息开始往前截取，使对话历史（含本轮用户消息）不超过 token 预算。
+
+    本轮用户消息总是保留，即使它本身已超出预算。
+
+    Args:
+        candidates (list): load_history_candidates 的返回值
+        user_content (str): 本轮用户消息
+        token_budget (int): 历史 token 预算，<=0 表示不限制
+        strip_reasoning_content (bool): 是否去掉历史助手消息中的推理过程
+
+    Returns:
+        list: 发送给模型的 messages（不含 system prompt）
+    """
+    window = [{"role": "user", "content": user_content}]
+    used = count_tokens(user_content) + MESSAGE_TOKEN_OVERHEAD
+    for candidate in reversed(candidates):
+        content = candidate['content']
+        token_count = candidate['token_count']
+        if candidate['role'] == 'assistant':
+            if strip_reasoning_content:
+                content = strip_reasoning(content)
+            elif '<think' in content:
+                # token_count 按去掉推理过程的内容计算，保留推理时需要重新计数
+                token_count = count_tokens(content)
+        used += token_count + MESSAGE_TOKEN_OVERHEAD
+        if token_budget > 0 and used > token_budget:
+            break
+        window.append({"role": candidate['role'], "content": content})
+    window.reverse()
+    return window
+
 def get_messages_for_session(session_id, limit=50):
     """获取会话的消息，按时间升序排列。"""
     return ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp.asc()).limit(limit).all()
@@ -148,6 +287,93 @@ def get_session_model_configs(session_id):
     except Exception as e:
         return None
 
+class StreamTimingRecorder:
+    """记录一次流式响应的耗时：首 token 时间、token 间隔与输出速率"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_piece_at = None
+        self.last_piece_at = None
+        self.pieces = 0
+        self.gaps = []
+
+    def on_piece(self):
+        now = time.perf_counter()
+        if self.first_piece_at is None:
+            self.first_piece_at = now
+        else:
+            self.gaps.append(now - self.last_piece_at)
+        self.last_piece_at = now
+        self.pieces += 1
+
+    def summary(self, output_tokens=None):
+        """
+        生成存入 settings_snapshot['timing'] 的紧凑摘要（时间单位毫秒）
+
+        Args:
+            output_tokens: 服务端返回的 completion_tokens，缺失时按流式片段数估算
+        """
+        end = time.perf_counter()
+        tokens = output_tokens if output_tokens else self.pieces
+        timing = {
+            "ttft_ms": round((self.first_piece_at - self.started_at) * 1000, 1) if self.first_piece_at is not None else None,
+            "total_ms": round((end - self.started_at) * 1000, 1),
+            "output_tokens": tokens,
+            "tokens_estimated": not output_tokens,
+            "tokens_per_second": None,
+            "itl_ms": None
+        }
+        if self.first_piece_at is not None and tokens > 1 and end > self.first_piece_at:
+            # 解码速率不含首 token 等待时间
+            timing["tokens_per_second"] = round((tokens - 1) / (end - self.first_piece_at), 2)
+        if self.gaps:
+            gaps = sorted(self.gaps)
+            timing["itl_ms"] = {
+                "mean": round(sum(gaps) / len(gaps) * 1000, 1),
+                "p50": round(gaps[len(gaps) // 2] * 1000, 1),
+                "p90": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.9))] * 1000, 1),
+                "max": round(gaps[-1] * 1000, 1)
+            }
+        return timing
+
+def format_reasoning_content(reasoning_text, answer_text):
+    """推理模型回复的存储格式；没有推理过程时只保留答案"""
+    if reasoning_text:
+        return f"<think>{reasoning_text}</think><answer>{answer_text}</answer>"
+    return answer_text
+
+def _replay_cached_completion(cached, settings_snapshot):
+    """
+    把缓存的回复按流式输出的格式一次性返回
+
+    回放只需要几微秒，测得的 TTFT / 输出速率没有意义，不能和真实调用的耗时混在一起，timing 记为None
+    """
+    reasoning_text = cached.get('reasoning') or ''
+    answer_text = cached.get('content') or ''
+    if reasoning_text:
+        yield {"reasoning_piece": reasoning_text, "settings_snapshot": settings_snapshot, "is_final_chunk": False}
+    if answer_text:
+        yield {"content_piece": answer_text, "settings_snapshot": settings_snapshot, "is_final_chunk": False}
+    settings_snapshot["cache_hit"] = True
+    settings_snapshot["timing"] = None
+    yield {
+        "full_content": format_reasoning_content(reasoning_text, answer_text),
+        "settings_snapshot": settings_snapshot,
+        "is_final_chunk": True,
+        "empty_stream": not answer_text and not reasoning_text,
+        "has_reasoning": bool(reasoning_text)
+    }
+
+def _create_chat_stream(client, app_logger, **kwargs):
+    """流式请求并要求服务端在最后一个块中返回 usage；服务端不接受 stream_options 时去掉该参数重试"""
+    try:
+        return client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    except APIStatusError as e:
+        if e.status_code not in (400, 422):
+            raise
+        app_logger.info(f"服务端不支持 stream_options，改为不请求 usage: {e}")
+        return client.chat.completions.create(stream=True, **kwargs)
+
 def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None, temperature=None, stream: bool = False):
     # 由于此函数在路由处理程序的app_context中被调用，所以我们可以安全地访问数据库
     # 确保在路由中调用此函数时使用了with app.app_context()
@@ -197,8 +423,14 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
         else: return {"error": error_msg, "details": details, "settings_snapshot": settings_snapshot}
 
     try:
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        client = get_openai_client(base_url, api_key)
         api_messages = [{"role": "system", "content": settings_snapshot["system_prompt"]}] + messages
+        # temperature 为 0 时回复可复现，启用回复缓存后直接复用相同请求的结果
+        completion_cache = get_completion_cache()
+        generation_params = {"temperature": settings_snapshot["temperature"]}
+        cache_key = None
+        if completion_cache is not None and is_cacheable(generation_params):
+            cache_key = make_cache_key(base_url, settings_snapshot["model_identifier"], api_messages, generation_params)
         app_logger.debug(f"向模型 {model_info['display_name']} 发送 API 请求: Base URL={base_url}, Stream={stream}")
     except Exception as e_setup: # Error during client setup or message prep
         app_logger.error(f"调用API前发生错误 (模型: {model_info['display_name']}): {traceback.format_exc()}")
@@ -209,20 +441,31 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
 
     if stream:
         def stream_generator():
+            cached = completion_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                yield from _replay_cached_completion(cached, settings_snapshot)
+                return
+            timer = StreamTimingRecorder()
             try:
-                response_stream = client.chat.completions.create(
+                response_stream = _create_chat_stream(
+                    client, app_logger,
                     model=settings_snapshot["model_identifier"],
                     messages=api_messages,
                     temperature=settings_snapshot["temperature"],
                     # max_tokens=settings_snapshot["max_tokens"],
-                    stream=True
                 )
                 full_response_content = []
                 reasoning_content = []  # 存储思考过程
                 has_yielded_any_content = False
                 has_reasoning = False
+                output_tokens = None
                 
                 for chunk in response_stream:
+                    # 请求了 include_usage 时服务端在最后一个块（choices 为空）中附带 usage
+                    usage = getattr(chunk, 'usage', None)
+                    if usage is not None and getattr(usage, 'completion_tokens', None):
+                        output_tokens = usage.completion_tokens
+
                     # 检查是否有推理内容
                     if (hasattr(chunk, 'choices') and chunk.choices and 
                         hasattr(chunk.choices[0], 'delta') and chunk.choices[0].delta and
@@ -230,6 +473,7 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
                         reasoning_piece = chunk.choices[0].delta.reasoning_content
                         reasoning_content.append(reasoning_piece)
                         has_reasoning = True
+                        timer.on_piece()
                         # 流式发送思考过程
                         yield {"reasoning_piece": reasoning_piece, "settings_snapshot": settings_snapshot, "is_final_chunk": False}
     
@@ -240,17 +484,17 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
                         content_piece = chunk.choices[0].delta.content
                         full_response_content.append(content_piece)
                         has_yielded_any_content = True
+                        timer.on_piece()
                         yield {"content_piece": content_piece, "settings_snapshot": settings_snapshot, "is_final_chunk": False}
                 
                 # 构建最终内容，如果有推理过程，使用特殊格式
-                final_content = ""
-                if has_reasoning and reasoning_content:
-                    reasoning_text = "".join(reasoning_content)
-                    answer_text = "".join(full_response_content)
-                    final_content = f"<think>{reasoning_text}</think><answer>{answer_text}</answer>"
-                else:
-                    final_content = "".join(full_response_content)
+                reasoning_text = "".join(reasoning_content)
+                answer_text = "".join(full_response_content)
+                final_content = format_reasoning_content(reasoning_text, answer_text)
+                if cache_key and (has_yielded_any_content or has_reasoning):
+                    completion_cache.set(cache_key, {"content": answer_text, "reasoning": reasoning_text, "output_tokens": output_tokens})
                 
+                settings_snapshot["timing"] = timer.summary(output_tokens)
                 yield {
                     "full_content": final_content, 
                     "settings_snapshot": settings_snapshot, 
@@ -270,13 +514,23 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
                     error_type = f"API 状态错误 ({e_api_stream.status_code})"
                     try: details_str = e_api_stream.response.json().get('error',{}).get('message', str(e_api_stream))
                     except: pass # Keep original str(e_api_stream) if parsing fails
+                settings_snapshot["timing"] = timer.summary()
                 yield {"error": error_type, "details": details_str, "settings_snapshot": settings_snapshot, "is_final_chunk": True}
             except Exception as e_generic_stream:
                 app_logger.error(f"流式API调用中发生未知错误 (模型: {model_info['display_name']}): {traceback.format_exc()}")
+                settings_snapshot["timing"] = timer.summary()
                 yield {"error": "未知流错误", "details": str(e_generic_stream), "settings_snapshot": settings_snapshot, "is_final_chunk": True}
         return stream_generator()
     else: # Non-streaming
         try:
+            cached = completion_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                settings_snapshot["cache_hit"] = True
+                return {
+                    "content": format_reasoning_content(cached.get('reasoning'), cached.get('content') or ''),
+                    "settings_snapshot": settings_snapshot,
+                    "has_reasoning": bool(cached.get('reasoning'))
+                }
             completion = client.chat.completions.create(
                 model=settings_snapshot["model_identifier"],
                 messages=api_messages,
@@ -290,10 +544,9 @@ def call_openai_compatible_api(model_id: int, messages: list, system_prompt=None
             reasoning_content = getattr(completion.choices[0].message, 'reasoning', None)
             
             # 如果有推理内容，使用特殊格式存储
-            if reasoning_content:
-                final_content = f"<think>{reasoning_content}</think><answer>{response_content}</answer>"
-            else:
-                final_content = response_content
+            final_content = format_reasoning_content(reasoning_content, response_content)
+            if cache_key and response_content is not None:
+                completion_cache.set(cache_key, {"content": response_content, "reasoning": reasoning_content or ''})
                 
             return {"content": final_content, "settings_snapshot": settings_snapshot, "has_reasoning": bool(reasoning_content)}
         except (APIConnectionError, RateLimitError, AuthenticationError, APIStatusError) as e_api_nonstream:
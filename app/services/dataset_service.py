@@ -1,6 +1,5 @@
 import json
 import os
-import requests
 from flask import current_app
 from typing import List, Dict, Tuple, Any, Optional
 from urllib.parse import quote_plus
@@ -9,6 +8,10 @@ import logging
 # 导入ModelScope的SDK
 from modelscope import MsDataset
 
+from app.utils.http_clients import get_http_session, throttle_host
+from app.utils.line_index import read_line_range
+from app.utils.template_cache import CompiledTemplateCache
+
 class DatasetService:
     """
     提供与ModelScope数据集API交互的服务
@@ -104,48 +107,24 @@ class DatasetService:
     @staticmethod
     def _load_jsonl_stream(file_path: str, page: int = 1, per_page: int = 20) -> Tuple[List[Dict], int]:
         """
-        流式加载JSONL文件，避免内存占用过高
+        分页加载JSONL文件：通过行偏移索引直接定位到目标页，只读取这一页的数据
         """
         try:
-            # 快速扫描文件，只计算非空行数（不解析JSON）
-            total_valid_lines = 0
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():  # 只检查是否为非空行，不解析JSON
-                        total_valid_lines += 1
-            
-            # 计算分页参数
             start_idx = (page - 1) * per_page
-            end_idx = min(start_idx + per_page, total_valid_lines)
-            
-            # 如果请求的页面超出范围，返回空数据
-            if start_idx >= total_valid_lines:
-                return [], total_valid_lines
+            line_range = read_line_range(file_path, start_idx, start_idx + per_page)
             
-            # 第二次扫描，获取目标页的数据
             data = []
-            current_valid_line = 0
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        # 检查是否在当前页范围内，只有需要的行才解析JSON
-                        if start_idx <= current_valid_line < end_idx:
-                            try:
-                                json_data = json.loads(line)
-                                data.append(json_data)
-                            except json.JSONDecodeError:
-                                # 如果JSON解析失败，创建一个包含原始文本的对象
-                                data.append({"error": "JSON解析失败", "raw_text": line[:200] + "..." if len(line) > 200 else line})
-                        
-                        current_valid_line += 1
-                        
-                        # 如果已经获取完当前页的数据，提前退出
-                        if current_valid_line >= end_idx:
-                            break
+            for line in line_range.data.decode('utf-8', errors='replace').split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 如果JSON解析失败，创建一个包含原始文本的对象
+                    data.append({"error": "JSON解析失败", "raw_text": line[:200] + "..." if len(line) > 200 else line})
             
-            return data, total_valid_lines
+            return data, line_range.total
             
         except Exception as e:
             current_app.logger.error(f"Error loading JSONL file: {e}")
@@ -154,46 +133,24 @@ class DatasetService:
     @staticmethod
     def _load_csv_stream(file_path: str, page: int = 1, per_page: int = 20) -> Tuple[List[Dict], int]:
         """
-        流式加载CSV文件，避免内存占用过高
+        分页加载CSV文件：通过行偏移索引直接定位到目标页，只读取表头和这一页的数据
         """
         try:
             import csv
+            import io
             
-            # 首先计算总行数（不包括header）
-            total_rows = 0
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader, None)  # 跳过header
-                for _ in reader:
-                    total_rows += 1
-            
-            # 计算分页参数
             start_idx = (page - 1) * per_page
-            end_idx = min(start_idx + per_page, total_rows)
-            
-            # 如果请求的页面超出范围，返回空数据
-            if start_idx >= total_rows:
-                return [], total_rows
-            
-            # 第二次扫描，获取目标页的数据
-            data = []
-            current_row = 0
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    # 检查是否在当前页范围内
-                    if start_idx <= current_row < end_idx:
-                        data.append(row)
-                    
-                    current_row += 1
-                    
-                    # 如果已经获取完当前页的数据，提前退出
-                    if current_row >= end_idx:
-                        break
-            
-            return data, total_rows
+            line_range = read_line_range(file_path, start_idx, start_idx + per_page)
+            if not line_range.data:
+                return [], line_range.total
+            
+            header_text = line_range.header.decode('utf-8', errors='replace')
+            fieldnames = next(csv.reader(io.StringIO(header_text, newline='')), [])
+            reader = csv.DictReader(
+                io.StringIO(line_range.data.decode('utf-8', errors='replace'), newline=''),
+                fieldnames=fieldnames
+            )
+            return list(reader), line_range.total
             
         except Exception as e:
             current_app.logger.error(f"Error loading CSV file: {e}")
@@ -276,10 +233,12 @@ class DatasetService:
             
             current_app.logger.info(f"执行HTTP请求: {method} {url}")
             
+            throttle_host(url)
+            session = get_http_session(url)
             if method == 'GET':
-                response = requests.get(url, headers=headers, timeout=30)
+                response = session.get(url, headers=headers, timeout=30)
             elif method == 'POST':
-                response = requests.post(url, headers=headers, json=data, timeout=30)
+                response = session.post(url, headers=headers, json=data, timeout=30)
             else:
                 current_app.logger.error(f"不支持的HTTP方法: {method}")
                 return ""
@@ -364,14 +323,12 @@ class DatasetService:
             str: 渲染结果
         """
         try:
-            # 创建jinja2环境
-            env = DatasetService.create_jinja2_environment(**kwargs)
-            
-            # 解析模板
-            template = env.from_string(template_content)
+            # 已编译的模板按内容哈希复用，user_input/context 等只作为本次渲染的变量传入
+            template = _rag_templates.get_template(template_content)
+            module = template.make_module(vars=kwargs)
             
             # 获取宏
-            macro = getattr(template.module, macro_name, None)
+            macro = getattr(module, macro_name, None)
             if not macro:
                 current_app.logger.error(f"模板中未找到宏: {macro_name}")
                 return ""
@@ -443,4 +400,8 @@ class DatasetService:
             except Exception as e:
                 current_app.logger.error(f"获取回答失败: {e}")
         
-        return processed_item 
\ No newline at end of file
+        return processed_item
+
+
+# RAG 数据集模板共用一个环境，已编译的模板按内容哈希缓存
+_rag_templates = CompiledTemplateCache(DatasetService.create_jinja2_environment)
@@ -8,19 +8,26 @@ from app.models import (
     Dataset, 
 )
 from flask import current_app
-import threading
 from app.services.model_service import get_decrypted_api_key
+from app.services.job_queue import dispatch_job, JOB_MODEL_EVAL
+from app.services.review_ingest import ReviewIngester
 from app.utils import get_beijing_time
+from app.utils.completion_cache import get_completion_cache
+from app.utils.template_cache import template_hash
 from collections import OrderedDict, defaultdict
 from evalscope.run import run_task
 from evalscope.constants import JudgeStrategy
+from sqlalchemy.orm.attributes import set_committed_value
 import os
 import json
-import pandas as pd
+import threading
 
 # 导入配置函数
 from app.config import get_outputs_dir
 
+# 进程内缓存的数据集adapter数量上限
+ADAPTER_CACHE_SIZE = 64
+
 # 辅助函数，尝试将evalscope的Report对象转换为可序列化的字典
 def serialize_evalscope_report(report_obj):
     if hasattr(report_obj, 'to_dict') and callable(report_obj.to_dict):
@@ -30,14 +37,12 @@ def serialize_evalscope_report(report_obj):
     except TypeError:
         return str(report_obj) 
 
-# 定义evalscope输出结构中review目录的名称
-OUTPUTS_STRUCTURE_REVIEWS_DIR = 'reviews'
-
-# 简单的缓存机制，存储评估任务的total_prompts
-_evaluation_total_prompts_cache = {}
-
 class EvaluationService:
     """模型评估服务，处理评估相关的业务逻辑"""
+
+    # dataset_id -> ((格式, 模板哈希), adapter)，按最近使用排序
+    _adapter_cache: 'OrderedDict[int, Tuple[Tuple[str, str], Any]]' = OrderedDict()
+    _adapter_cache_lock = threading.Lock()
     
     @staticmethod
     def create_evaluation(
@@ -91,11 +96,8 @@ class EvaluationService:
             
             db.session.commit()
             
-            app_context = current_app._get_current_object()
-            threading.Thread(
-                target=EvaluationService._run_evaluation_task, 
-                args=(app_context, evaluation.id,)
-            ).start()
+            # 交给任务队列执行（inline 模式下仍在后台线程中运行）
+            dispatch_job(JOB_MODEL_EVAL, evaluation.id, user_id=user_id)
             
             return evaluation
         
@@ -271,6 +273,9 @@ class EvaluationService:
                             'timeout': 12000,
                         }
                     }
+                    judge_temperature = current_app.config.get('EVAL_JUDGE_TEMPERATURE')
+                    if judge_temperature is not None:
+                        task_cfg_args['judge_model_args']['generation_config']['temperature'] = judge_temperature
                 
                 # 如果有自建数据集，添加dataset_args参数
                 if dataset_args:
@@ -317,11 +322,30 @@ class EvaluationService:
                 current_app.logger.info(f"[评估任务 {evaluation_id}] Evalscope task_cfg: {json.dumps(task_cfg, indent=2)}")
 
             evalscope_final_report = {}
-            detailed_results_to_save = [] # 用于存储 ModelEvaluationResult 对象
             eval_successful = False
 
+            # 评估运行期间增量入库 review 文件；重试时先清除上一次已入库的结果。
+            # 进度总数在开始时计算一次并持久化，已完成数由入库线程随 review 文件增量更新
+            dataset_specs = EvaluationService._get_review_dataset_specs(eval_dataset_associations)
+            ingester = ReviewIngester(
+                app, evaluation.id, os.path.abspath(base_output_dir), model_to_evaluate.model_identifier,
+                resolve_dataset=lambda stem: EvaluationService._match_review_dataset(stem, dataset_specs),
+                format_prompt=lambda dataset_id, raw_input: EvaluationService.format_user_prompt(raw_input, Dataset.query.get(dataset_id))
+            )
+            ModelEvaluationResult.query.filter_by(evaluation_id=evaluation.id).delete(synchronize_session=False)
+            evaluation.total_prompts = EvaluationService._calculate_total_prompts(evaluation_id)
+            evaluation.completed_prompts = 0
+            db.session.commit()
+
+            # evalscope 的评审线程没有应用上下文，在这里先初始化回复缓存
+            get_completion_cache()
+
             try:
-                raw_report_from_evalscope = run_task(task_cfg=task_cfg)
+                ingester.start()
+                try:
+                    raw_report_from_evalscope = run_task(task_cfg=task_cfg)
+                finally:
+                    ingester.stop()
                 current_app.logger.info(f"[评估任务 {evaluation_id}] Evalscope run_task completed.")
                 eval_successful = True
 
@@ -334,148 +358,13 @@ class EvaluationService:
                     evalscope_final_report = {"error": "Evalscope did not return a dictionary.", "raw_output": str(raw_report_from_evalscope)}
                     eval_successful = False # 标记evalscope处理报告部分失败
 
-                # 如果Evalscope执行成功并且我们获得了报告字典，尝试解析详细结果
+                # 如果Evalscope执行成功并且我们获得了报告字典，读取 review 文件中尚未入库的部分
                 if eval_successful and isinstance(evalscope_final_report, dict) and not evalscope_final_report.get("error"):
-                    current_app.logger.info(f"[评估任务 {evaluation_id}] Attempting to parse detailed review files.")
-                    # 确保base_output_dir是绝对路径
-                    if not os.path.isabs(base_output_dir):
-                        base_output_dir = os.path.abspath(base_output_dir)
-                    t_base_output_dir = base_output_dir
-                    for k in os.listdir(base_output_dir):
-                        t_base_output_dir = os.path.join(base_output_dir, k)
-                    
-                    # fix: model_to_evaluate.model_identifier可能是deepseek/deepseek-r1-0528-qwen3-8b这种格式，需要做个处理
-                    t_model_identifier = model_to_evaluate.model_identifier.split('/')[-1]
-                    reviews_base_path = os.path.join(t_base_output_dir, OUTPUTS_STRUCTURE_REVIEWS_DIR, t_model_identifier)
-                    if os.path.isdir(reviews_base_path):
-                        for review_filename_in_dir in os.listdir(reviews_base_path):
-                            review_file_path = os.path.join(reviews_base_path, review_filename_in_dir)
-                            
-                            if os.path.isfile(review_file_path) and review_filename_in_dir.endswith('.jsonl'):
-                                current_app.logger.info(f"[评估任务 {evaluation_id}] Processing review file: {review_file_path}")
-                                
-                                filename_stem = review_filename_in_dir[:-6] # Remove .jsonl
-                                
-                                # 根据filename_stem查找对应的dataset
-                                corresponding_dataset = None
-                                for assoc in eval_dataset_associations:
-                                    dataset = Dataset.query.get(assoc.dataset_id)
-                                    if dataset:
-                                        if dataset.dataset_type == '系统':
-                                            # 系统数据集直接比较名称
-                                            if dataset.name in filename_stem:
-                                                corresponding_dataset = dataset
-                                                break
-                                        elif dataset.dataset_type == '自建':
-                                            # 自建数据集比较文件名（去掉扩展名后的部分）
-                                            if dataset.download_url:
-                                                dataset_filename = os.path.splitext(os.path.basename(dataset.download_url))[0]
-                                                prefix = ''
-                                                if dataset.format.lower() == 'custom':
-                                                    prefix = f'custom_dataset_{dataset.id}'
-                                                elif dataset.format.lower() == 'qa':
-                                                    prefix = 'general_qa'
-                                                elif dataset.format.lower() == 'mcq':
-                                                    prefix = 'general_mcq'
-                                                    if dataset_filename.endswith('_val'):
-                                                        dataset_filename = dataset_filename[:-4]
-                                                else:
-                                                    prefix = f'custom_dataset_{dataset.id}'
-                                                if f'{prefix}_{dataset_filename}' == filename_stem:
-                                                    corresponding_dataset = dataset
-                                                    break
-                                
-                                if not corresponding_dataset:
-                                    current_app.logger.warning(f"[评估任务 {evaluation_id}] 无法找到filename_stem '{filename_stem}' 对应的数据集，跳过该文件")
-                                    continue
-
-                                try:
-                                    origin_df = pd.read_json(review_file_path, lines=True)
-                                    for _, item in origin_df.iterrows():
-                                        raw_input = item.get('raw_input', '')
-                                        raw_pred_answer = ''
-                                        choices = item.get('choices', [])
-                                        if choices and isinstance(choices, list) and len(choices) > 0:
-                                            choice = choices[0]
-                                            if isinstance(choice, dict) and 'message' in choice and isinstance(choice['message'], dict):
-                                                raw_pred_answer = choice['message'].get('content', '')
-                                            elif isinstance(choice, dict) and 'content' in choice:
-                                                 raw_pred_answer = choice.get('content', '')
-                                        
-                                        review_data = {}
-                                        if choices and isinstance(choices, list) and len(choices) > 0 and isinstance(choices[0], dict):
-                                            review_data = choices[0].get('review', {})
-
-                                        parsed_gold_answer = review_data.get('gold', '')
-                                        parsed_pred_answer_for_feedback = review_data.get('pred', '') 
-                                        review_result = review_data.get('result')
-
-                                        # 处理不同格式的result
-                                        try:
-                                            if review_result is not None:
-                                                if isinstance(review_result, dict):
-                                                    # 处理复合结果格式: {"intent_result": true, "slots_result": {"miss_count": 1, "correct_count": 1, "fail_count": 0}}
-                                                    if 'intent_result' in review_result and 'slots_result' in review_result:
-                                                        intent_result = review_result.get('intent_result', False)
-                                                        slots_result = review_result.get('slots_result', {})
-                                                        
-                                                        # 计算slot的F1分数
-                                                        correct_count = slots_result.get('correct_count', 0)
-                                                        miss_count = slots_result.get('miss_count', 0)
-                                                        fail_count = slots_result.get('fail_count', 0)
-                                                        
-                                                        total_predicted = correct_count + fail_count
-                                                        total_actual = correct_count + miss_count
-                                                        
-                                                        if total_predicted > 0 and total_actual > 0:
-                                                            precision = correct_count / total_predicted
-                                                            recall = correct_count / total_actual
-                                                            if precision + recall > 0:
-                                                                slot_f1 = 2 * precision * recall / (precision + recall)
-                                                            else:
-                                                                slot_f1 = 0.0
-                                                        else:
-                                                            slot_f1 = 0.0
-                                                        
-                                                        if correct_count + miss_count + fail_count == 0:
-                                                            slot_f1 = 1.0
-                                                        
-                                                        score = float(intent_result) * 0.5 + 0.5 * slot_f1
-                                                        current_app.logger.debug(f"[评估任务 {evaluation_id}] 复合结果计算: intent={intent_result}, slot_f1={slot_f1:.4f}, final_score={score:.4f}")
-                                                    else:
-                                                        if 'score' in review_result:
-                                                            score = float(review_result.get('score', None))
-                                                        else: # 新增此分支，如果score是字典但没有'score'键，则设置为None
-                                                            current_app.logger.warning(f"[评估任务 {evaluation_id}] 'score' field not found in dict result '{review_result}' for an item in {review_file_path}. Setting to None.")
-                                                            score = None
-                                                else:
-                                                    score = float(review_result)
-                                        except (ValueError, TypeError) as e:
-                                            current_app.logger.warning(f"[评估任务 {evaluation_id}] Could not parse score '{review_result}' for an item in {review_file_path}. Error: {str(e)}. Setting to None.")
-                                            score = None
-
-                                        result_entry = ModelEvaluationResult(
-                                            evaluation_id=evaluation.id,
-                                            dataset_id=corresponding_dataset.id,  # 使用corresponding_dataset
-                                            question=str(raw_input),
-                                            model_answer=str(raw_pred_answer),
-                                            reference_answer=str(parsed_gold_answer),
-                                            score=score,
-                                            feedback=str(parsed_pred_answer_for_feedback) 
-                                        )
-                                        detailed_results_to_save.append(result_entry)
-                                    current_app.logger.info(f"[评估任务 {evaluation_id}] Processed {len(detailed_results_to_save)} items from {review_file_path} (total for this file: {len(origin_df)})")
-                                except Exception as df_exc:
-                                    current_app.logger.error(f"[评估任务 {evaluation_id}] Error processing review file {review_file_path}: {str(df_exc)}", exc_info=True)
-                            else:
-                                current_app.logger.debug(f"[评估任务 {evaluation_id}] Skipping non-JSONL file or directory in reviews folder: {review_filename_in_dir}")
+                    ingester.poll(final=True)
+                    if ingester.discover_files():
+                        current_app.logger.info(f"[评估任务 {evaluation_id}] Saved {ingester.ingested} detailed judge results to database.")
                     else:
-                        current_app.logger.warning(f"[评估任务 {evaluation_id}] Reviews directory not found: {reviews_base_path}. Skipping detailed results parsing.")
-                
-                # 保存详细结果到数据库
-                if detailed_results_to_save:
-                    db.session.bulk_save_objects(detailed_results_to_save)
-                    current_app.logger.info(f"[评估任务 {evaluation_id}] Saved {len(detailed_results_to_save)} detailed judge results to database.")
+                        current_app.logger.warning(f"[评估任务 {evaluation_id}] Reviews directory not found under {base_output_dir}. Skipping detailed results parsing.")
 
                 evaluation.result_summary = evalscope_final_report
                 evaluation.status = 'completed' if eval_successful else 'failed' # 如果evalscope执行本身就失败了，则最终状态为failed
@@ -491,18 +380,12 @@ class EvaluationService:
                 evaluation.completed_at = get_beijing_time()
                 db.session.commit() # 提交所有更改，包括状态、摘要和详细结果
                 current_app.logger.info(f"[评估任务 {evaluation_id}] 评估任务处理完毕，状态: {evaluation.status}。Summary: {json.dumps(evalscope_final_report, indent=2)}")
-                
-                # 清理评估缓存
-                EvaluationService._clear_evaluation_cache(evaluation_id)
 
             except Exception as es_exc:
                 current_app.logger.error(f"[评估任务 {evaluation_id}] Error during evalscope execution or result processing: {str(es_exc)}", exc_info=True)
                 evaluation.status = 'failed'
                 evaluation.result_summary = {"error": f"Evalscope execution/processing failed: {str(es_exc)}"}
                 db.session.commit() # 确保即使发生异常也提交状态
-                
-                # 清理评估缓存
-                EvaluationService._clear_evaluation_cache(evaluation_id)
             
             finally:
                 if os.path.isdir(base_output_dir):
@@ -515,6 +398,47 @@ class EvaluationService:
                     current_app.logger.warning(f"[评估任务 {evaluation_id}] Evalscope output directory not found for cleanup: {base_output_dir}")
             current_app.logger.info(f"[评估任务 {evaluation_id}] 执行线程结束。")
 
+    @staticmethod
+    def _get_review_dataset_specs(eval_dataset_associations) -> List[Dict[str, Any]]:
+        """提取匹配 review 文件所需的数据集字段（普通字典，可在入库线程中使用）"""
+        specs = []
+        for assoc in eval_dataset_associations:
+            dataset = Dataset.query.get(assoc.dataset_id)
+            if dataset:
+                specs.append({
+                    'id': dataset.id,
+                    'name': dataset.name,
+                    'dataset_type': dataset.dataset_type,
+                    'download_url': dataset.download_url,
+                    'format': dataset.format,
+                })
+        return specs
+
+    @staticmethod
+    def _match_review_dataset(filename_stem: str, dataset_specs: List[Dict[str, Any]]) -> Optional[int]:
+        """根据 review 文件名（不含扩展名）查找对应的数据集ID"""
+        for dataset in dataset_specs:
+            if dataset['dataset_type'] == '系统':
+                # 系统数据集直接比较名称
+                if dataset['name'] in filename_stem:
+                    return dataset['id']
+            elif dataset['dataset_type'] == '自建':
+                # 自建数据集比较文件名（去掉扩展名后的部分）
+                if dataset['download_url']:
+                    dataset_filename = os.path.splitext(os.path.basename(dataset['download_url']))[0]
+                    dataset_format = (dataset['format'] or '').lower()
+                    if dataset_format == 'qa':
+                        prefix = 'general_qa'
+                    elif dataset_format == 'mcq':
+                        prefix = 'general_mcq'
+                        if dataset_filename.endswith('_val'):
+                            dataset_filename = dataset_filename[:-4]
+                    else:
+                        prefix = f"custom_dataset_{dataset['id']}"
+                    if f'{prefix}_{dataset_filename}' == filename_stem:
+                        return dataset['id']
+        return None
+
     @staticmethod
     def get_evaluation_by_id(evaluation_id: int, user_id: int) -> Optional[ModelEvaluation]:
         evaluation = ModelEvaluation.query.get(evaluation_id)
@@ -559,155 +483,32 @@ class EvaluationService:
         
         total = query.count()
         results = query.paginate(page=page, per_page=per_page, error_out=False).items
-        # 为每个结果添加userPrompt
+        # 入库时已保存userPrompt；字段上线前的旧结果在这里补算并回写，之后不再重复计算
+        backfilled = False
         for result in results:
+            if result.user_prompt:
+                continue
             try:
                 result.user_prompt = EvaluationService._get_user_prompt_for_result(result)
+                backfilled = True
             except Exception as e:
                 current_app.logger.error(f"获取结果 {result.id} 的userPrompt失败: {str(e)}")
-                result.user_prompt = "无法获取用户提示"
+                set_committed_value(result, 'user_prompt', "无法获取用户提示")
+        if backfilled:
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"回写评估 {evaluation_id} 的userPrompt失败: {str(e)}")
         
         current_app.logger.info(f"[评估结果查询] EvalID: {evaluation_id}, UserID: {user_id}, Page: {page}, Search: '{search_query}', ScoreRange: [{min_score}, {max_score}], Found: {len(results)}, Total: {total}")
         return results, total
 
-    @staticmethod
-    def export_evaluation_results_to_excel(
-        evaluation_id: int, 
-        user_id: int, 
-        search_query: Optional[str] = None,
-        min_score: Optional[float] = None,
-        max_score: Optional[float] = None
-    ) -> Optional[bytes]:
-        """
-        导出评估结果为Excel文件
-        
-        Args:
-            evaluation_id: 评估ID
-            user_id: 用户ID
-            search_query: 搜索查询
-            min_score: 最小分数
-            max_score: 最大分数
-            
-        Returns:
-            bytes: Excel文件的二进制数据，失败返回None
-        """
-        try:
-            # 验证权限
-            evaluation = ModelEvaluation.query.get(evaluation_id)
-            if not evaluation or evaluation.user_id != user_id:
-                return None
-            
-            # 构建查询
-            query = ModelEvaluationResult.query.filter_by(evaluation_id=evaluation_id)
-            
-            # 应用筛选条件
-            if search_query:
-                query = query.filter(ModelEvaluationResult.question.ilike(f"%{search_query}%"))
-            if min_score is not None:
-                query = query.filter(ModelEvaluationResult.score >= min_score)
-            if max_score is not None:
-                query = query.filter(ModelEvaluationResult.score <= max_score)
-                
-            query = query.order_by(ModelEvaluationResult.id.asc())
-            
-            # 获取总数但不加载数据
-            total_count = query.count()
-            if total_count == 0:
-                return None
-            
-            current_app.logger.info(f"开始导出评估结果，总数: {total_count}")
-            
-            # 创建Excel文件
-            from io import BytesIO
-            output = BytesIO()
-            
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                # 分批处理数据，避免OOM
-                batch_size = 100  # 每批处理1000条记录
-                all_data = []
-                
-                # 使用yield_per进行流式查询
-                for batch_start in range(0, total_count, batch_size):
-                    current_app.logger.info(f"处理批次: {batch_start}-{min(batch_start + batch_size, total_count)}")
-                    
-                    # 分页查询当前批次
-                    batch_results = query.offset(batch_start).limit(batch_size).all()
-                    
-                    # 处理当前批次数据
-                    for idx, result in enumerate(batch_results, start=batch_start + 1):
-                        # 使用统一的user_prompt获取方法
-                        try:
-                            formatted_question = EvaluationService._get_user_prompt_for_result(result)
-                        except Exception as e:
-                            current_app.logger.error(f"获取结果 {result.id} 的userPrompt失败: {str(e)}")
-                            formatted_question = result.question
-                        
-                        all_data.append({
-                            '序号': idx,
-                            '问题': formatted_question,
-                            '模型回答': result.model_answer,
-                            '参考答案': result.reference_answer or '无',
-                            '得分': result.score if result.score is not None else '无评分',
-                            '数据集': result.dataset.name if result.dataset else '未知数据集'
-                        })
-                    
-                    # 清理当前批次以释放内存
-                    del batch_results
-                
-                # 创建DataFrame
-                df = pd.DataFrame(all_data)
-                current_app.logger.info(f"创建DataFrame完成，共 {len(df)} 行")
-                
-                # 写入Excel
-                df.to_excel(writer, sheet_name='评估结果', index=False)
-                
-                # 获取工作表对象进行格式化
-                worksheet = writer.sheets['评估结果']
-                
-                # 调整列宽
-                column_widths = {
-                    'A': 8,   # 序号
-                    'B': 50,  # 问题
-                    'C': 50,  # 模型回答
-                    'D': 30,  # 参考答案
-                    'E': 10,  # 得分
-                    'F': 20   # 数据集
-                }
-                
-                for col, width in column_widths.items():
-                    worksheet.column_dimensions[col].width = width
-                
-                # 设置表头样式
-                from openpyxl.styles import Font, PatternFill, Alignment
-                header_font = Font(bold=True, color='FFFFFF')
-                header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-                
-                for cell in worksheet[1]:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-                
-                # 设置数据行样式
-                for row in worksheet.iter_rows(min_row=2):
-                    for cell in row:
-                        cell.alignment = Alignment(vertical='top', wrap_text=True)
-                
-                # 清理DataFrame以释放内存
-                del df
-                del all_data
-            
-            output.seek(0)
-            file_data = output.getvalue()
-            current_app.logger.info(f"Excel导出完成，文件大小: {len(file_data)} bytes")
-            return file_data
-            
-        except Exception as e:
-            current_app.logger.error(f"导出Excel失败: {str(e)}", exc_info=True)
-            return None 
-
     @staticmethod
     def _get_user_prompt_for_result(result: 'ModelEvaluationResult') -> str:
-        """为单个评估结果获取格式化的userPrompt"""
+        """为单个评估结果获取格式化的userPrompt（优先使用入库时保存的结果）"""
+        if result.user_prompt:
+            return result.user_prompt
         try:
             # 解析question字段获取原始输入数据
             import ast
@@ -720,46 +521,50 @@ class EvaluationService:
                 except (ValueError, SyntaxError):
                     # 如果都失败，直接返回原始问题
                     return result.question
-            
-            # 首先尝试使用adapter生成完整的prompt
-            # 通过result.dataset获取数据集信息，然后使用benchmark_name
-            dataset = result.dataset
-            if not dataset:
-                # 如果没有dataset关系，回退到格式化逻辑
-                return EvaluationService._format_prompt_from_raw_data(raw_input_data)
-            
-            benchmark_name = f'custom_dataset_{dataset.id}' if dataset.format.lower() == 'custom' else dataset.name
-            adapter = EvaluationService.get_adapter_for_dataset(dataset.id)
-            if adapter:
-                try:
-                    # 调用adapter的gen_prompt方法，传递正确的参数
-                    prompt_data = adapter.gen_prompt(raw_input_data, benchmark_name, []) 
-                    # 提取prompt字段
-                    if isinstance(prompt_data, dict):
-                        adapter_prompt = prompt_data.get('data', []) or prompt_data.get('user_prompt', '')
-                        if adapter_prompt:
-                            # 处理不同类型的adapter_prompt
-                            if isinstance(adapter_prompt, list):
-                                # 如果是列表，拼接成字符串
-                                formatted_prompt = '\n'.join(str(item) for item in adapter_prompt)
-                            else:
-                                # 如果是字符串，直接使用
-                                formatted_prompt = str(adapter_prompt)
-                            
-                            # 将\n转换为真正的换行符
-                            formatted_prompt = formatted_prompt.replace('\\n', '\n')
-                            
-                            return formatted_prompt
-                except Exception as e:
-                    current_app.logger.warning(f"使用adapter生成prompt失败: {str(e)}")
-            
-            # 如果adapter方法失败，使用自定义格式化逻辑
-            return EvaluationService._format_prompt_from_raw_data(raw_input_data)
-                
+            return EvaluationService.format_user_prompt(raw_input_data, result.dataset)
         except Exception as e:
             current_app.logger.error(f"解析结果userPrompt时出错: {str(e)}", exc_info=True)
             return "解析错误"
 
+    @staticmethod
+    def format_user_prompt(raw_input_data: Any, dataset: Optional[Dataset]) -> str:
+        """用数据集的adapter把原始输入格式化为完整的userPrompt，失败时回退到通用格式"""
+        if not isinstance(raw_input_data, dict):
+            return str(raw_input_data)
+        # 首先尝试使用adapter生成完整的prompt
+        # 通过dataset获取数据集信息，然后使用benchmark_name
+        if not dataset:
+            # 如果没有dataset关系，回退到格式化逻辑
+            return EvaluationService._format_prompt_from_raw_data(raw_input_data)
+        
+        benchmark_name = f'custom_dataset_{dataset.id}' if dataset.format.lower() == 'custom' else dataset.name
+        adapter = EvaluationService.get_adapter_for_dataset(dataset.id, dataset=dataset)
+        if adapter:
+            try:
+                # 调用adapter的gen_prompt方法，传递正确的参数
+                prompt_data = adapter.gen_prompt(raw_input_data, benchmark_name, []) 
+                # 提取prompt字段
+                if isinstance(prompt_data, dict):
+                    adapter_prompt = prompt_data.get('data', []) or prompt_data.get('user_prompt', '')
+                    if adapter_prompt:
+                        # 处理不同类型的adapter_prompt
+                        if isinstance(adapter_prompt, list):
+                            # 如果是列表，拼接成字符串
+                            formatted_prompt = '\n'.join(str(item) for item in adapter_prompt)
+                        else:
+                            # 如果是字符串，直接使用
+                            formatted_prompt = str(adapter_prompt)
+                        
+                        # 将\n转换为真正的换行符
+                        formatted_prompt = formatted_prompt.replace('\\n', '\n')
+                        
+                        return formatted_prompt
+            except Exception as e:
+                current_app.logger.warning(f"使用adapter生成prompt失败: {str(e)}")
+        
+        # 如果adapter方法失败，使用自定义格式化逻辑
+        return EvaluationService._format_prompt_from_raw_data(raw_input_data)
+
     @staticmethod
     def _format_prompt_from_raw_data(raw_input_data: dict) -> str:
         """从原始数据格式化完整的prompt显示"""
@@ -854,33 +659,56 @@ class EvaluationService:
             return ""
 
     @staticmethod
-    def get_adapter_for_dataset(dataset_id: int):
-        """根据数据集名称获取对应的adapter实例"""
+    def get_adapter_for_dataset(dataset_id: int, dataset: Optional[Dataset] = None):
+        """根据数据集获取对应的adapter实例
+
+        adapter 按数据集缓存在进程内，数据集格式或 Jinja2 模板变化（按内容哈希判断）时重新创建。
+        已加载数据集对象的调用方可以传入 dataset，命中缓存时不再查询数据库。
+        """
         try:
-            dataset = Dataset.query.get(dataset_id)
+            if dataset is None:
+                dataset = Dataset.query.get(dataset_id)
             if not dataset:
                 return None
-            
-            dataset_format = f'custom_dataset_{dataset.id}' if dataset.format.lower() == 'custom' else f'general_{dataset.format.lower()}'
-            # 导入BENCHMARK_MAPPINGS
-            from evalscope.benchmarks.benchmark import BENCHMARK_MAPPINGS
-            # 动态注册自定义数据集基准测试[重启后内存数据会丢失，所以动态注册下]
-            from app.adapter.custom_dataset_adapter import register_custom_dataset_benchmark
-            register_custom_dataset_benchmark(dataset.id)
-            # 统一通过BENCHMARK_MAPPINGS获取adapter
-            if dataset_format in BENCHMARK_MAPPINGS:
-                benchmark_meta = BENCHMARK_MAPPINGS[dataset_format]
-                adapter_class = benchmark_meta.data_adapter
-                if dataset.format.lower() == 'custom':
-                    return adapter_class(**benchmark_meta.to_dict(), template_content=dataset.jinja2_template)
-                else:
-                    return adapter_class(**benchmark_meta.to_dict())
-            return None
+
+            cache_version = (dataset.format.lower(), template_hash(dataset.jinja2_template))
+            with EvaluationService._adapter_cache_lock:
+                entry = EvaluationService._adapter_cache.get(dataset.id)
+                if entry and entry[0] == cache_version:
+                    EvaluationService._adapter_cache.move_to_end(dataset.id)
+                    return entry[1]
+
+            adapter = EvaluationService._create_adapter(dataset)
+            if adapter is not None:
+                with EvaluationService._adapter_cache_lock:
+                    EvaluationService._adapter_cache[dataset.id] = (cache_version, adapter)
+                    EvaluationService._adapter_cache.move_to_end(dataset.id)
+                    while len(EvaluationService._adapter_cache) > ADAPTER_CACHE_SIZE:
+                        EvaluationService._adapter_cache.popitem(last=False)
+            return adapter
             
         except Exception as e:
             current_app.logger.error(f"获取数据集 {dataset_id} 的adapter失败: {str(e)}")
             raise e
 
+    @staticmethod
+    def _create_adapter(dataset: Dataset):
+        dataset_format = f'custom_dataset_{dataset.id}' if dataset.format.lower() == 'custom' else f'general_{dataset.format.lower()}'
+        # 导入BENCHMARK_MAPPINGS
+        from evalscope.benchmarks.benchmark import BENCHMARK_MAPPINGS
+        # 动态注册自定义数据集基准测试[重启后内存数据会丢失，所以动态注册下]
+        from app.adapter.custom_dataset_adapter import register_custom_dataset_benchmark
+        register_custom_dataset_benchmark(dataset.id)
+        # 统一通过BENCHMARK_MAPPINGS获取adapter
+        if dataset_format in BENCHMARK_MAPPINGS:
+            benchmark_meta = BENCHMARK_MAPPINGS[dataset_format]
+            adapter_class = benchmark_meta.data_adapter
+            if dataset.format.lower() == 'custom':
+                return adapter_class(**benchmark_meta.to_dict(), template_content=dataset.jinja2_template)
+            else:
+                return adapter_class(**benchmark_meta.to_dict())
+        return None
+
     @staticmethod
     def get_evaluation_progress(evaluation_id: int, user_id: int) -> Dict[str, Any]:
         """
@@ -894,64 +722,19 @@ class EvaluationService:
             Dict包含进度信息：total_prompts, completed_prompts, progress_percentage, status
         """
         try:
-            # 验证权限
+            # 验证权限；进度计数由评估执行线程维护，这里只读取一行记录
             evaluation = ModelEvaluation.query.get(evaluation_id)
             if not evaluation or evaluation.user_id != user_id:
                 return {"error": "评估不存在或您无权访问"}
             
-            # 如果评估已完成或失败，直接返回状态
-            if evaluation.status in ['completed', 'failed']:
-                return {
-                    "status": evaluation.status,
-                    "total_prompts": 0,
-                    "completed_prompts": 0,
-                    "progress_percentage": 100.0 if evaluation.status == 'completed' else 0.0
-                }
-            
-            # 获取评估输出目录
-            evalscope_run_timestamp = evaluation.created_at.strftime('%Y%m%d_%H%M%S')
-            base_output_dir = os.path.join(get_outputs_dir(), f'eval_{evaluation_id}_{evalscope_run_timestamp}')
-            # 检查输出目录是否存在
-            if not os.path.exists(base_output_dir):
-                return {
-                    "status": evaluation.status,
-                    "total_prompts": 0,
-                    "completed_prompts": 0,
-                    "progress_percentage": 0.0
-                }
-            
-            # 获取模型标识符
-            model = AIModel.query.get(evaluation.model_id)
-            if not model:
-                return {"error": "被评估模型不存在"}
-            
-            if not os.path.isabs(base_output_dir):
-                base_output_dir = os.path.abspath(base_output_dir)
-            t_base_output_dir = base_output_dir
-            for k in os.listdir(base_output_dir):
-                t_base_output_dir = os.path.join(base_output_dir, k)
-
-            t_model_identifier = model.model_identifier.split('/')[-1]
-            reviews_base_path = os.path.join(t_base_output_dir, OUTPUTS_STRUCTURE_REVIEWS_DIR, t_model_identifier)
-            current_app.logger.info(f"reviews_base_path: {reviews_base_path}")
-            # 计算已完成的prompt数量（通过reviews目录中的json文件）
-            completed_prompts = EvaluationService._calculate_completed_prompts(reviews_base_path)
-            
-            # 检查是否需要计算total_prompts（只在首次或completed_prompts为0时计算）
-            total_prompts = 0
-            progress_percentage = 0.0
-            
-            # 检查缓存中是否已有total_prompts
-            if evaluation_id in _evaluation_total_prompts_cache:
-                total_prompts = _evaluation_total_prompts_cache[evaluation_id]
-            else:
-                # 如果缓存中没有，则计算并缓存
-                total_prompts = EvaluationService._calculate_total_prompts(evaluation_id)
-                _evaluation_total_prompts_cache[evaluation_id] = total_prompts
-            
-            # 计算进度百分比
-            if total_prompts > 0:
+            total_prompts = evaluation.total_prompts or 0
+            completed_prompts = evaluation.completed_prompts or 0
+            if evaluation.status == 'completed':
+                progress_percentage = 100.0
+            elif total_prompts > 0:
                 progress_percentage = min(100.0, (completed_prompts / total_prompts) * 100.0)
+            else:
+                progress_percentage = 0.0
             
             return {
                 "status": evaluation.status,
@@ -997,42 +780,4 @@ class EvaluationService:
             current_app.logger.error(f"计算总prompt数量失败: {str(e)}")
             return 0
 
-    @staticmethod
-    def _calculate_completed_prompts(reviews_base_path: str) -> int:
-        """
-        计算已完成的prompt数量（通过reviews目录中的json文件）
-        """
-        try:
-            if not os.path.exists(reviews_base_path):
-                return 0
-            
-            completed_count = 0
-            
-            # 遍历reviews目录中的所有jsonl文件
-            for review_filename in os.listdir(reviews_base_path):
-                review_file_path = os.path.join(reviews_base_path, review_filename)
-                if os.path.isfile(review_file_path) and review_filename.endswith('.jsonl'):
-                    try:
-                        # 计算文件中的行数（每个行代表一个完成的prompt）
-                        with open(review_file_path, 'r', encoding='utf-8') as f:
-                            file_count = sum(1 for line in f if line.strip())
-                            completed_count += file_count
-                    except Exception as e:
-                        current_app.logger.warning(f"读取review文件失败 {review_file_path}: {str(e)}")
-                        continue
-            
-            return completed_count
-            
-        except Exception as e:
-            current_app.logger.error(f"计算已完成prompt数量失败: {str(e)}")
-            return 0 
-
-    @staticmethod
-    def _clear_evaluation_cache(evaluation_id: int) -> None:
-        """
-        清理评估任务的缓存
-        """
-        global _evaluation_total_prompts_cache
-        if evaluation_id in _evaluation_total_prompts_cache:
-            del _evaluation_total_prompts_cache[evaluation_id]
-            current_app.logger.debug(f"[评估任务 {evaluation_id}] 已清理缓存") 
\ No newline at end of file
+ 
\ No newline at end of file
@@ -0,0 +1,451 @@
+"""
+基于数据库的持久化评估任务队列
+
+Web 层只负责入队（enqueue_job），由独立的 worker 进程（worker.py）领取执行：
+- 领取：乐观更新 status='queued' -> 'running'，同时写入租约（lease）
+- 心跳：执行期间定期续租；worker 崩溃后租约过期，由回收逻辑重新入队
+- 重试：失败或租约过期后按退避时间重新入队，超过最大次数后把评估记录标记为失败
+
+准入控制（领取时检查，超出容量的任务保持 queued，评估记录保持 pending）：
+- 全局、单用户、单模型端点（AIModel.api_base_url）的运行中任务数上限；
+  多模型批量压测同时占用它调用的每个端点，任一端点达到上限即不能开始
+- 优先级分级（low / normal / high），同一优先级内运行中任务少的用户优先（公平调度）
+
+EVAL_JOB_MODE=inline（默认）时不需要单独部署 worker，由 Web 进程内的 worker 线程执行队列中的任务。
+"""
+import logging
+import os
+import socket
+import threading
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Union
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import EvalJob, ModelEvaluation, RAGEvaluation, PerformanceEvalTask, AIModel
+from app.utils import get_beijing_time
+
+# 任务类型
+JOB_MODEL_EVAL = 'model_eval'
+JOB_RAG_EVAL = 'rag_eval'
+JOB_PERF_EVAL = 'perf_eval'
+JOB_PERF_BATCH = 'perf_batch'
+JOB_DATASET_ENRICH = 'dataset_enrich'
+# 队列自检用的空任务，只由自检的 worker 领取
+JOB_QUEUE_PROBE = 'queue_probe'
+
+# 执行模式
+MODE_INLINE = 'inline'
+MODE_QUEUE = 'queue'
+
+# 默认租约时长、重试退避（秒）
+DEFAULT_LEASE_SECONDS = 90
+RETRY_BACKOFF_SECONDS = 30
+# 每次领取时最多检查的候选任务数
+CLAIM_SCAN_LIMIT = 50
+
+# 优先级分级 -> EvalJob.priority
+PRIORITY_CLASSES = {'low': -10, 'normal': 0, 'high': 10}
+# 未指定优先级时按任务类型取默认值：批量压测耗时长，默认低优先级
+DEFAULT_PRIORITY_CLASS = {JOB_PERF_BATCH: 'low'}
+
+# 准入检查未通过的原因
+BLOCKED_GLOBAL = 'global_limit'
+BLOCKED_USER = 'user_limit'
+BLOCKED_ENDPOINT = 'endpoint_limit'
+BLOCKED_BACKOFF = 'retry_backoff'
+
+# 任务类型 -> 评估记录模型，用于放弃重试时把记录标记为失败
+TARGET_MODELS = {
+    JOB_MODEL_EVAL: ModelEvaluation,
+    JOB_RAG_EVAL: RAGEvaluation,
+    JOB_PERF_EVAL: PerformanceEvalTask,
+    JOB_PERF_BATCH: PerformanceEvalTask,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_job_mode() -> str:
+    return current_app.config.get('EVAL_JOB_MODE', MODE_INLINE)
+
+
+def get_lease_seconds() -> int:
+    return int(current_app.config.get('EVAL_JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_capacity_limits() -> Dict[str, int]:
+    """运行中任务数上限，0 表示不限制"""
+    config = current_app.config
+    return {
+        'global': int(config.get('EVAL_MAX_RUNNING_JOBS', 0)),
+        'user': int(config.get('EVAL_MAX_JOBS_PER_USER', 0)),
+        'endpoint': int(config.get('EVAL_MAX_JOBS_PER_ENDPOINT', 0)),
+    }
+
+
+def resolve_priority(job_type: str, priority: Union[str, int, None] = None) -> int:
+    """把优先级分级名称转换为数值，未指定时使用任务类型的默认分级"""
+    if priority is None:
+        priority = DEFAULT_PRIORITY_CLASS.get(job_type, 'normal')
+    if isinstance(priority, str):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {priority}")
+        return PRIORITY_CLASSES[priority]
+    return int(priority)
+
+
+def get_priority_class(priority: int) -> str:
+    """数值优先级 -> 最接近的分级名称"""
+    return min(PRIORITY_CLASSES, key=lambda name: abs(PRIORITY_CLASSES[name] - priority))
+
+
+def resolve_endpoints(job_type: str, target_id: int, payload: Optional[Dict[str, Any]] = None) -> List[str]:
+    """任务压测/调用的全部模型端点（api_base_url），用于单端点并发上限；多模型批量压测会调用多个端点"""
+    payload = payload or {}
+    model_ids = []
+    if job_type == JOB_MODEL_EVAL:
+        evaluation = ModelEvaluation.query.get(target_id)
+        model_ids = [evaluation.model_id] if evaluation else []
+    elif job_type == JOB_RAG_EVAL:
+        evaluation = RAGEvaluation.query.get(target_id)
+        model_ids = [evaluation.judge_model_id] if evaluation else []
+    elif job_type == JOB_PERF_EVAL:
+        model_ids = [payload.get('model_id')]
+    elif job_type == JOB_PERF_BATCH:
+        task = PerformanceEvalTask.query.get(target_id)
+        batch_config = (task.get_batch_config() if task else None) or {}
+        model_ids = batch_config.get('model_ids') or [payload.get('model_id')]
+    model_ids = [model_id for model_id in model_ids if model_id]
+    if not model_ids:
+        return []
+    models = {model.id: model for model in AIModel.query.filter(AIModel.id.in_(model_ids)).all()}
+    endpoints = []
+    for model_id in model_ids:
+        model = models.get(model_id)
+        endpoint = model.api_base_url.rstrip('/') if model and model.api_base_url else None
+        if endpoint and endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return endpoints
+
+
+def get_job_endpoints(job) -> List[str]:
+    """任务（或运行中任务的查询行）占用的端点；早期入队的任务只记录了 endpoint"""
+    if job.endpoints:
+        return list(job.endpoints)
+    return [job.endpoint] if job.endpoint else []
+
+
+def run_job_handler(job_type: str, target_id: int, payload: Optional[Dict[str, Any]] = None, attempt: int = 1) -> None:
+    """
+    同步执行一个评估任务（需在应用上下文中调用），直到评估结束才返回
+
+    Args:
+        attempt: 第几次执行，重试时部分任务可以从断点继续
+    """
+    payload = dict(payload or {})
+    if job_type == JOB_MODEL_EVAL:
+        from app.services.evaluation_service import EvaluationService
+        EvaluationService._run_evaluation_task(current_app._get_current_object(), target_id)
+    elif job_type == JOB_RAG_EVAL:
+        from app.services.rag_evaluation_service import RAGEvaluationService
+        RAGEvaluationService.run_evaluation_async(target_id)
+    elif job_type == JOB_PERF_EVAL:
+        from app.services.perf_service import PerformanceEvaluationService
+        PerformanceEvaluationService.run_performance_evaluation(target_id, wait=True, **payload)
+    elif job_type == JOB_PERF_BATCH:
+        from app.services.perf_service import BatchPerformanceEvaluationService
+        # 重试时跳过已完成的测试配置
+        payload['resume'] = payload.get('resume', False) or attempt > 1
+        BatchPerformanceEvaluationService.run_batch_performance_evaluation(target_id, wait=True, **payload)
+    elif job_type == JOB_DATASET_ENRICH:
+        from app.services.rag_enrichment import enrich_rag_dataset
+        enrich_rag_dataset(target_id)
+    elif job_type == JOB_QUEUE_PROBE:
+        return
+    else:
+        raise ValueError(f"未知的任务类型: {job_type}")
+
+
+def dispatch_job(job_type: str, target_id: int, user_id: Optional[int] = None,
+                 payload: Optional[Dict[str, Any]] = None,
+                 priority: Union[str, int, None] = None) -> EvalJob:
+    """
+    提交评估任务：入队后由 worker 按准入规则领取执行。
+    inline 模式下同时确保当前 Web 进程内的 worker 线程已启动。
+
+    Args:
+        priority: 优先级分级名称（low / normal / high）或数值，默认按任务类型取值
+    """
+    job = enqueue_job(job_type, target_id, user_id=user_id, payload=payload, priority=priority)
+    if get_job_mode() == MODE_INLINE:
+        ensure_embedded_worker(current_app._get_current_object())
+    return job
+
+
+_embedded_worker = None
+_embedded_lock = threading.Lock()
+
+
+def ensure_embedded_worker(app) -> None:
+    """inline 模式：每个 Web 进程启动一个后台 worker（只启动一次）"""
+    global _embedded_worker
+    if _embedded_worker is not None or app.config.get('EVAL_JOB_MODE', MODE_INLINE) != MODE_INLINE:
+        return
+    with _embedded_lock:
+        if _embedded_worker is not None:
+            return
+        from app.services.job_worker import JobWorker
+        _embedded_worker = JobWorker(app, concurrency=int(app.config.get('EVAL_WORKER_CONCURRENCY', 2)))
+        _embedded_worker.start()
+
+
+def enqueue_job(job_type: str, target_id: int, user_id: Optional[int] = None,
+                payload: Optional[Dict[str, Any]] = None, priority: Union[str, int, None] = None,
+                max_attempts: Optional[int] = None) -> EvalJob:
+    """写入一条待执行任务"""
+    endpoints = resolve_endpoints(job_type, target_id, payload)
+    job = EvalJob(
+        job_type=job_type,
+        target_id=target_id,
+        user_id=user_id,
+        payload=payload or {},
+        priority=resolve_priority(job_type, priority),
+        endpoint=endpoints[0] if endpoints else None,
+        endpoints=endpoints,
+        max_attempts=max_attempts or int(current_app.config.get('EVAL_JOB_MAX_ATTEMPTS', 3)),
+        status='queued',
+        available_at=get_beijing_time(),
+        created_at=get_beijing_time(),
+    )
+    db.session.add(job)
+    db.session.commit()
+    current_app.logger.info(f"评估任务已入队: {job}")
+    return job
+
+
+def _get_running_jobs() -> List[tuple]:
+    return db.session.query(
+        EvalJob.id, EvalJob.user_id, EvalJob.endpoint, EvalJob.endpoints, EvalJob.started_at
+    ).filter(EvalJob.status == 'running').all()
+
+
+def _count_running(running: List[tuple]) -> Dict[str, Any]:
+    return {
+        'total': len(running),
+        'users': Counter(row.user_id for row in running),
+        'endpoints': Counter(endpoint for row in running for endpoint in get_job_endpoints(row)),
+    }
+
+
+def get_blocked_reason(job: EvalJob, counts: Dict[str, Any], limits: Dict[str, int]) -> Optional[str]:
+    """检查任务能否开始执行，返回阻塞原因，可以执行时返回None"""
+    if limits['global'] and counts['total'] >= limits['global']:
+        return BLOCKED_GLOBAL
+    if limits['user'] and job.user_id is not None and counts['users'][job.user_id] >= limits['user']:
+        return BLOCKED_USER
+    if limits['endpoint'] and any(counts['endpoints'][endpoint] >= limits['endpoint']
+                                  for endpoint in get_job_endpoints(job)):
+        return BLOCKED_ENDPOINT
+    return None
+
+
+def claim_job(worker_id: str, job_types: Optional[list] = None) -> Optional[EvalJob]:
+    """
+    领取一个可执行的任务。先选出通过准入检查的候选，再以 status='queued' 为条件更新，
+    更新行数为1才算领取成功，多个 worker 并发领取时不会重复执行。
+
+    没有领取到任务时也会结束当前事务：MySQL 的 REPEATABLE READ 下，不结束事务的话
+    后续轮询一直读取第一次查询时的快照，看不到之后入队的任务。
+    """
+    now = get_beijing_time()
+    limits = get_capacity_limits()
+    counts = _count_running(_get_running_jobs())
+    if limits['global'] and counts['total'] >= limits['global']:
+        db.session.rollback()
+        return None
+
+    query = EvalJob.query.filter(EvalJob.status == 'queued', EvalJob.available_at <= now)
+    if job_types:
+        query = query.filter(EvalJob.job_type.in_(job_types))
+    else:
+        query = query.filter(EvalJob.job_type != JOB_QUEUE_PROBE)
+    candidates = query.order_by(EvalJob.priority.desc(), EvalJob.id.asc()).limit(CLAIM_SCAN_LIMIT).all()
+    # 公平调度：同一优先级内，运行中任务少的用户优先
+    candidates.sort(key=lambda job: (-job.priority, counts['users'][job.user_id], job.id))
+
+    for candidate in candidates:
+        if get_blocked_reason(candidate, counts, limits):
+            continue
+        claimed = EvalJob.query.filter(
+            EvalJob.id == candidate.id,
+            EvalJob.status == 'queued'
+        ).update({
+            'status': 'running',
+            'worker_id': worker_id,
+            'attempts': EvalJob.attempts + 1,
+            'lease_expires_at': now + timedelta(seconds=get_lease_seconds()),
+            'heartbeat_at': now,
+            'started_at': now,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed != 1:
+            continue
+        if _exceeds_capacity_after_claim(candidate, limits):
+            _release_claim(candidate.id, worker_id)
+            return None
+        return EvalJob.query.get(candidate.id)
+    db.session.rollback()
+    return None
+
+
+def _exceeds_capacity_after_claim(job: EvalJob, limits: Dict[str, int]) -> bool:
+    """
+    多个 worker 同时领取时可能一起越过上限：领取后复核，
+    只统计比自己先开始的任务，保证并发领取者中先开始的保留、后开始的退回
+    """
+    running = _get_running_jobs()
+    mine = next((row for row in running if row.id == job.id), None)
+    if mine is None:
+        return False
+    ahead = [row for row in running
+             if row.id != job.id and (row.started_at, row.id) < (mine.started_at, mine.id)]
+    return get_blocked_reason(job, _count_running(ahead), limits) is not None
+
+
+def _release_claim(job_id: int, worker_id: str) -> None:
+    EvalJob.query.filter(EvalJob.id == job_id, EvalJob.worker_id == worker_id).update({
+        'status': 'queued',
+        'worker_id': None,
+        'attempts': EvalJob.attempts - 1,
+        'lease_expires_at': None,
+        'heartbeat_at': None,
+        'started_at': None,
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def get_queue_info(job_type: str, target_id: int) -> Optional[Dict[str, Any]]:
+    """
+    评估记录对应的最新队列任务状态，供任务状态接口展示
+
+    Returns:
+        Dict: job_id、job_status、priority、attempts；排队中时还包含 queue_position（从1开始）
+              与 waiting_reason。没有队列记录时返回None
+    """
+    job = EvalJob.query.filter_by(job_type=job_type, target_id=target_id).order_by(EvalJob.id.desc()).first()
+    if job is None:
+        return None
+    info = {
+        'job_id': job.id,
+        'job_status': job.status,
+        'priority': get_priority_class(job.priority),
+        'attempts': job.attempts,
+    }
+    if job.status != 'queued':
+        return info
+
+    ahead = EvalJob.query.filter(
+        EvalJob.status == 'queued',
+        or_(EvalJob.priority > job.priority, and_(EvalJob.priority == job.priority, EvalJob.id < job.id))
+    ).count()
+    info['queue_position'] = ahead + 1
+    in_backoff = EvalJob.query.filter(EvalJob.id == job.id, EvalJob.available_at > get_beijing_time()).count()
+    if in_backoff:
+        info['waiting_reason'] = BLOCKED_BACKOFF
+    else:
+        info['waiting_reason'] = get_blocked_reason(job, _count_running(_get_running_jobs()), get_capacity_limits())
+    return info
+
+
+def heartbeat(job_id: int, worker_id: str) -> bool:
+    """续租，返回False表示租约已丢失（已被回收或被其他 worker 领取）"""
+    now = get_beijing_time()
+    renewed = EvalJob.query.filter(
+        EvalJob.id == job_id,
+        EvalJob.worker_id == worker_id,
+        EvalJob.status == 'running'
+    ).update({
+        'heartbeat_at': now,
+        'lease_expires_at': now + timedelta(seconds=get_lease_seconds()),
+    }, synchronize_session=False)
+    db.session.commit()
+    return renewed == 1
+
+
+def complete_job(job_id: int, worker_id: str) -> None:
+    EvalJob.query.filter(EvalJob.id == job_id, EvalJob.worker_id == worker_id).update({
+        'status': 'succeeded',
+        'finished_at': get_beijing_time(),
+        'lease_expires_at': None,
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def fail_job(job: EvalJob, error: str) -> None:
+    """执行失败：未超过最大次数则退避后重新入队，否则标记失败并同步评估记录状态"""
+    job = EvalJob.query.get(job.id)
+    if job is None or job.status != 'running':
+        return
+    job.last_error = error
+    job.lease_expires_at = None
+    job.worker_id = None
+    if job.attempts < job.max_attempts:
+        job.status = 'queued'
+        job.available_at = get_beijing_time() + timedelta(seconds=RETRY_BACKOFF_SECONDS * job.attempts)
+        current_app.logger.warning(f"评估任务 {job} 第 {job.attempts} 次执行失败，稍后重试: {error}")
+    else:
+        job.status = 'failed'
+        job.finished_at = get_beijing_time()
+        _mark_target_failed(job.job_type, job.target_id, f"任务执行失败且已达到最大重试次数: {error}")
+        current_app.logger.error(f"评估任务 {job} 已放弃: {error}")
+    db.session.commit()
+
+
+def reap_expired_leases() -> int:
+    """回收租约已过期的任务（worker 崩溃或被重启），返回回收数量"""
+    expired = EvalJob.query.filter(
+        EvalJob.status == 'running',
+        or_(EvalJob.lease_expires_at.is_(None), EvalJob.lease_expires_at < get_beijing_time())
+    ).all()
+    for job in expired:
+        fail_job(job, f"worker {job.worker_id} 租约过期，任务被中断")
+    # 没有过期任务时同样结束事务，下次检查才能读到新的快照
+    db.session.rollback()
+    return len(expired)
+
+
+def has_live_job(job_type: str, target_id: int) -> bool:
+    """评估记录是否还有排队中、或租约未过期的执行中任务；为False时说明执行进程已不存在"""
+    job = EvalJob.query.filter_by(job_type=job_type, target_id=target_id).order_by(EvalJob.id.desc()).first()
+    if job is None:
+        return False
+    if job.status == 'queued':
+        return True
+    return (job.status == 'running' and job.lease_expires_at is not None
+            and job.lease_expires_at >= get_beijing_time())
+
+
+def _mark_target_failed(job_type: str, target_id: int, error: str) -> None:
+    if job_type == JOB_DATASET_ENRICH:
+        from app.services.rag_enrichment import mark_enrichment_failed
+        mark_enrichment_failed(target_id, error)
+        return
+    model = TARGET_MODELS.get(job_type)
+    target = model.query.get(target_id) if model else None
+    if target is None or target.status in ('completed', 'failed', 'aborted'):
+        return
+    target.status = 'failed'
+    target.completed_at = get_beijing_time()
+    if hasattr(target, 'error_message'):
+        target.error_message = error
+    else:
+        target.result_summary = {"error": error}
+    db.session.commit()
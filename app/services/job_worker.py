@@ -0,0 +1,144 @@
+"""
+评估任务 worker：从持久化队列领取任务并执行，与 Web 进程分开部署和扩容
+"""
+import signal
+import threading
+import time
+from typing import List, Optional
+
+from app import db
+from app.models import EvalJob
+from app.services.job_queue import (
+    claim_job, heartbeat, complete_job, fail_job, reap_expired_leases,
+    run_job_handler, get_lease_seconds, make_worker_id, enqueue_job, JOB_QUEUE_PROBE
+)
+
+
+class JobWorker:
+    """以 concurrency 个线程并发执行队列中的评估任务"""
+
+    def __init__(self, app, concurrency: int = 2, job_types: Optional[List[str]] = None,
+                 poll_interval: float = 2.0):
+        self.app = app
+        self.concurrency = max(1, concurrency)
+        self.job_types = job_types or None
+        self.poll_interval = poll_interval
+        self.worker_id = make_worker_id()
+        self._stopping = threading.Event()
+
+    def stop(self, *_):
+        self.app.logger.info(f"worker {self.worker_id} 收到停止信号，执行中的任务结束后退出")
+        self._stopping.set()
+
+    def start(self, daemon: bool = True) -> List[threading.Thread]:
+        """在后台线程中启动回收线程与 concurrency 个执行线程（不阻塞）"""
+        threads = [threading.Thread(target=self._reap_loop, name='eval-job-reaper', daemon=True)]
+        for i in range(self.concurrency):
+            threads.append(threading.Thread(
+                target=self._work_loop, args=(f"{self.worker_id}:{i}",), name=f'eval-job-worker-{i}',
+                daemon=daemon))
+        for thread in threads:
+            thread.start()
+
+        self.app.logger.info(f"worker {self.worker_id} 已启动，并发数 {self.concurrency}，任务类型 {self.job_types or '全部'}")
+        return threads
+
+    def run(self) -> None:
+        """阻塞运行，直到收到 SIGTERM/SIGINT"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        threads = self.start(daemon=False)
+        # 主线程需要保持可响应信号
+        while not self._stopping.wait(1.0):
+            pass
+        for thread in threads[1:]:
+            thread.join()
+
+    def _work_loop(self, slot_id: str) -> None:
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                # 每次轮询都从新的事务开始，避免一直读取旧快照
+                db.session.remove()
+                try:
+                    job = claim_job(slot_id, self.job_types)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"领取评估任务失败: {e}")
+                    job = None
+                if job is None:
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                self._execute(job, slot_id)
+
+    def _execute(self, job, slot_id: str) -> None:
+        self.app.logger.info(f"[{slot_id}] 开始执行 {job}（第 {job.attempts} 次）")
+        stop_heartbeat = threading.Event()
+        heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, args=(job.id, slot_id, stop_heartbeat), daemon=True)
+        heartbeat_thread.start()
+        try:
+            run_job_handler(job.job_type, job.target_id, job.payload, attempt=job.attempts)
+            complete_job(job.id, slot_id)
+            self.app.logger.info(f"[{slot_id}] {job} 执行完成")
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f"[{slot_id}] {job} 执行失败: {e}", exc_info=True)
+            fail_job(job, str(e))
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+    def _heartbeat_loop(self, job_id: int, slot_id: str, stop: threading.Event) -> None:
+        with self.app.app_context():
+            interval = max(1.0, get_lease_seconds() / 3)
+            while not stop.wait(interval):
+                try:
+                    if not heartbeat(job_id, slot_id):
+                        self.app.logger.warning(f"[{slot_id}] 任务 {job_id} 的租约已丢失")
+                        return
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"[{slot_id}] 任务 {job_id} 心跳失败: {e}")
+
+    def _reap_loop(self) -> None:
+        with self.app.app_context():
+            interval = max(5.0, get_lease_seconds() / 2)
+            while not self._stopping.wait(interval):
+                db.session.remove()
+                try:
+                    reaped = reap_expired_leases()
+                    if reaped:
+                        self.app.logger.warning(f"回收了 {reaped} 个租约过期的评估任务")
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"回收过期评估任务失败: {e}")
+
+
+def check_queue_pickup(app, timeout: float = 15.0, poll_interval: float = 0.5) -> bool:
+    """
+    自检：启动一个只领取探测任务的 worker，等它空轮询之后再从另一个会话入队探测任务，
+    确认同一个 worker 线程能领取并执行完成。worker 会话一直读取旧快照时会超时失败。
+    需在应用上下文中调用。
+    """
+    worker = JobWorker(app, concurrency=1, job_types=[JOB_QUEUE_PROBE], poll_interval=poll_interval)
+    worker.start()
+    job_id = None
+    try:
+        # 等 worker 完成至少一次空轮询
+        time.sleep(poll_interval * 3)
+        job_id = enqueue_job(JOB_QUEUE_PROBE, 0, max_attempts=1).id
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            db.session.rollback()
+            job = EvalJob.query.get(job_id)
+            if job is not None and job.status == 'succeeded':
+                return True
+            time.sleep(poll_interval)
+        return False
+    finally:
+        worker.stop()
+        if job_id is not None:
+            db.session.rollback()
+            EvalJob.query.filter(EvalJob.id == job_id).delete(synchronize_session=False)
+            db.session.commit()
@@ -2,13 +2,23 @@ from flask import current_app
 from app import db
 from app.models import AIModel
 from flask_login import current_user
+import hashlib
+import json
+import os
 import requests
+import threading
 import time
-from app.utils import get_beijing_time
+from app.utils.shared_cache import get_cache
+from app.utils.http_clients import get_http_session
 
 # --- System Models Cache ---
-_system_models_cache = {"data": None, "last_fetched_utc": None}
+# 模型列表缓存在跨进程共享缓存中，所有 gunicorn worker 共用一份
+SYSTEM_MODELS_CACHE_NAMESPACE = 'system_models'
 CACHE_DURATION_SECONDS = 360 * 24  # 24 小时
+# 提供商请求失败时可回退使用的过期缓存最长保留时间
+SYSTEM_MODELS_STALE_SECONDS = 7 * 24 * 3600
+# 即使提供商数据未变化，也每隔该时间与数据库完整比对一次
+SYSTEM_MODELS_RESYNC_SECONDS = 24 * 3600
 
 # --- System Models Configuration ---
 # SYSTEM_PROVIDER_BASE_URL is now fetched from app.config
@@ -31,51 +41,109 @@ def _get_system_provider_base_url():
 
 def _fetch_system_models_from_provider_with_cache(models_url: str, headers: dict):
     """
-    从系统提供商获取模型数据，使用1小时缓存策略。
+    从系统提供商获取模型数据，使用共享缓存（各 worker 进程共用）。
+    缓存过期后带 If-None-Match 条件请求，提供商返回 304 时直接续期旧数据。
     如果获取失败，但存在（即使已过期的）缓存，则返回旧缓存。
     """
-    global _system_models_cache
     app_logger = current_app.logger # 在函数开始时获取logger
-
-    now_beijing = get_beijing_time()
+    cache = get_cache(SYSTEM_MODELS_CACHE_NAMESPACE)
+    cached = cache.get(models_url)  # {"data": ..., "fetched_at": 时间戳, "etag": ...}
 
     # 检查缓存是否仍然有效
-    if _system_models_cache["data"] is not None and _system_models_cache["last_fetched_utc"] is not None:
-        age_seconds = (now_beijing - _system_models_cache["last_fetched_utc"]).total_seconds()
+    if cached is not None:
+        age_seconds = time.time() - cached["fetched_at"]
         if age_seconds < CACHE_DURATION_SECONDS:
             app_logger.info("Returning system models from active cache.")
-            return _system_models_cache["data"]
+            return cached["data"]
         else:
             app_logger.info("System models cache expired, will attempt to refresh.")
 
     # 缓存无效或已过期，尝试获取新数据
     try:
+        request_headers = dict(headers)
+        if cached is not None and cached.get("etag"):
+            request_headers["If-None-Match"] = cached["etag"]
         app_logger.info(f"Fetching system models from provider: {models_url}")
-        response = requests.get(models_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        provider_models_data = response.json()
+        response = get_http_session(models_url).get(models_url, headers=request_headers, timeout=15)
+        if response.status_code == 304 and cached is not None:
+            provider_models_data = cached["data"]
+            app_logger.info("System models not modified on provider, cache renewed.")
+        else:
+            response.raise_for_status()
+            provider_models_data = response.json()
         
         # 更新缓存
-        _system_models_cache["data"] = provider_models_data
-        _system_models_cache["last_fetched_utc"] = now_beijing
+        cache.set(models_url, {
+            "data": provider_models_data,
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+        }, ttl=SYSTEM_MODELS_STALE_SECONDS)
         app_logger.info("Successfully fetched and cached new system models.")
         return provider_models_data
     except requests.exceptions.RequestException as e:
         app_logger.error(f"Failed to fetch models from system provider: {e}")
         # 如果获取失败，但存在旧缓存，则返回旧缓存以提高弹性
-        if _system_models_cache["data"] is not None:
+        if cached is not None:
             app_logger.warning("Returning stale system models from cache due to fetch failure.")
-            return _system_models_cache["data"]
+            return cached["data"]
         return None # 获取失败且无任何缓存
     except ValueError as e: # 包括 JSONDecodeError
         app_logger.error(f"Failed to parse JSON response from system provider: {e}")
-        if _system_models_cache["data"] is not None:
+        if cached is not None:
             app_logger.warning("Returning stale system models from cache due to JSON parse failure.")
-            return _system_models_cache["data"]
+            return cached["data"]
         return None # 解析失败且无任何缓存
 
-def sync_system_models():
-    """Fetches models from the system provider and syncs them to the database."""
+def invalidate_system_models_cache():
+    """清除所有 worker 共用的系统模型列表缓存，下次同步时重新请求提供商"""
+    get_cache(SYSTEM_MODELS_CACHE_NAMESPACE).invalidate_all()
+
+def _normalize_provider_models(provider_models_data):
+    """
+    把提供商返回的 /models 数据整理为 {model_identifier: 期望的字段}，
+    格式不正确时返回None
+    """
+    if isinstance(provider_models_data, dict) and 'data' in provider_models_data:
+        models_list = provider_models_data['data']
+    elif isinstance(provider_models_data, list):
+        # Some /models endpoints return a list directly
+        models_list = provider_models_data
+    else:
+        current_app.logger.error("Unexpected format for models data from system provider.")
+        return None
+
+    desired = {}
+    for model_data in models_list:
+        if not isinstance(model_data, dict) or 'id' not in model_data or 'owned_by' not in model_data:
+            current_app.logger.warning(f"Skipping malformed model data from provider: {model_data}")
+            continue
+        model_identifier = model_data['id']
+        provider_name = model_data['owned_by']
+        desired[model_identifier] = {
+            'provider_name': provider_name,
+            'display_name': f"{provider_name}: {model_identifier}", # Auto-generate display name
+            'system_prompt': model_data.get("system_prompt", "You are a helpful AI assistant."), # Use provider's or default
+            'default_temperature': model_data.get("default_temperature", 0.7),
+        }
+    return desired
+
+def _hash_provider_models(desired: dict) -> str:
+    payload = json.dumps(desired, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def sync_system_models(force: bool = False) -> bool:
+    """
+    Fetches models from the system provider and syncs them to the database.
+
+    提供商返回的模型列表与上次同步时的哈希一致则不访问数据库；有变化时一次查询取出
+    现有系统模型，在内存中比对后只写入新增、变更和删除的部分。
+
+    Args:
+        force: 忽略哈希，强制与数据库比对一次
+
+    Returns:
+        bool: 是否执行了数据库比对
+    """
     api_key = _get_system_provider_api_key()
     system_provider_base_url = _get_system_provider_base_url()
 
@@ -83,7 +151,7 @@ def sync_system_models():
         current_app.logger.error(
             "Cannot sync system models: System Provider API Key or Base URL is not configured."
         )
-        return
+        return False
 
     models_url = f"{system_provider_base_url.rstrip('/')}/models"
     headers = {
@@ -94,84 +162,153 @@ def sync_system_models():
 
     if provider_models_data is None:
         current_app.logger.error("Failed to obtain system models data (from provider or cache). Sync aborted.")
-        return
-
-    fetched_model_identifiers = set()
-
-    if isinstance(provider_models_data, dict) and 'data' in provider_models_data:
-        models_list = provider_models_data['data']
-    elif isinstance(provider_models_data, list):
-        # Some /models endpoints return a list directly
-        models_list = provider_models_data
-    else:
-        current_app.logger.error("Unexpected format for models data from system provider.")
-        return
-
-    for model_data in models_list:
-        if not isinstance(model_data, dict) or 'id' not in model_data or 'owned_by' not in model_data:
-            current_app.logger.warning(f"Skipping malformed model data from provider: {model_data}")
-            continue
-
-        model_identifier = model_data['id']
-        provider_name = model_data['owned_by']
-        display_name = f"{provider_name}: {model_identifier}" # Auto-generate display name
-        
-        fetched_model_identifiers.add(model_identifier)
-
-        exists = AIModel.query.filter_by(
-            model_identifier=model_identifier,
-            api_base_url=system_provider_base_url, # Use URL from config
-            is_system_model=True
-        ).first()
+        return False
+
+    desired = _normalize_provider_models(provider_models_data)
+    if desired is None:
+        return False
+
+    cache = get_cache(SYSTEM_MODELS_CACHE_NAMESPACE)
+    hash_key = f"synced_hash:{system_provider_base_url}"
+    payload_hash = _hash_provider_models(desired)
+    if not force and cache.get(hash_key) == payload_hash:
+        current_app.logger.debug("System models unchanged since last sync, skipping database diff.")
+        return False
+
+    existing = {
+        model.model_identifier: model
+        for model in AIModel.query.filter_by(is_system_model=True, api_base_url=system_provider_base_url).all()
+    }
 
-        if not exists:
-            new_model = AIModel(
-                display_name=display_name,
+    added, updated, deleted = 0, 0, 0
+    new_models = []
+    for model_identifier, fields in desired.items():
+        model = existing.get(model_identifier)
+        if model is None:
+            new_models.append(AIModel(
                 model_identifier=model_identifier,
-                provider_name=provider_name,
                 api_base_url=system_provider_base_url, # Use URL from config
                 model_type="openai_compatible", # As specified by user for this provider
-                system_prompt=model_data.get("system_prompt", "You are a helpful AI assistant."), # Use provider's or default
-                default_temperature=model_data.get("default_temperature", 0.7),
                 is_system_model=True,
                 is_validated=True, # System models are now considered validated by default after sync
-                user_id=None
-            )
-            db.session.add(new_model)
-            current_app.logger.info(f"Added new system model: {display_name} as validated.")
-        else: # Existing system model found, ensure it's marked as validated
-            if not exists.is_validated:
-                exists.is_validated = True
-                db.session.add(exists)
-                current_app.logger.info(f"Marked existing system model as validated: {exists.display_name}")
-            # Optionally, update other details if they can change, e.g., display_name if logic changes
-            if exists.provider_name != provider_name or \
-               (exists.system_prompt != model_data.get("system_prompt", "You are a helpful AI assistant.")) or \
-               (exists.display_name != display_name): # if display name generation logic can change
-                exists.provider_name = provider_name
-                exists.system_prompt = model_data.get("system_prompt", "You are a helpful AI assistant.")
-                exists.display_name = display_name
-                db.session.add(exists)
-                current_app.logger.info(f"Updated details for existing system model: {exists.display_name}")
-
-    current_db_system_models = AIModel.query.filter_by(is_system_model=True, api_base_url=system_provider_base_url).all()
-    for db_model in current_db_system_models:
-        if db_model.model_identifier not in fetched_model_identifiers:
+                user_id=None,
+                **fields
+            ))
+            continue
+        changed = not model.is_validated or any(
+            getattr(model, name) != value for name, value in fields.items() if name != 'default_temperature'
+        )
+        if changed:
+            model.is_validated = True
+            model.provider_name = fields['provider_name']
+            model.system_prompt = fields['system_prompt']
+            model.display_name = fields['display_name']
+            updated += 1
+
+    if new_models:
+        db.session.add_all(new_models)
+        added = len(new_models)
+
+    for model_identifier, db_model in existing.items():
+        if model_identifier not in desired:
             current_app.logger.info(f"System model {db_model.display_name} no longer provided by API. Deleting...")
             db.session.delete(db_model) # Or mark as inactive
+            deleted += 1
 
     try:
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error committing system model changes to database: {e}")
+        return True
+
+    # 记录本次同步的哈希；设置过期时间，定期做一次完整比对以修正数据库中的手工改动
+    cache.set(hash_key, payload_hash, ttl=SYSTEM_MODELS_RESYNC_SECONDS)
+    current_app.logger.info(f"System models synced: {added} added, {updated} updated, {deleted} deleted.")
+    return True
+
+_refresher_thread = None
+_refresher_lock = threading.Lock()
+_initial_sync_attempted = False
+
+# 共享缓存中的锁：SYNC_LOCK_KEY 保证所有进程中同一时间只有一个在同步（避免并发插入重复的系统模型），
+# REFRESH_DUE_KEY 在每个刷新周期内只能被一个进程抢到，由它执行本周期的同步
+SYNC_LOCK_KEY = 'sync_lock'
+SYNC_LOCK_SECONDS = 120
+REFRESH_DUE_KEY = 'refresh_due'
+# 首次同步正由其他进程执行时，最多等待的秒数
+INITIAL_SYNC_WAIT_SECONDS = 10
+
+def _sync_system_models_exclusive(force: bool = False) -> bool:
+    """持有跨进程的同步锁执行 sync_system_models；其他进程正在同步时返回False"""
+    cache = get_cache(SYSTEM_MODELS_CACHE_NAMESPACE)
+    if not cache.add(SYNC_LOCK_KEY, os.getpid(), ttl=SYNC_LOCK_SECONDS):
+        return False
+    try:
+        sync_system_models(force=force)
+        return True
+    finally:
+        cache.invalidate(SYNC_LOCK_KEY)
+
+def start_system_model_refresher(app):
+    """
+    启动后台线程定期同步系统模型（每个进程只启动一次）。
+    各进程的线程每个周期竞争 REFRESH_DUE_KEY，只有抢到的进程执行同步。
+    模型列表页面只读数据库，不再在请求中同步。
+    """
+    global _refresher_thread
+    if _refresher_thread is not None:
+        return
+    with _refresher_lock:
+        if _refresher_thread is not None:
+            return
+        interval = int(app.config.get('SYSTEM_MODELS_REFRESH_SECONDS', 600))
+        if interval <= 0:
+            return
+
+        def refresh_loop():
+            with app.app_context():
+                while True:
+                    try:
+                        if get_cache(SYSTEM_MODELS_CACHE_NAMESPACE).add(REFRESH_DUE_KEY, os.getpid(), ttl=interval):
+                            _sync_system_models_exclusive()
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error(f"后台同步系统模型失败: {e}")
+                    finally:
+                        db.session.remove()
+                    time.sleep(interval)
+
+        _refresher_thread = threading.Thread(target=refresh_loop, name='system-model-refresher', daemon=True)
+        _refresher_thread.start()
+
+def ensure_initial_system_models():
+    """
+    数据库中还没有系统模型时（新部署）同步执行一次同步，避免后台刷新完成前页面上没有系统模型。
+    每个进程只尝试一次；其他进程正在同步时最多等待 INITIAL_SYNC_WAIT_SECONDS 秒。
+    """
+    global _initial_sync_attempted
+    if _initial_sync_attempted:
+        return
+    _initial_sync_attempted = True
+    if AIModel.query.filter_by(is_system_model=True).first() is not None:
+        return
+    try:
+        if _sync_system_models_exclusive(force=True):
+            return
+        cache = get_cache(SYSTEM_MODELS_CACHE_NAMESPACE)
+        deadline = time.monotonic() + INITIAL_SYNC_WAIT_SECONDS
+        while cache.get(SYNC_LOCK_KEY) is not None and time.monotonic() < deadline:
+            time.sleep(0.5)
+        # 结束当前事务，随后的查询才能读到其他进程刚写入的模型
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"首次同步系统模型失败: {e}")
 
 def get_all_models_for_user(user):
     """Returns all models, with user-defined models listed first, then system models."""
-    sync_system_models() # Ensure system models are up-to-date before fetching
-    
-    query = AIModel.query.order_by(AIModel.is_system_model.asc(), AIModel.display_name.asc())
-    
+    ensure_initial_system_models()
     if user.is_authenticated:
         user_custom_models = AIModel.query.filter_by(user_id=user.id, is_system_model=False).order_by(AIModel.display_name.asc()).all()
         all_system_models = AIModel.query.filter_by(is_system_model=True).order_by(AIModel.display_name.asc()).all()
@@ -283,7 +420,7 @@ class ModelService:
 
             try:
                 start_time = time.time()
-                response = requests.get(validation_url, headers=headers, timeout=10)
+                response = get_http_session(validation_url).get(validation_url, headers=headers, timeout=10)
                 response_time = time.time() - start_time
 
                 if response.status_code == 200:
@@ -366,7 +503,7 @@ def validate_model_connectivity(model):
         validation_url = f"{base_url_to_use.rstrip('/')}/models"
         
         try:
-            response = requests.get(validation_url, headers=headers, timeout=10)
+            response = get_http_session(validation_url).get(validation_url, headers=headers, timeout=10)
             current_validation_status = False
             if response.status_code == 200:
                 try:
@@ -0,0 +1,191 @@
+"""
+批量性能评估调度工具
+
+- 每个测试配置在独立子进程中执行，拥有独立的超时时间
+- 配置之间根据被测端点的在途请求数自适应冷却，而不是固定 sleep
+- 按模型端点分组，不同端点之间可以并发执行
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from app.services.perf_channel import EVENT_PROGRESS
+from app.utils.http_clients import get_http_session
+
+# 单个测试配置的默认超时时间（15分钟）
+DEFAULT_CONFIG_TIMEOUT_SECONDS = 15 * 60
+# 自适应冷却：最短等待、最长等待、探测间隔（秒）
+COOLDOWN_MIN_SECONDS = 2
+COOLDOWN_MAX_SECONDS = 120
+COOLDOWN_POLL_INTERVAL_SECONDS = 2
+# 端点不提供 /metrics 时回退的固定冷却时间（秒）
+COOLDOWN_FALLBACK_SECONDS = 5
+
+# 常见推理服务暴露的在途/排队请求数指标（Prometheus 格式）
+INFLIGHT_METRIC_NAMES = (
+    'vllm:num_requests_running',
+    'vllm:num_requests_waiting',
+    'sglang:num_running_reqs',
+    'sglang:num_queue_reqs',
+    'tgi_queue_size',
+    'tgi_batch_current_size',
+)
+
+logger = logging.getLogger(__name__)
+
+# 当前进程中正在执行的配置子进程
+_active_processes = set()
+_active_lock = threading.Lock()
+
+
+def get_metrics_url(api_base_url: str) -> str:
+    """根据模型API地址推导 Prometheus 指标地址（http://host:port/metrics）"""
+    parsed = urlparse(api_base_url)
+    return f"{parsed.scheme}://{parsed.netloc}/metrics"
+
+
+def get_inflight_requests(metrics_url: str, api_key: Optional[str] = None, timeout: int = 5) -> Optional[int]:
+    """
+    读取端点当前的在途请求数
+
+    Returns:
+        Optional[int]: 在途+排队请求数；端点不支持或读取失败返回None
+    """
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    try:
+        response = get_http_session(metrics_url).get(metrics_url, headers=headers, timeout=timeout)
+        if response.status_code != 200:
+            return None
+    except requests.exceptions.RequestException:
+        return None
+
+    total = 0.0
+    found = False
+    for line in response.text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name = line.split('{', 1)[0].split(' ', 1)[0]
+        if name in INFLIGHT_METRIC_NAMES:
+            try:
+                total += float(line.rsplit(' ', 1)[-1])
+                found = True
+            except ValueError:
+                continue
+    return int(total) if found else None
+
+
+def wait_for_endpoint_drain(api_base_url: str, api_key: Optional[str] = None,
+                            min_seconds: float = COOLDOWN_MIN_SECONDS,
+                            max_seconds: float = COOLDOWN_MAX_SECONDS,
+                            sleep: Callable[[float], None] = time.sleep) -> float:
+    """
+    等待端点的在途请求排空后再开始下一个配置
+
+    Returns:
+        float: 实际等待的秒数
+    """
+    start = time.time()
+    metrics_url = get_metrics_url(api_base_url)
+    sleep(min_seconds)
+
+    inflight = get_inflight_requests(metrics_url, api_key)
+    if inflight is None:
+        # 端点不支持指标探测，回退到固定冷却
+        sleep(max(0.0, COOLDOWN_FALLBACK_SECONDS - min_seconds))
+        return time.time() - start
+
+    while inflight and time.time() - start < max_seconds:
+        logger.info(f"端点 {api_base_url} 仍有 {inflight} 个在途请求，等待排空")
+        sleep(COOLDOWN_POLL_INTERVAL_SECONDS)
+        inflight = get_inflight_requests(metrics_url, api_key)
+    return time.time() - start
+
+
+def run_with_timeout(target: Callable, args: Tuple, timeout_seconds: float,
+                     on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[str, Any]:
+    """
+    在子进程中执行 target(*args, conn)，target 需通过 conn.send((status, payload)) 返回结果
+
+    子进程执行过程中可以多次发送 (EVENT_PROGRESS, 样本)，由调度进程转交给 on_progress。
+    子进程只写自己独占的管道，超时被强制结束时不会破坏其他进程共享的结果通道。
+
+    Returns:
+        Tuple[str, Any]: ('success'|'failed'|'timeout', 结果或错误信息)
+    """
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=target, args=tuple(args) + (child_conn,))
+    process.start()
+    with _active_lock:
+        _active_processes.add(process)
+    # 关闭父进程持有的写端，子进程退出后 recv 才能感知 EOF
+    child_conn.close()
+
+    deadline = time.monotonic() + timeout_seconds
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not parent_conn.poll(remaining):
+                process.terminate()
+                return 'timeout', f"测试配置执行超时（{int(timeout_seconds)}秒）"
+            try:
+                status, payload = parent_conn.recv()
+            except (EOFError, OSError, pickle.UnpicklingError):
+                process.join(timeout=5)
+                return 'failed', f"测试配置进程异常退出 (exitcode={process.exitcode})"
+            if status != EVENT_PROGRESS:
+                return status, payload
+            if on_progress is not None:
+                try:
+                    on_progress(payload)
+                except Exception as e:
+                    logger.warning(f"转发测试配置进度失败: {e}")
+    finally:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        with _active_lock:
+            _active_processes.discard(process)
+        parent_conn.close()
+
+
+def install_termination_handler() -> None:
+    """调度进程收到 SIGTERM（用户中止）时，先结束正在执行的配置子进程再退出"""
+    owner_pid = os.getpid()
+
+    def handler(signum, frame):
+        # fork 出的配置子进程会继承该处理函数和 _active_processes 的副本（其中是兄弟进程，
+        # 不能对其调用 is_alive），配置子进程自身收到 SIGTERM 时直接退出
+        if os.getpid() != owner_pid:
+            os._exit(128 + signum)
+        # 信号可能打断正持有 _active_lock 的线程，这里不能加锁；复制集合失败（集合正被修改）时重试
+        processes = []
+        for _ in range(3):
+            try:
+                processes = list(_active_processes)
+                break
+            except RuntimeError:
+                continue
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        os._exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+def group_jobs_by_endpoint(jobs: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """按模型端点分组，保持原有顺序；同一端点的配置必须串行执行"""
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(job['api_base_url'], []).append(job)
+    return list(groups.values())
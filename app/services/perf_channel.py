@@ -0,0 +1,137 @@
+"""
+性能评估工作进程与Web层之间的结果通道
+
+工作进程通过 multiprocessing.Queue 主动推送事件（开始、单请求进度、最终结果、错误），
+监控线程阻塞等待事件，不再依赖临时pickle文件和定时轮询。
+"""
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, Optional
+
+# 事件类型
+EVENT_STARTED = 'started'
+EVENT_PROGRESS = 'progress'
+EVENT_COMPLETED = 'completed'
+EVENT_ERROR = 'error'
+EVENT_CONFIG_COMPLETED = 'config_completed'
+
+logger = logging.getLogger(__name__)
+
+
+class PerfResultChannel:
+    """工作进程 -> 监控线程 的单向事件通道"""
+
+    def __init__(self):
+        self._queue = multiprocessing.Queue()
+
+    def send(self, event_type: str, **payload) -> None:
+        """发送一个事件，通道异常不影响评估本身"""
+        event = {'type': event_type, 'ts': time.time()}
+        event.update(payload)
+        try:
+            self._queue.put(event)
+        except Exception as e:
+            logger.warning(f"性能评估事件发送失败 ({event_type}): {e}")
+
+    def started(self, **info) -> None:
+        self.send(EVENT_STARTED, **info)
+
+    def progress(self, **sample) -> None:
+        self.send(EVENT_PROGRESS, **sample)
+
+    def completed(self, result: Any, kind: str = 'single') -> None:
+        self.send(EVENT_COMPLETED, result=result, kind=kind)
+
+    def error(self, message: str) -> None:
+        self.send(EVENT_ERROR, message=message)
+
+    def config_completed(self, entry: Dict[str, Any]) -> None:
+        """批量任务中单个测试配置执行结束（成功、失败或超时）"""
+        self.send(EVENT_CONFIG_COMPLETED, entry=entry)
+
+    def receive(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """阻塞等待下一个事件，超时返回None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        try:
+            self._queue.close()
+            self._queue.join_thread()
+        except Exception:
+            pass
+
+
+class PipeProgressChannel:
+    """
+    批量任务配置子进程 -> 调度进程 的进度管道
+
+    配置子进程超时会被强制结束，不能直接写共享的 multiprocessing.Queue（可能写坏队列或遗留锁）；
+    进度改写到该子进程独占的管道，由调度进程转发到结果通道。只支持 progress 事件。
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def progress(self, **sample) -> None:
+        try:
+            self._conn.send((EVENT_PROGRESS, sample))
+        except Exception as e:
+            logger.warning(f"性能评估进度发送失败: {e}")
+
+
+def chunk_gaps(chunk_times) -> list:
+    """相邻两个内容块的时间间隔（秒），即逐个 token 间隔（ITL）"""
+    chunk_times = list(chunk_times or [])
+    return [later - earlier for earlier, later in zip(chunk_times, chunk_times[1:])]
+
+
+def benchmark_data_to_sample(benchmark_data) -> Dict[str, Any]:
+    """
+    将 evalscope 的 BenchmarkData 转换为可跨进程传输的单请求样本
+
+    itl 为该请求所有 token 间隔的列表，由 chunk_times 计算（各版本 evalscope 都有该字段）。
+    evalscope 的 completed_time 来自 time.perf_counter()，不能与墙上时间比较，
+    样本的 completed_at 取转换时的 time.time()（在请求统计完成时立即调用）。
+    """
+    return {
+        'success': bool(getattr(benchmark_data, 'success', False)),
+        'latency': getattr(benchmark_data, 'query_latency', None),
+        'ttft': getattr(benchmark_data, 'first_chunk_latency', None),
+        'tpot': getattr(benchmark_data, 'time_per_output_token', None),
+        'itl': chunk_gaps(getattr(benchmark_data, 'chunk_times', None)),
+        'input_tokens': getattr(benchmark_data, 'prompt_tokens', None),
+        'output_tokens': getattr(benchmark_data, 'completion_tokens', None),
+        'completed_at': time.time(),
+    }
+
+
+def install_progress_hook(channel: PerfResultChannel) -> bool:
+    """
+    在工作进程内包装 evalscope 的 BenchmarkMetrics.update_metrics，
+    每统计完一个请求就把样本推送到通道。只影响当前（子）进程。
+
+    Returns:
+        bool: 是否成功安装
+    """
+    try:
+        from evalscope.perf.utils.benchmark_util import BenchmarkMetrics
+    except ImportError:
+        return False
+
+    original = getattr(BenchmarkMetrics, 'update_metrics', None)
+    if original is None or getattr(original, '_perf_channel_hooked', False):
+        return False
+
+    def update_metrics(self, benchmark_data, *args, **kwargs):
+        result = original(self, benchmark_data, *args, **kwargs)
+        channel.progress(**benchmark_data_to_sample(benchmark_data))
+        return result
+
+    update_metrics._perf_channel_hooked = True
+    BenchmarkMetrics.update_metrics = update_metrics
+    return True
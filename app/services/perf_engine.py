@@ -0,0 +1,464 @@
+"""
+内置性能压测引擎（asyncio + httpx）
+
+可替代 evalscope 的 run_perf_benchmark：
+- 连接池复用 + keep-alive，安装 h2 时对 https 端点启用 HTTP/2
+- 闭环模式：固定并发数，请求完成后立即发下一个
+- 开环模式：按泊松过程以固定速率（rate，请求/秒）到达，延迟从计划到达时刻起算，能体现排队延迟
+- 每个请求的时间戳记录在紧凑的 array 中，最终输出与 run_perf_benchmark 相同键名的
+  (summary, percentiles) 结果，沿用现有的文本转换与展示逻辑
+- num_workers > 1 时把并发数与请求数切分到多个进程，父进程合并各分片的记录后统一汇总
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import threading
+import time
+from array import array
+from itertools import cycle, islice
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from evalscope.perf.utils.benchmark_util import Metrics
+from evalscope.perf.utils.db_util import PercentileMetrics
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+ENGINE_EVALSCOPE = 'evalscope'
+ENGINE_NATIVE = 'native'
+SUPPORTED_ENGINES = (ENGINE_EVALSCOPE, ENGINE_NATIVE)
+
+# 内置引擎专用参数，交给 evalscope 前需要剔除（rate 两个引擎都支持）
+NATIVE_ENGINE_KEYS = ('engine', 'request_timeout', 'num_workers')
+
+# 与 evalscope 一致的分位点
+PERCENTILES = (10, 25, 50, 66, 75, 80, 90, 95, 98, 99)
+# 单个请求的默认读取超时（秒）
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 600
+
+AVERAGE_QUEUEING_DELAY = 'Average queueing delay (s)'
+
+logger = logging.getLogger(__name__)
+
+
+def validate_engine_options(engine: Optional[str], num_workers: Optional[int]) -> Optional[str]:
+    """检查压测引擎与进程数的组合，返回错误信息，合法时返回None（evalscope 引擎不支持多进程分片）"""
+    if engine and engine not in SUPPORTED_ENGINES:
+        return f"不支持的压测引擎: {engine}"
+    if (num_workers or 1) > 1 and engine != ENGINE_NATIVE:
+        return "num_workers 大于1（多进程分片）只支持内置引擎，请同时指定 engine 为 native"
+    return None
+
+
+class RequestRecorder:
+    """按请求序号记录时间戳与token数，全部使用 array 存储以降低内存占用"""
+
+    def __init__(self):
+        self.scheduled = array('d')      # 计划到达时刻（闭环模式等于发送时刻）
+        self.sent = array('d')           # 实际发送时刻
+        self.first_token = array('d')    # 首个内容块到达时刻，无内容为0
+        self.finished = array('d')       # 完成时刻
+        self.input_tokens = array('l')
+        self.output_tokens = array('l')
+        self.chunks = array('l')
+        self.success = array('b')
+        self.inter_chunk = array('d')    # 所有请求的块间延迟（扁平存储）
+
+    FIELDS = ('scheduled', 'sent', 'first_token', 'finished', 'input_tokens',
+              'output_tokens', 'chunks', 'success', 'inter_chunk')
+
+    def __len__(self):
+        return len(self.finished)
+
+    def to_payload(self) -> Dict[str, bytes]:
+        """序列化为原始字节，便于分片进程通过管道回传"""
+        return {field: getattr(self, field).tobytes() for field in self.FIELDS}
+
+    def merge_payload(self, payload: Dict[str, bytes]) -> None:
+        """合并另一个分片的记录"""
+        for field in self.FIELDS:
+            getattr(self, field).frombytes(payload[field])
+
+    def record(self, scheduled: float, sent: float, first_token: float, finished: float,
+               input_tokens: int, output_tokens: int, chunks: int, success: bool,
+               inter_chunk: List[float]) -> None:
+        self.scheduled.append(scheduled)
+        self.sent.append(sent)
+        self.first_token.append(first_token)
+        self.finished.append(finished)
+        self.input_tokens.append(input_tokens)
+        self.output_tokens.append(output_tokens)
+        self.chunks.append(chunks)
+        self.success.append(1 if success else 0)
+        if success:
+            self.inter_chunk.extend(inter_chunk)
+
+
+def _parse_sse_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析一行 SSE 数据，返回 chunk；结束标记或非数据行返回None"""
+    if not line.startswith('data:'):
+        return None
+    payload = line[5:].strip()
+    if not payload or payload == '[DONE]':
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class NativeLoadGenerator:
+    """基于 asyncio/httpx 的负载生成器"""
+
+    def __init__(self, url: str, model: str, api_key: Optional[str], messages: List[List[Dict]],
+                 number: int, parallel: int = 1, rate: Optional[float] = None,
+                 max_tokens: Optional[int] = None, min_tokens: Optional[int] = None,
+                 extra_args: Optional[Dict[str, Any]] = None,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT_SECONDS,
+                 on_sample: Optional[Callable[[Dict[str, Any]], None]] = None):
+        if not messages:
+            raise ValueError("数据集中没有可用的请求消息")
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.messages = messages
+        self.number = number
+        self.parallel = max(1, parallel or 1)
+        self.rate = rate if rate and rate > 0 else None
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.extra_args = extra_args or {}
+        self.request_timeout = request_timeout
+        self.on_sample = on_sample
+        self.recorder = RequestRecorder()
+
+    def _build_body(self, messages: List[Dict]) -> Dict[str, Any]:
+        body = {
+            'model': self.model,
+            'messages': messages,
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        if self.max_tokens is not None:
+            body['max_tokens'] = self.max_tokens
+        if self.min_tokens is not None:
+            body['min_tokens'] = self.min_tokens
+        body.update(self.extra_args)
+        return body
+
+    async def _send(self, client: httpx.AsyncClient, messages: List[Dict], scheduled: float) -> None:
+        sent = time.time()
+        first_token = 0.0
+        last_chunk = 0.0
+        inter_chunk = []
+        chunks = 0
+        usage = {}
+        success = False
+        try:
+            async with client.stream('POST', self.url, json=self._build_body(messages)) as response:
+                if response.status_code == 200:
+                    async for line in response.aiter_lines():
+                        chunk = _parse_sse_line(line)
+                        if chunk is None:
+                            continue
+                        if chunk.get('usage'):
+                            usage = chunk['usage']
+                        choices = chunk.get('choices') or []
+                        delta = (choices[0].get('delta') or {}) if choices else {}
+                        if delta.get('content') or delta.get('reasoning_content'):
+                            now = time.time()
+                            if chunks == 0:
+                                first_token = now
+                            else:
+                                inter_chunk.append(now - last_chunk)
+                            last_chunk = now
+                            chunks += 1
+                    success = chunks > 0
+                else:
+                    await response.aread()
+                    logger.warning(f"请求失败: HTTP {response.status_code} {response.text[:200]}")
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            logger.warning(f"请求异常: {e}")
+
+        finished = time.time()
+        input_tokens = usage.get('prompt_tokens') or 0
+        # 端点不返回 usage 时以内容块数近似输出token数
+        output_tokens = usage.get('completion_tokens') or chunks
+        self.recorder.record(scheduled, sent, first_token, finished, input_tokens, output_tokens,
+                             chunks, success, inter_chunk)
+
+        if self.on_sample:
+            self.on_sample({
+                'success': success,
+                'latency': finished - scheduled,
+                'ttft': (first_token - scheduled) if first_token else None,
+                'tpot': ((finished - first_token) / (output_tokens - 1)) if first_token and output_tokens > 1 else None,
+                'itl': list(inter_chunk),
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'completed_at': finished,
+            })
+
+    async def _closed_loop(self, client: httpx.AsyncClient) -> None:
+        """闭环：parallel 个协程各自串行发送，直到达到请求总数"""
+        source = iter(islice(cycle(self.messages), self.number))
+
+        async def worker():
+            for messages in source:
+                await self._send(client, messages, time.time())
+
+        await asyncio.gather(*(worker() for _ in range(min(self.parallel, self.number))))
+
+    async def _open_loop(self, client: httpx.AsyncClient) -> None:
+        """开环：按泊松过程到达，parallel 作为在途请求上限，超出的请求排队等待"""
+        semaphore = asyncio.Semaphore(self.parallel)
+        tasks = []
+
+        async def guarded(messages, scheduled):
+            async with semaphore:
+                await self._send(client, messages, scheduled)
+
+        next_arrival = time.time()
+        for messages in islice(cycle(self.messages), self.number):
+            delay = next_arrival - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(guarded(messages, next_arrival)))
+            next_arrival += random.expovariate(self.rate)
+        await asyncio.gather(*tasks)
+
+    async def run(self) -> RequestRecorder:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        limits = httpx.Limits(max_connections=self.parallel, max_keepalive_connections=self.parallel)
+        timeout = httpx.Timeout(self.request_timeout, connect=30.0)
+
+        async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=limits, timeout=timeout, headers=headers) as client:
+            if self.rate:
+                await self._open_loop(client)
+            else:
+                await self._closed_loop(client)
+        return self.recorder
+
+
+def _percentile_values(values: List[float]) -> List[Optional[float]]:
+    if not values:
+        return [None] * len(PERCENTILES)
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return [round(ordered[min(last, int(p / 100 * len(ordered)))], 4) for p in PERCENTILES]
+
+
+def summarize_recorder(recorder: RequestRecorder, parallel: int, rate: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, List]]:
+    """将请求记录汇总为与 run_perf_benchmark 相同结构的 (summary, percentiles)"""
+    ok = [i for i in range(len(recorder)) if recorder.success[i]]
+    total = len(recorder)
+    elapsed = (max(recorder.finished) - min(recorder.scheduled)) if total else 0.0
+
+    latency = [recorder.finished[i] - recorder.scheduled[i] for i in ok]
+    ttft = [recorder.first_token[i] - recorder.scheduled[i] for i in ok]
+    tpot = [(recorder.finished[i] - recorder.first_token[i]) / (recorder.output_tokens[i] - 1)
+            for i in ok if recorder.output_tokens[i] > 1]
+    queueing = [recorder.sent[i] - recorder.scheduled[i] for i in ok]
+    input_tokens = [recorder.input_tokens[i] for i in ok]
+    output_tokens = [recorder.output_tokens[i] for i in ok]
+    output_tp = [output_tokens[n] / latency[n] for n in range(len(ok)) if latency[n] > 0]
+    total_tp = [(input_tokens[n] + output_tokens[n]) / latency[n] for n in range(len(ok)) if latency[n] > 0]
+    chunks = [recorder.chunks[i] for i in ok]
+
+    def mean(values):
+        return round(sum(values) / len(values), 4) if values else 0.0
+
+    span = elapsed or 1e-6
+    summary = {
+        Metrics.TIME_TAKEN_FOR_TESTS: round(elapsed, 4),
+        Metrics.NUMBER_OF_CONCURRENCY: parallel,
+        Metrics.TOTAL_REQUESTS: total,
+        Metrics.SUCCEED_REQUESTS: len(ok),
+        Metrics.FAILED_REQUESTS: total - len(ok),
+        Metrics.OUTPUT_TOKEN_THROUGHPUT: round(sum(output_tokens) / span, 4),
+        Metrics.TOTAL_TOKEN_THROUGHPUT: round((sum(input_tokens) + sum(output_tokens)) / span, 4),
+        Metrics.REQUEST_THROUGHPUT: round(len(ok) / span, 4),
+        Metrics.AVERAGE_LATENCY: mean(latency),
+        Metrics.AVERAGE_TIME_TO_FIRST_TOKEN: mean(ttft),
+        Metrics.AVERAGE_TIME_PER_OUTPUT_TOKEN: mean(tpot),
+        Metrics.AVERAGE_INPUT_TOKENS_PER_REQUEST: mean(input_tokens),
+        Metrics.AVERAGE_OUTPUT_TOKENS_PER_REQUEST: mean(output_tokens),
+        Metrics.AVERAGE_PACKAGE_LATENCY: mean(recorder.inter_chunk),
+        Metrics.AVERAGE_PACKAGE_PER_REQUEST: mean(chunks),
+    }
+    if rate:
+        summary[AVERAGE_QUEUEING_DELAY] = mean(queueing)
+
+    percentiles = {
+        PercentileMetrics.PERCENTILES: [f'{p}%' for p in PERCENTILES],
+        PercentileMetrics.TTFT: _percentile_values(ttft),
+        PercentileMetrics.ITL: _percentile_values(list(recorder.inter_chunk)),
+        PercentileMetrics.TPOT: _percentile_values(tpot),
+        PercentileMetrics.LATENCY: _percentile_values(latency),
+        PercentileMetrics.INPUT_TOKENS: _percentile_values(input_tokens),
+        PercentileMetrics.OUTPUT_TOKENS: _percentile_values(output_tokens),
+        PercentileMetrics.OUTPUT_THROUGHPUT: _percentile_values(output_tp),
+        PercentileMetrics.TOTAL_THROUGHPUT: _percentile_values(total_tp),
+    }
+    return summary, percentiles
+
+
+def strip_native_keys(task_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉内置引擎专用参数，得到可直接传给 run_perf_benchmark 的配置"""
+    return {k: v for k, v in task_cfg.items() if k not in NATIVE_ENGINE_KEYS}
+
+
+def load_messages(task_cfg: Dict[str, Any]) -> List[List[Dict]]:
+    """复用 evalscope 的数据集插件（含 CustomDatasetPlugin）构建请求消息"""
+    from evalscope.perf.arguments import Arguments
+    from evalscope.perf.plugin.registry import DatasetRegistry
+
+    args = Arguments(**strip_native_keys(task_cfg))
+    plugin = DatasetRegistry(args.dataset)(args)
+    return list(islice(plugin.build_messages(), task_cfg.get('number') or 1))
+
+
+def _split_evenly(total: int, parts: int) -> List[int]:
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def _run_shard(generator_kwargs: Dict[str, Any], conn) -> None:
+    """分片进程入口：执行自己那一份负载，把记录以原始字节回传"""
+    try:
+        recorder = asyncio.run(NativeLoadGenerator(**generator_kwargs).run())
+        conn.send(('success', recorder.to_payload()))
+    except Exception as e:
+        conn.send(('failed', str(e)))
+    finally:
+        conn.close()
+
+
+def _install_shard_termination_handler(shards: List[Tuple[Any, Any]]):
+    """
+    压测进程收到 SIGTERM（用户中止、批量配置超时）时先结束并回收分片进程再退出，
+    否则分片进程会继续压测端点。只能在主线程安装，返回原来的处理函数
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    owner_pid = os.getpid()
+
+    def handler(signum, frame):
+        # fork 出的分片进程会继承该处理函数，分片自身收到 SIGTERM 时直接退出
+        if os.getpid() != owner_pid:
+            os._exit(128 + signum)
+        for process, _ in shards:
+            if process.is_alive():
+                process.terminate()
+        for process, _ in shards:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        os._exit(128 + signum)
+
+    return signal.signal(signal.SIGTERM, handler)
+
+
+def run_sharded(generator_kwargs: Dict[str, Any], num_workers: int) -> RequestRecorder:
+    """
+    把一个逻辑压测任务切分到 num_workers 个进程执行并合并记录
+
+    每个分片分得一部分并发数与请求数；开环模式下速率按分片均分（独立泊松过程叠加后仍为同速率的泊松过程）。
+    """
+    parallel = generator_kwargs['parallel']
+    number = generator_kwargs['number']
+    num_workers = max(1, min(num_workers, parallel, number))
+    messages = generator_kwargs['messages']
+    rate = generator_kwargs.get('rate')
+
+    shards = []
+    previous_handler = _install_shard_termination_handler(shards)
+    merged = RequestRecorder()
+    errors = []
+    try:
+        for i, (shard_parallel, shard_number) in enumerate(zip(_split_evenly(parallel, num_workers),
+                                                              _split_evenly(number, num_workers))):
+            kwargs = dict(generator_kwargs)
+            kwargs.update(
+                parallel=shard_parallel,
+                number=shard_number,
+                rate=(rate / num_workers) if rate else None,
+                # 错开各分片的起始样本，避免同时发送相同的请求
+                messages=messages[i::num_workers] or messages,
+            )
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            # daemon：压测进程异常退出时分片随之结束
+            process = multiprocessing.Process(target=_run_shard, args=(kwargs, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            shards.append((process, parent_conn))
+        pending = {conn: process for process, conn in shards}
+        while pending:
+            for conn in wait(list(pending)):
+                process = pending.pop(conn)
+                try:
+                    status, payload = conn.recv()
+                except EOFError:
+                    process.join(timeout=5)
+                    status, payload = 'failed', f"分片进程异常退出 (exitcode={process.exitcode})"
+                if status == 'success':
+                    merged.merge_payload(payload)
+                else:
+                    errors.append(payload)
+    finally:
+        for process, conn in shards:
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=5)
+            conn.close()
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    if errors:
+        raise RuntimeError(f"{len(errors)}/{len(shards)} 个压测分片失败: {errors[0]}")
+    return merged
+
+
+def run_native_benchmark(task_cfg: Dict[str, Any],
+                         on_sample: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[Dict[str, Any], Dict[str, List]]:
+    """
+    使用内置引擎执行压测，参数与 run_perf_benchmark 的 task_cfg 一致，额外支持：
+        - rate: 开环模式的到达速率（请求/秒），不设置为闭环模式
+        - request_timeout: 单个请求超时（秒）
+        - num_workers: 压测进程数，大于1时按进程切分并发数与请求数（上限为CPU核数）
+
+    Returns:
+        Tuple[Dict, Dict]: (summary, percentiles)
+    """
+    generator_kwargs = dict(
+        url=task_cfg['url'],
+        model=task_cfg['model'],
+        api_key=task_cfg.get('api_key'),
+        messages=load_messages(task_cfg),
+        number=task_cfg.get('number') or 1,
+        parallel=task_cfg.get('parallel') or 1,
+        rate=task_cfg.get('rate'),
+        max_tokens=task_cfg.get('max_tokens'),
+        min_tokens=task_cfg.get('min_tokens'),
+        extra_args=task_cfg.get('extra_args'),
+        request_timeout=task_cfg.get('request_timeout') or DEFAULT_REQUEST_TIMEOUT_SECONDS,
+        on_sample=on_sample,
+    )
+    num_workers = min(int(task_cfg.get('num_workers') or 1), os.cpu_count() or 1)
+    if num_workers > 1:
+        recorder = run_sharded(generator_kwargs, num_workers)
+    else:
+        recorder = asyncio.run(NativeLoadGenerator(**generator_kwargs).run())
+    rate = task_cfg.get('rate')
+    return summarize_recorder(recorder, generator_kwargs['parallel'], rate if rate and rate > 0 else None)
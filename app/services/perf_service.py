@@ -1,12 +1,10 @@
 from flask import current_app
 from app import db
-from app.models import PerformanceEvalTask, AIModel, Dataset
+from app.models import PerformanceEvalTask, PerformanceEvalResult, PerfTelemetrySnapshot, AIModel, Dataset
 from app.utils import get_beijing_time
 import multiprocessing
-import tempfile
 import os
 import traceback
-import pickle
 import signal
 import time
 import re
@@ -20,6 +18,62 @@ from evalscope.perf.main import run_perf_benchmark
 
 # 导入自定义数据集插件，确保装饰器能够正确注册
 from app.adapter.custom_dataset_plugin import CustomDatasetPlugin
+from app.services.perf_channel import (
+    PerfResultChannel, PipeProgressChannel, install_progress_hook,
+    EVENT_STARTED, EVENT_PROGRESS, EVENT_COMPLETED, EVENT_ERROR, EVENT_CONFIG_COMPLETED
+)
+from app.services.perf_telemetry import (
+    SlidingWindowTelemetry, TELEMETRY_FLUSH_INTERVAL_SECONDS, TELEMETRY_MAX_SNAPSHOTS
+)
+from app.services.perf_sketch import MetricSketches
+from app.services.perf_engine import (
+    ENGINE_NATIVE, run_native_benchmark, strip_native_keys, validate_engine_options
+)
+from app.services.perf_batch_scheduler import (
+    DEFAULT_CONFIG_TIMEOUT_SECONDS, COOLDOWN_MAX_SECONDS,
+    wait_for_endpoint_drain, run_with_timeout, group_jobs_by_endpoint, install_termination_handler
+)
+
+# 单个性能评估任务的执行超时时间（15分钟）
+PERF_TASK_TIMEOUT_SECONDS = 15 * 60
+
+# 汇总指标 -> 结构化结果表列名
+SUMMARY_RESULT_COLUMNS = {
+    Metrics.TIME_TAKEN_FOR_TESTS: 'time_taken',
+    Metrics.TOTAL_REQUESTS: 'total_requests',
+    Metrics.SUCCEED_REQUESTS: 'succeed_requests',
+    Metrics.FAILED_REQUESTS: 'failed_requests',
+    Metrics.OUTPUT_TOKEN_THROUGHPUT: 'output_token_throughput',
+    Metrics.TOTAL_TOKEN_THROUGHPUT: 'total_token_throughput',
+    Metrics.REQUEST_THROUGHPUT: 'request_throughput',
+    Metrics.AVERAGE_LATENCY: 'avg_latency',
+    Metrics.AVERAGE_TIME_TO_FIRST_TOKEN: 'avg_ttft',
+    Metrics.AVERAGE_TIME_PER_OUTPUT_TOKEN: 'avg_tpot',
+    Metrics.AVERAGE_INPUT_TOKENS_PER_REQUEST: 'avg_input_tokens',
+    Metrics.AVERAGE_OUTPUT_TOKENS_PER_REQUEST: 'avg_output_tokens',
+    Metrics.AVERAGE_PACKAGE_LATENCY: 'avg_package_latency',
+    Metrics.AVERAGE_PACKAGE_PER_REQUEST: 'avg_package_per_request',
+}
+# 分位数指标 -> 列名前缀，以及保存的分位点
+PERCENTILE_RESULT_COLUMNS = {
+    PercentileMetrics.TTFT: 'ttft',
+    PercentileMetrics.ITL: 'itl',
+    PercentileMetrics.TPOT: 'tpot',
+    PercentileMetrics.LATENCY: 'latency',
+}
+PERCENTILE_RESULT_POINTS = {'50%': 'p50', '90%': 'p90', '99%': 'p99'}
+# 可用于排行的指标及其"更好"的方向
+RANKING_METRICS = {
+    'output_token_throughput': 'max',
+    'total_token_throughput': 'max',
+    'request_throughput': 'max',
+    'avg_latency': 'min',
+    'avg_ttft': 'min',
+    'avg_tpot': 'min',
+    'ttft_p99': 'min',
+    'tpot_p99': 'min',
+    'latency_p99': 'min',
+}
 
 
 class PerformanceEvaluationService:
@@ -122,14 +176,14 @@ class PerformanceEvaluationService:
             return False, f"模型验证失败: {str(e)}"
 
     @staticmethod
-    def run_performance_eval_task_process(task_id: int, task_cfg: Dict[str, Any], output_file_path: str):
+    def run_performance_eval_task_process(task_id: int, task_cfg: Dict[str, Any], channel: PerfResultChannel):
         """
-        在独立进程中执行性能评估任务，并将结果元组直接保存到输出文件
+        在独立进程中执行性能评估任务，并通过结果通道推送事件
         
         Args:
             task_id: 评估任务ID (仅用于日志)
             task_cfg: 评估任务配置
-            output_file_path: 存储结果的临时文件路径
+            channel: 结果通道，用于向Web层推送开始/进度/结果/错误事件
         """
         # 获取一个标准的logger实例，用于在此独立进程中记录日志
         process_logger = logging.getLogger(f"perf_eval_process.{task_id}")
@@ -142,12 +196,14 @@ class PerformanceEvaluationService:
             
             # 设置总任务超时时间（15分钟）
             signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(15 * 60)  # 15分钟超时
+            signal.alarm(PERF_TASK_TIMEOUT_SECONDS)
+            
+            channel.started(pid=os.getpid(), engine=task_cfg.get('engine'))
             
             start_time = time.time()
             
-            # 直接调用run_perf_benchmark获取返回值
-            result_tuple = run_perf_benchmark(task_cfg)
+            # 执行压测，每完成一个请求推送一次进度
+            result_tuple = PerformanceEvaluationService.execute_benchmark(task_cfg, channel)
             
             # 取消超时信号
             signal.alarm(0)
@@ -155,18 +211,14 @@ class PerformanceEvaluationService:
             elapsed_time = time.time() - start_time
             process_logger.info(f"性能评估任务 {task_id} 执行耗时: {elapsed_time:.2f}秒")
             
-            # 将结果序列化到文件
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(result_tuple, f)
-                
-            process_logger.info(f"性能评估任务 {task_id} 已完成，结果已保存到 {output_file_path}")
+            channel.completed(result_tuple)
+            process_logger.info(f"性能评估任务 {task_id} 已完成，结果已推送")
             
         except TimeoutError:
             signal.alarm(0)
             error_msg = f"性能评估任务 {task_id} 执行超时（15分钟），可能是模型服务不可用"
             process_logger.error(error_msg)
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(("ERROR", error_msg), f)
+            channel.error(error_msg)
                 
         except Exception as e:
             signal.alarm(0)
@@ -180,22 +232,37 @@ class PerformanceEvaluationService:
                 
             process_logger.error(error_msg)
             process_logger.error(traceback.format_exc())
-            
-            # 将错误信息写入输出文件
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(("ERROR", error_msg), f)
+            channel.error(error_msg)
+
+        finally:
+            # 确保队列中的事件在进程退出前全部写出
+            channel.close()
+
+    @staticmethod
+    def execute_benchmark(task_cfg: Dict[str, Any], channel: PerfResultChannel) -> Any:
+        """按 task_cfg['engine'] 选择压测引擎（默认 evalscope），返回 (summary, percentiles)"""
+        # 多进程分片（num_workers）只有内置引擎支持，创建任务时已拒绝与 evalscope 组合
+        if task_cfg.get('engine') == ENGINE_NATIVE:
+            return run_native_benchmark(task_cfg, on_sample=lambda sample: channel.progress(**sample))
+        install_progress_hook(channel)
+        return run_perf_benchmark(strip_native_keys(task_cfg))
 
     @staticmethod
-    def update_task_from_output_file(app, task_id: int, output_file_path: str):
+    def update_task_from_channel(app, task_id: int, process: multiprocessing.Process, channel: PerfResultChannel,
+                                 max_wait_seconds: int = None):
         """
-        从输出文件中读取结果元组并更新任务
+        消费工作进程推送的事件并更新任务
         
         Args:
             app: Flask应用实例
             task_id: 评估任务ID
-            output_file_path: 结果文件路径
+            process: 执行评估的工作进程
+            channel: 结果通道
+            max_wait_seconds: 最长等待时间，默认与执行超时一致并留出余量
         """
+        max_wait_seconds = max_wait_seconds or PERF_TASK_TIMEOUT_SECONDS + 60
         with app.app_context():
+            task = None
             try:
                 # 获取任务
                 task = PerformanceEvalTask.query.get(task_id)
@@ -203,127 +270,363 @@ class PerformanceEvaluationService:
                     current_app.logger.error(f"找不到任务ID {task_id}")
                     return
                 
-                # 更新任务状态为running
-                task.status = 'running'
+                # 更新任务状态为running（启动前已被请求中止的任务保持aborting）
+                if task.status != 'aborting':
+                    task.status = 'running'
                 task.started_at = get_beijing_time()
                 db.session.commit()
                 
-                # 循环检查输出文件是否已完成
-                max_wait_time = 15 * 60  # 最长等待时间 (15分钟，与执行超时时间一致)
-                start_time = time.time()
+                deadline = time.time() + max_wait_seconds
+                telemetry = SlidingWindowTelemetry(start_seq=(task.live_metrics or {}).get('seq', 0))
+                sketches = MetricSketches()
+                last_flush = time.time()
                 
-                while time.time() - start_time < max_wait_time:
-                    # 进程是否仍在运行
-                    if output_file_path and os.path.exists(output_file_path):
-                        # 检查文件是否有内容
-                        if os.path.getsize(output_file_path) > 0:
-                            # 检查文件是否不再被写入 (1秒内大小不变)
-                            file_size = os.path.getsize(output_file_path)
-                            time.sleep(1)
-                            if file_size == os.path.getsize(output_file_path):
-                                # 读取结果
-                                try:
-                                    with open(output_file_path, 'rb') as f:
-                                        result = pickle.load(f)
-                                    
-                                    # 检查是否有错误
-                                    if isinstance(result, tuple) and len(result) == 2 and result[0] == "ERROR":
-                                        # 处理错误
-                                        task.status = 'failed'
-                                        task.error_message = result[1]
-                                        task.completed_at = get_beijing_time()
-                                        db.session.commit()
-                                        current_app.logger.error(f"性能评估任务 {task_id} 失败: {result[1]}")
-                                        return
-                                    
-                                    # 处理正常结果元组
-                                    if isinstance(result, tuple) and len(result) == 2:
-                                        summary, percentiles = result
-                                        
-                                        # 移除不需要的字段
-                                        if 'Result DB path' in summary:
-                                            del summary['Result DB path']
-                                        
-                                        # 性能评估汇总 - 转换为有序文本
-                                        summary_text = PerformanceEvaluationService._convert_summary_to_text(summary)
-                                        
-                                        # 百分位指标 - 转换为有序文本
-                                        percentile_text = PerformanceEvaluationService._convert_percentiles_to_text(percentiles)
-                                        
-                                        # 格式化原始输出以供查看
-                                        raw_output = f"Benchmarking summary:\n"
-                                        raw_output += "\n".join([f"{k}: {v}" for k, v in summary.items()]) + "\n\n"
-                                        raw_output += "Percentile results:\n"
-                                        # 格式化百分位结果
-                                        if percentiles and isinstance(percentiles, dict) and PercentileMetrics.PERCENTILES in percentiles:
-                                            headers = list(percentiles.keys())
-                                            for i in range(len(percentiles[PercentileMetrics.PERCENTILES])):
-                                                row = []
-                                                for h in headers:
-                                                    if i < len(percentiles[h]):
-                                                        row.append(f"{h}: {percentiles[h][i]}")
-                                                raw_output += ", ".join(row) + "\n"
-                                        
-                                        # 更新任务结果
-                                        task.summary_results = summary_text
-                                        task.percentile_results = percentile_text
-                                        task.raw_output = raw_output
-                                        task.status = 'completed'
-                                        task.completed_at = get_beijing_time()
-                                        db.session.commit()
-                                        
-                                        current_app.logger.info(f"性能评估任务 {task_id} 已完成")
-                                        return
-                                        
-                                    else:
-                                        # 结果格式不正确
-                                        task.status = 'failed'
-                                        task.error_message = f"不正确的结果格式: {result}"
-                                        task.completed_at = get_beijing_time()
-                                        db.session.commit()
-                                        return
-                                        
-                                except Exception as parse_error:
-                                    task.status = 'failed'
-                                    task.error_message = f"读取结果失败: {str(parse_error)}"
-                                    task.completed_at = get_beijing_time()
-                                    db.session.commit()
-                                    return
+                while time.time() < deadline:
+                    event = channel.receive(timeout=1.0)
                     
-                    time.sleep(5)  # 每5秒检查一次
-                
-                # 如果15分钟后还没有完成，标记为失败
-                if not task.status in ['completed', 'failed']:
-                    if os.path.exists(output_file_path) and os.path.getsize(output_file_path) == 0:
-                        task.status = 'failed'
-                        task.error_message = "评估过程异常终止，未生成输出文件"
-                        task.completed_at = get_beijing_time()
-                        db.session.commit()
-                        return
+                    # 定期写入遥测快照，并检查是否收到中止请求
+                    if time.time() - last_flush >= TELEMETRY_FLUSH_INTERVAL_SECONDS:
+                        last_flush = time.time()
+                        if PerformanceEvaluationService._flush_telemetry(task, telemetry):
+                            process.terminate()
+                            PerformanceEvaluationService._store_sketches(task, sketches)
+                            task.status = 'aborted'
+                            task.error_message = "任务已被用户中止"
+                            task.completed_at = get_beijing_time()
+                            db.session.commit()
+                            current_app.logger.info(f"性能评估任务 {task_id} 已中止")
+                            return
                     
-                    # 超时处理
-                    task.status = 'failed'
-                    task.error_message = "评估任务执行超时 (15分钟)"
-                    task.completed_at = get_beijing_time()
-                    db.session.commit()
+                    if event is None:
+                        # 进程已退出但没有推送最终事件，说明工作进程异常终止
+                        if not process.is_alive():
+                            event = channel.receive(timeout=0.5)
+                            if event is None:
+                                PerformanceEvaluationService._mark_task_failed(
+                                    task, f"评估进程异常终止 (exitcode={process.exitcode})，未返回结果")
+                                return
+                        else:
+                            continue
+                    
+                    event_type = event.get('type')
+                    if event_type == EVENT_STARTED:
+                        current_app.logger.info(f"性能评估任务 {task_id} 工作进程已启动 (pid={event.get('pid')})")
+                    elif event_type == EVENT_PROGRESS:
+                        telemetry.add(event)
+                        sketches.add_sample(event)
+                    elif event_type == EVENT_CONFIG_COMPLETED:
+                        BatchPerformanceEvaluationService.record_configuration_result(task, event.get('entry'))
+                    elif event_type == EVENT_ERROR:
+                        PerformanceEvaluationService._flush_telemetry(task, telemetry)
+                        PerformanceEvaluationService._store_sketches(task, sketches)
+                        PerformanceEvaluationService._mark_task_failed(task, event.get('message'))
+                        current_app.logger.error(f"性能评估任务 {task_id} 失败: {event.get('message')}")
+                        return
+                    elif event_type == EVENT_COMPLETED:
+                        PerformanceEvaluationService._flush_telemetry(task, telemetry)
+                        PerformanceEvaluationService._store_sketches(task, sketches)
+                        if event.get('kind') == 'batch':
+                            BatchPerformanceEvaluationService.apply_batch_results(task, event.get('result'))
+                        else:
+                            PerformanceEvaluationService.apply_benchmark_result(task, event.get('result'))
+                        current_app.logger.info(f"性能评估任务 {task_id} 已完成，共统计 {telemetry.total_requests} 个请求")
+                        return
+                
+                # 超时处理
+                PerformanceEvaluationService._mark_task_failed(task, f"评估任务执行超时 ({max_wait_seconds // 60}分钟)")
                     
             except Exception as e:
                 try:
-                    task.status = 'failed'
-                    task.error_message = str(e)
-                    task.completed_at = get_beijing_time()
-                    db.session.commit()
+                    db.session.rollback()
+                    if task is not None:
+                        PerformanceEvaluationService._mark_task_failed(task, str(e))
                 except Exception as update_error:
                     current_app.logger.error(f"更新任务状态失败: {update_error}")
                     
             finally:
-                # 清理临时文件
-                if output_file_path and os.path.exists(output_file_path):
-                    try:
-                        os.remove(output_file_path)
-                        current_app.logger.info(f"已清理临时输出文件: {output_file_path}")
-                    except Exception as cleanup_error:
-                        current_app.logger.warning(f"清理临时文件失败: {cleanup_error}")
+                # 回收工作进程，避免残留僵尸进程
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join(timeout=5)
+                channel.close()
+
+    @staticmethod
+    def apply_benchmark_result(task: PerformanceEvalTask, result: Any) -> None:
+        """将 run_perf_benchmark 的结果元组写入任务"""
+        if not (isinstance(result, (tuple, list)) and len(result) == 2):
+            PerformanceEvaluationService._mark_task_failed(task, f"不正确的结果格式: {result}")
+            return
+        
+        summary, percentiles = result
+        
+        # 移除不需要的字段
+        if 'Result DB path' in summary:
+            del summary['Result DB path']
+        
+        # 格式化原始输出以供查看
+        raw_output = f"Benchmarking summary:\n"
+        raw_output += "\n".join([f"{k}: {v}" for k, v in summary.items()]) + "\n\n"
+        raw_output += "Percentile results:\n"
+        # 格式化百分位结果
+        if percentiles and isinstance(percentiles, dict) and PercentileMetrics.PERCENTILES in percentiles:
+            headers = list(percentiles.keys())
+            for i in range(len(percentiles[PercentileMetrics.PERCENTILES])):
+                row = []
+                for h in headers:
+                    if i < len(percentiles[h]):
+                        row.append(f"{h}: {percentiles[h][i]}")
+                raw_output += ", ".join(row) + "\n"
+        
+        # 更新任务结果
+        task.summary_results = PerformanceEvaluationService._convert_summary_to_text(summary)
+        task.percentile_results = PerformanceEvaluationService._convert_percentiles_to_text(percentiles)
+        task.raw_output = raw_output
+        task.status = 'completed'
+        task.completed_at = get_beijing_time()
+        PerformanceEvaluationService.save_structured_results(task, [
+            PerformanceEvaluationService.build_structured_result(task, summary, percentiles)
+        ])
+        db.session.commit()
+
+    @staticmethod
+    def _to_number(value: Any) -> Optional[float]:
+        try:
+            return float(str(value).strip())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def build_structured_result(task: PerformanceEvalTask, summary: Dict[str, Any], percentiles: Dict[str, List],
+                                config_index: int = 0, config: Optional[Dict[str, Any]] = None) -> PerformanceEvalResult:
+        """把 (summary, percentiles) 转换为结构化结果行，batch 任务传入对应的测试配置"""
+        config = config or {}
+        row = PerformanceEvalResult(
+            task_id=task.id,
+            config_index=config_index,
+            user_id=task.user_id,
+            model_name=config.get('model_name') or task.model_name,
+            dataset_name=task.dataset_name,
+            completed_at=task.completed_at,
+            concurrency=config.get('concurrency', task.concurrency),
+            num_requests=config.get('num_requests', task.num_requests),
+            min_prompt_length=config.get('min_prompt_length'),
+            max_prompt_length=config.get('max_prompt_length'),
+            max_tokens=config.get('max_tokens'),
+            engine=config.get('engine'),
+        )
+
+        for key, column in SUMMARY_RESULT_COLUMNS.items():
+            value = PerformanceEvaluationService._to_number((summary or {}).get(key))
+            if value is not None and column in ('total_requests', 'succeed_requests', 'failed_requests'):
+                value = int(value)
+            setattr(row, column, value)
+
+        labels = list((percentiles or {}).get(PercentileMetrics.PERCENTILES, []))
+        for key, prefix in PERCENTILE_RESULT_COLUMNS.items():
+            values = list((percentiles or {}).get(key, []))
+            for label, suffix in PERCENTILE_RESULT_POINTS.items():
+                if label in labels and labels.index(label) < len(values):
+                    setattr(row, f'{prefix}_{suffix}',
+                            PerformanceEvaluationService._to_number(values[labels.index(label)]))
+        return row
+
+    @staticmethod
+    def save_structured_results(task: PerformanceEvalTask, rows: List[PerformanceEvalResult]) -> None:
+        """替换任务的结构化结果（随调用方的事务一起提交）"""
+        PerformanceEvalResult.query.filter_by(task_id=task.id).delete(synchronize_session=False)
+        db.session.add_all(rows)
+
+    @staticmethod
+    def get_rankings(user_id: int, metric: str, concurrency: Optional[int] = None, dataset_name: Optional[str] = None,
+                     days: int = 30, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        按模型统计指定指标的最优值，例如最近30天并发64下各模型的最佳输出token吞吐量
+
+        Returns:
+            List[Dict]: [{'model_name', 'best', 'runs', 'task_id'}]，按指标从优到劣排序
+        """
+        from datetime import timedelta
+        from sqlalchemy import func
+
+        direction = RANKING_METRICS[metric]
+        column = getattr(PerformanceEvalResult, metric)
+        aggregate = func.max(column) if direction == 'max' else func.min(column)
+
+        filters = [
+            PerformanceEvalResult.user_id == user_id,
+            PerformanceEvalResult.completed_at >= get_beijing_time() - timedelta(days=days),
+            column.isnot(None),
+        ]
+        if concurrency is not None:
+            filters.append(PerformanceEvalResult.concurrency == concurrency)
+        if dataset_name:
+            filters.append(PerformanceEvalResult.dataset_name == dataset_name)
+
+        best = aggregate.label('best')
+        rows = db.session.query(
+            PerformanceEvalResult.model_name, best, func.count(PerformanceEvalResult.id).label('runs')
+        ).filter(*filters).group_by(PerformanceEvalResult.model_name).order_by(
+            best.desc() if direction == 'max' else best.asc()
+        ).limit(limit).all()
+
+        return [{'model_name': r.model_name, 'best': r.best, 'runs': r.runs} for r in rows]
+
+    @staticmethod
+    def result_to_dict(row: PerformanceEvalResult) -> Dict[str, Any]:
+        """结构化结果行转换为API格式"""
+        data = {
+            'config_index': row.config_index,
+            'model_name': row.model_name,
+            'concurrency': row.concurrency,
+            'num_requests': row.num_requests,
+            'min_prompt_length': row.min_prompt_length,
+            'max_prompt_length': row.max_prompt_length,
+            'max_tokens': row.max_tokens,
+            'engine': row.engine,
+        }
+        for column in SUMMARY_RESULT_COLUMNS.values():
+            data[column] = getattr(row, column)
+        for prefix in PERCENTILE_RESULT_COLUMNS.values():
+            for suffix in PERCENTILE_RESULT_POINTS.values():
+                data[f'{prefix}_{suffix}'] = getattr(row, f'{prefix}_{suffix}')
+        return data
+
+    @staticmethod
+    def _parse_text_results(text: Optional[str], as_list: bool = False) -> Dict[str, Any]:
+        """解析 _convert_summary_to_text / _convert_percentiles_to_text 生成的文本（用于回填历史任务）"""
+        parsed = {}
+        for line in (text or '').splitlines():
+            if '|' not in line:
+                continue
+            key, value = line.split('|', 1)
+            parsed[key.strip()] = value.split(',') if as_list else value.strip()
+        return parsed
+
+    @staticmethod
+    def backfill_structured_results(batch_size: int = 200) -> int:
+        """
+        为结构化结果表上线前完成的任务回填结果
+
+        Returns:
+            int: 回填的任务数
+        """
+        filled = 0
+        last_id = 0
+        while True:
+            tasks = PerformanceEvalTask.query.filter(
+                PerformanceEvalTask.id > last_id,
+                PerformanceEvalTask.status == 'completed',
+                ~PerformanceEvalTask.structured_results.any()
+            ).order_by(PerformanceEvalTask.id).limit(batch_size).all()
+            if not tasks:
+                break
+
+            for task in tasks:
+                last_id = task.id
+                if task.is_batch_task() or task.concurrency == 0:
+                    rows = BatchPerformanceEvaluationService.build_batch_structured_results(
+                        task, (task.get_batch_results() or {}).get('entries', []))
+                else:
+                    summary = PerformanceEvaluationService._parse_text_results(task.summary_results)
+                    percentiles = PerformanceEvaluationService._parse_text_results(task.percentile_results, as_list=True)
+                    rows = [PerformanceEvaluationService.build_structured_result(task, summary, percentiles)] if summary else []
+                if rows:
+                    db.session.add_all(rows)
+                    filled += 1
+            db.session.commit()
+        return filled
+
+    @staticmethod
+    def _flush_telemetry(task: PerformanceEvalTask, telemetry: SlidingWindowTelemetry) -> bool:
+        """
+        写入一次遥测快照：追加一行快照并清理超出保留数量的旧快照，不重写已有数据
+        
+        Returns:
+            bool: 任务是否已被请求中止
+        """
+        # 中止请求可能由其他 worker 写入，先从数据库刷新状态
+        db.session.refresh(task)
+        snapshot = telemetry.snapshot()
+        db.session.add(PerfTelemetrySnapshot(task_id=task.id, seq=snapshot['seq'], data=snapshot))
+        PerfTelemetrySnapshot.query.filter(
+            PerfTelemetrySnapshot.task_id == task.id,
+            PerfTelemetrySnapshot.seq <= snapshot['seq'] - TELEMETRY_MAX_SNAPSHOTS
+        ).delete(synchronize_session=False)
+        task.live_metrics = {'seq': snapshot['seq']}
+        db.session.commit()
+        return task.status == 'aborting'
+
+    @staticmethod
+    def get_telemetry_snapshots(task_id: int, since_seq: int = 0) -> List[Dict[str, Any]]:
+        """按序号返回 since_seq 之后的遥测快照（增量轮询）"""
+        rows = PerfTelemetrySnapshot.query.filter(
+            PerfTelemetrySnapshot.task_id == task_id,
+            PerfTelemetrySnapshot.seq > since_seq
+        ).order_by(PerfTelemetrySnapshot.seq).all()
+        return [row.data for row in rows]
+
+    @staticmethod
+    def _store_sketches(task: PerformanceEvalTask, sketches: MetricSketches) -> None:
+        """保存本次压测的指标分布草图（随后续的状态更新一起提交）"""
+        if sketches:
+            task.metric_sketches = sketches.to_bytes()
+
+    @staticmethod
+    def get_task_quantiles(task: PerformanceEvalTask, quantiles: List[float],
+                           fields: Optional[List[str]] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """根据保存的草图按需计算分位数，没有草图的任务（早期任务）返回None"""
+        sketches = MetricSketches.from_bytes(task.metric_sketches)
+        return sketches.quantiles(quantiles, fields) if sketches else None
+
+    @staticmethod
+    def compare_task_quantiles(tasks: List[PerformanceEvalTask], quantiles: List[float],
+                               fields: Optional[List[str]] = None, merge: bool = False) -> Dict[str, Any]:
+        """
+        对比多个任务的分位数，merge=True 时额外返回把所有任务合并后的分位数
+
+        Returns:
+            Dict: {'tasks': {task_id: 分位数或None}, 'merged': 分位数或None}
+        """
+        result = {'tasks': {}, 'merged': None}
+        merged = None
+        for task in tasks:
+            sketches = MetricSketches.from_bytes(task.metric_sketches)
+            result['tasks'][task.id] = sketches.quantiles(quantiles, fields) if sketches else None
+            if merge and sketches:
+                merged = sketches if merged is None else merged.merge(sketches)
+        if merged is not None:
+            result['merged'] = merged.quantiles(quantiles, fields)
+        return result
+
+    @staticmethod
+    def request_abort(task_id: int, user_id: int) -> bool:
+        """
+        请求中止运行中的性能评估任务，由监控线程在下一次写快照时终止工作进程
+        
+        Returns:
+            bool: 请求成功返回True
+        """
+        try:
+            task = PerformanceEvalTask.query.filter_by(id=task_id, user_id=user_id).first()
+            if not task or task.status not in ['pending', 'running']:
+                return False
+            task.status = 'aborting'
+            db.session.commit()
+            current_app.logger.info(f"已请求中止性能评估任务 {task_id}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"请求中止性能评估任务 {task_id} 失败: {str(e)}")
+            return False
+
+    @staticmethod
+    def _mark_task_failed(task: PerformanceEvalTask, error_message: str) -> None:
+        """将任务标记为失败"""
+        task.status = 'failed'
+        task.error_message = error_message
+        task.completed_at = get_beijing_time()
+        db.session.commit()
 
     @staticmethod
     def _convert_summary_to_text(summary: Dict[str, Any]) -> str:
@@ -446,7 +749,8 @@ class PerformanceEvaluationService:
 
     @staticmethod
     def run_performance_evaluation(task_id: int, model_id: int, dataset_id: int, concurrency: int, num_requests: int,
-                                 min_prompt_length=None, max_prompt_length=None, max_tokens=None, extra_args=None):
+                                 min_prompt_length=None, max_prompt_length=None, max_tokens=None, extra_args=None,
+                                 engine=None, rate=None, num_workers=None, wait=False):
         """
         运行性能评估任务
         
@@ -460,12 +764,20 @@ class PerformanceEvaluationService:
             max_prompt_length: 最大输入prompt长度
             max_tokens: 最大生成token数量
             extra_args: 额外传入请求体的参数，JSON字符串
+            engine: 压测引擎，evalscope（默认）或 native（内置 asyncio/httpx 引擎）
+            rate: 开环模式的请求到达速率（请求/秒），不设置为固定并发的闭环模式
+            num_workers: 压测进程数，大于1时把并发数与请求数切分到多个进程（仅内置引擎支持）
+            wait: 是否阻塞到评估结束（队列 worker 中执行时为True）
         """
         try:
             task = PerformanceEvalTask.query.get(task_id)
             if not task:
                 current_app.logger.error(f"任务ID {task_id} 不存在")
                 return
+
+            engine_error = validate_engine_options(engine, num_workers)
+            if engine_error:
+                raise ValueError(engine_error)
             
             # 根据模型标识符查找模型
             selected_model = AIModel.query.get(model_id)
@@ -506,6 +818,15 @@ class PerformanceEvaluationService:
             if max_tokens is not None:
                 task_cfg["max_tokens"] = max_tokens
                 
+            if engine:
+                task_cfg["engine"] = engine
+                
+            if rate:
+                task_cfg["rate"] = rate
+                
+            if num_workers and num_workers > 1:
+                task_cfg["num_workers"] = num_workers
+                
             # 处理额外参数
             if extra_args and extra_args.strip():
                 try:
@@ -522,25 +843,25 @@ class PerformanceEvaluationService:
             if dataset != 'openqa':
                 task_cfg['dataset_path'] = selected_dataset.download_url
             
-            # 创建临时文件存储结果
-            output_file_path = tempfile.mktemp(suffix=f"_perf_eval_{task_id}.pkl")
-            
-            # 启动评估进程
+            # 创建结果通道并启动评估进程
+            channel = PerfResultChannel()
             process = multiprocessing.Process(
                 target=PerformanceEvaluationService.run_performance_eval_task_process,
-                args=(task_id, task_cfg, output_file_path)
+                args=(task_id, task_cfg, channel)
             )
             process.start()
             
             # 启动监控线程
             from threading import Thread
             monitor_thread = Thread(
-                target=PerformanceEvaluationService.update_task_from_output_file,
-                args=(current_app._get_current_object(), task_id, output_file_path)
+                target=PerformanceEvaluationService.update_task_from_channel,
+                args=(current_app._get_current_object(), task_id, process, channel)
             )
             monitor_thread.start()
             
             current_app.logger.info(f"性能评估任务 {task_id} 已启动")
+            if wait:
+                monitor_thread.join()
             
         except Exception as e:
             current_app.logger.error(f"启动性能评估任务 {task_id} 失败: {str(e)}")
@@ -774,7 +1095,10 @@ class BatchPerformanceEvaluationService:
         dataset_id: int,
         test_configurations: List[Dict[str, Any]],
         name: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        extra_model_ids: Optional[List[int]] = None,
+        parallel_endpoints: bool = False,
+        config_timeout_seconds: Optional[int] = None
     ) -> Optional[PerformanceEvalTask]:
         """
         创建批量性能评估任务
@@ -790,22 +1114,36 @@ class BatchPerformanceEvaluationService:
                 - max_prompt_length: 最大输入长度（可选）
                 - min_tokens: 最小输出长度（可选）
                 - max_tokens: 最大输出长度（可选）
+                - timeout_seconds: 该配置的超时时间（可选）
+                - engine / rate / num_workers: 压测引擎参数（可选），num_workers 大于1时 engine 必须为 native
             name: 任务名称（可选）
             description: 任务描述（可选）
+            extra_model_ids: 额外参与测试的模型ID列表（可选），每个模型执行全部测试配置
+            parallel_endpoints: 不同模型端点之间是否并发执行
+            config_timeout_seconds: 单个测试配置的默认超时时间（秒）
 
         Returns:
             PerformanceEvalTask: 创建的任务对象，失败返回None
         """
         try:
+            for i, config in enumerate(test_configurations):
+                engine_error = validate_engine_options(config.get('engine'), config.get('num_workers'))
+                if engine_error:
+                    current_app.logger.error(f"第{i+1}个测试配置无效: {engine_error}")
+                    return None
+
+            model_ids = [model_id] + [mid for mid in (extra_model_ids or []) if mid != model_id]
+
             # 验证模型权限
-            model = AIModel.query.filter(
-                AIModel.id == model_id,
+            models = AIModel.query.filter(
+                AIModel.id.in_(model_ids),
                 (AIModel.is_system_model == True) | (AIModel.user_id == user_id)
-            ).first()
+            ).all()
 
-            if not model:
-                current_app.logger.error(f"找不到模型ID为 {model_id} 的模型或无权限使用")
+            if len(models) != len(set(model_ids)):
+                current_app.logger.error(f"模型 {model_ids} 中存在不存在或无权限使用的模型")
                 return None
+            model = next(m for m in models if m.id == model_id)
 
             # 验证数据集权限（-1表示使用内置openqa数据集）
             dataset = None
@@ -830,20 +1168,23 @@ class BatchPerformanceEvaluationService:
                 model_name=model.model_identifier,
                 dataset_name='openqa' if dataset_id == -1 else dataset.name,
                 concurrency=0,  # 批量任务的并发数设为0作为标识
-                num_requests=sum(config.get('num_requests', 0) for config in test_configurations),
+                num_requests=sum(config.get('num_requests', 0) for config in test_configurations) * len(model_ids),
                 status='pending',
+                task_type='batch',
+                task_name=name,
+                task_description=description,
                 created_at=get_beijing_time()
             )
 
-            # 将批量配置存储在raw_output字段中（临时方案）
-            import json
-            batch_config = {
+            task.set_batch_config({
                 'type': 'batch',
                 'name': name,
                 'description': description,
-                'configurations': test_configurations
-            }
-            task.raw_output = json.dumps(batch_config, ensure_ascii=False)
+                'configurations': test_configurations,
+                'model_ids': model_ids,
+                'parallel_endpoints': bool(parallel_endpoints),
+                'config_timeout_seconds': config_timeout_seconds
+            })
 
             db.session.add(task)
             db.session.commit()
@@ -857,7 +1198,20 @@ class BatchPerformanceEvaluationService:
             return None
 
     @staticmethod
-    def run_batch_performance_evaluation(task_id: int, model_id: int, dataset_id: int):
+    def get_task_batch_config(task: PerformanceEvalTask) -> Dict[str, Any]:
+        """读取批量配置，兼容早期存放在 raw_output 中的任务"""
+        batch_config = task.get_batch_config()
+        if batch_config:
+            return batch_config
+        try:
+            import json
+            return json.loads(task.raw_output or '{}')
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def run_batch_performance_evaluation(task_id: int, model_id: int, dataset_id: int, resume: bool = False,
+                                         wait: bool = False):
         """
         运行批量性能评估任务
 
@@ -865,6 +1219,8 @@ class BatchPerformanceEvaluationService:
             task_id: 任务ID
             model_id: 模型ID
             dataset_id: 数据集ID
+            resume: 是否从已完成的测试配置之后继续执行
+            wait: 是否阻塞到评估结束（队列 worker 中执行时为True）
         """
         try:
             task = PerformanceEvalTask.query.get(task_id)
@@ -873,18 +1229,19 @@ class BatchPerformanceEvaluationService:
                 return
 
             # 解析批量配置
-            import json
-            batch_config = json.loads(task.raw_output)
+            batch_config = BatchPerformanceEvaluationService.get_task_batch_config(task)
             configurations = batch_config.get('configurations', [])
 
             if not configurations:
                 current_app.logger.error(f"任务ID {task_id} 没有有效的测试配置")
                 return
 
-            # 获取模型信息
-            selected_model = AIModel.query.get(model_id)
-            if not selected_model:
-                current_app.logger.error(f"找不到模型ID为 {model_id} 的模型")
+            # 获取模型信息（保持创建时的顺序，配置序号依赖该顺序）
+            model_ids = batch_config.get('model_ids') or [model_id]
+            models_by_id = {m.id: m for m in AIModel.query.filter(AIModel.id.in_(model_ids)).all()}
+            missing = [mid for mid in model_ids if mid not in models_by_id]
+            if missing:
+                current_app.logger.error(f"找不到模型ID为 {missing} 的模型")
                 return
 
             # 获取数据集信息
@@ -899,25 +1256,62 @@ class BatchPerformanceEvaluationService:
                     return
                 dataset = "custom_dataset"
 
-            # 创建临时文件存储结果
-            output_file_path = tempfile.mktemp(suffix=f"_batch_perf_eval_{task_id}.pkl")
+            # 展开为 (模型, 配置) 作业，index 在任务生命周期内保持稳定，用于断点续跑
+            default_timeout = batch_config.get('config_timeout_seconds') or DEFAULT_CONFIG_TIMEOUT_SECONDS
+            jobs = []
+            for model_pos, mid in enumerate(model_ids):
+                model = models_by_id[mid]
+                for config_pos, config in enumerate(configurations):
+                    jobs.append({
+                        'index': model_pos * len(configurations) + config_pos,
+                        'model_id': model.id,
+                        'model_name': model.model_identifier,
+                        'api_base_url': model.api_base_url,
+                        'api_key': model.encrypted_api_key,
+                        'config': config,
+                        'timeout_seconds': config.get('timeout_seconds') or default_timeout
+                    })
+
+            # 断点续跑：跳过已成功的配置，保留其结果
+            completed_entries = []
+            if resume:
+                completed_entries = [
+                    entry for entry in BatchPerformanceEvaluationService.get_partial_entries(task)
+                    if entry.get('status') == 'success'
+                ]
+                done = {entry.get('index') for entry in completed_entries}
+                jobs = [job for job in jobs if job['index'] not in done]
+                current_app.logger.info(f"批量性能评估任务 {task_id} 断点续跑，跳过 {len(done)} 个已完成配置")
+            else:
+                task.set_batch_results(None)
+
+            task.status = 'pending'
+            task.error_message = None
+            task.completed_at = None
+            db.session.commit()
 
-            # 启动批量评估进程
+            parallel_endpoints = bool(batch_config.get('parallel_endpoints'))
+            max_wait_seconds = BatchPerformanceEvaluationService.estimate_max_wait_seconds(jobs, parallel_endpoints)
+
+            # 创建结果通道并启动批量评估进程
+            channel = PerfResultChannel()
             process = multiprocessing.Process(
                 target=BatchPerformanceEvaluationService.run_batch_performance_eval_task_process,
-                args=(task_id, selected_model, dataset, selected_dataset, configurations, output_file_path)
+                args=(task_id, jobs, dataset, selected_dataset, completed_entries, parallel_endpoints, channel)
             )
             process.start()
 
             # 启动监控线程
             from threading import Thread
             monitor_thread = Thread(
-                target=PerformanceEvaluationService.update_task_from_output_file,
-                args=(current_app._get_current_object(), task_id, output_file_path)
+                target=PerformanceEvaluationService.update_task_from_channel,
+                args=(current_app._get_current_object(), task_id, process, channel, max_wait_seconds)
             )
             monitor_thread.start()
 
-            current_app.logger.info(f"批量性能评估任务 {task_id} 已启动")
+            current_app.logger.info(f"批量性能评估任务 {task_id} 已启动，待执行配置 {len(jobs)} 个")
+            if wait:
+                monitor_thread.join()
 
         except Exception as e:
             current_app.logger.error(f"启动批量性能评估任务 {task_id} 失败: {str(e)}")
@@ -932,119 +1326,238 @@ class BatchPerformanceEvaluationService:
             except Exception as update_error:
                 current_app.logger.error(f"更新任务失败状态时出错: {update_error}")
 
+    @staticmethod
+    def resume_batch_performance_evaluation(task_id: int, user_id: int) -> Tuple[bool, str]:
+        """
+        从最后完成的测试配置之后继续执行批量任务（进程崩溃、超时或中止之后）
+
+        Returns:
+            Tuple[bool, str]: (是否已启动, 提示信息)
+        """
+        task = PerformanceEvalTask.query.filter_by(id=task_id, user_id=user_id).first()
+        if not task or not (task.is_batch_task() or task.concurrency == 0):
+            return False, '批量任务不存在'
+        from app.services.job_queue import dispatch_job, has_live_job, JOB_PERF_BATCH
+        if task.status in ('running', 'pending'):
+            # 进程硬崩溃后任务会停留在运行中/等待中；队列任务的租约已过期（或已结束）说明没有进程在执行
+            if has_live_job(JOB_PERF_BATCH, task_id):
+                return False, f'任务当前状态为 {task.status}，仍在执行中，不能续跑'
+            current_app.logger.warning(f"批量任务 {task_id} 状态为 {task.status} 但执行进程已不存在，按中断处理后续跑")
+            task.status = 'failed'
+            task.error_message = '执行进程意外退出'
+            db.session.commit()
+        elif task.status not in ('failed', 'aborted'):
+            return False, f'任务当前状态为 {task.status}，只有失败、已中止或执行进程已退出的任务可以续跑'
+
+        batch_config = BatchPerformanceEvaluationService.get_task_batch_config(task)
+        model = AIModel.query.filter_by(model_identifier=task.model_name).first()
+        model_id = (batch_config.get('model_ids') or [model.id if model else None])[0]
+        if model_id is None:
+            return False, '找不到任务对应的模型'
+
+        if task.dataset_name == 'openqa':
+            dataset_id = -1
+        else:
+            dataset = Dataset.query.filter_by(name=task.dataset_name, is_active=True).first()
+            if not dataset:
+                return False, '找不到任务对应的数据集'
+            dataset_id = dataset.id
+
+        dispatch_job(JOB_PERF_BATCH, task_id, user_id=user_id,
+                     payload={'model_id': model_id, 'dataset_id': dataset_id, 'resume': True})
+        return True, '批量任务已从最后完成的配置之后继续执行'
+
+    @staticmethod
+    def estimate_max_wait_seconds(jobs: List[Dict[str, Any]], parallel_endpoints: bool) -> int:
+        """监控线程的最长等待时间：各配置超时与冷却时间之和（并发时取最慢的端点组）"""
+        group_totals = [
+            sum(job['timeout_seconds'] + COOLDOWN_MAX_SECONDS for job in group)
+            for group in group_jobs_by_endpoint(jobs)
+        ] or [0]
+        total = max(group_totals) if parallel_endpoints else sum(group_totals)
+        return int(total) + 60
+
+    @staticmethod
+    def build_task_cfg(job: Dict[str, Any], dataset: str, selected_dataset: Optional[Dataset]) -> Dict[str, Any]:
+        """构建单个测试配置的evalscope参数"""
+        config = job['config']
+        api_base_url = job['api_base_url']
+        task_cfg = {
+            "url": api_base_url.rstrip('/') + '/chat/completions' if not api_base_url.endswith('/chat/completions') else api_base_url,
+            "parallel": config.get('concurrency', 1),
+            "model": job['model_name'],
+            "number": config.get('num_requests', 10),
+            "api": 'openai',
+            "dataset": dataset,
+            "stream": True,
+            "api_key": job['api_key']
+        }
+
+        # 添加可选参数
+        for key in ('min_prompt_length', 'max_prompt_length', 'min_tokens', 'max_tokens', 'engine', 'rate', 'num_workers'):
+            if config.get(key) is not None:
+                task_cfg[key] = config[key]
+
+        # 如果使用自定义数据集，设置数据集路径
+        if selected_dataset and dataset == "custom_dataset":
+            task_cfg["dataset_path"] = selected_dataset.download_url
+
+        return task_cfg
+
+    @staticmethod
+    def run_single_configuration_process(task_cfg: Dict[str, Any], conn):
+        """在独立子进程中执行单个测试配置，进度和结果都通过该子进程独占的管道返回"""
+        try:
+            conn.send(('success', PerformanceEvaluationService.execute_benchmark(task_cfg, PipeProgressChannel(conn))))
+        except Exception as e:
+            conn.send(('failed', str(e)))
+        finally:
+            conn.close()
+
     @staticmethod
     def run_batch_performance_eval_task_process(
         task_id: int,
-        model: AIModel,
+        jobs: List[Dict[str, Any]],
         dataset: str,
         selected_dataset: Optional[Dataset],
-        configurations: List[Dict[str, Any]],
-        output_file_path: str
+        completed_entries: List[Dict[str, Any]],
+        parallel_endpoints: bool,
+        channel: PerfResultChannel
     ):
         """
-        在独立进程中执行批量性能评估任务
+        在独立进程中调度批量性能评估任务
+
+        同一端点的配置串行执行，每个配置在单独的子进程中运行并拥有独立超时，
+        配置之间等待端点在途请求排空；不同端点可选并发执行。
 
         Args:
             task_id: 评估任务ID
-            model: 模型对象
+            jobs: 待执行的作业列表（模型 + 测试配置）
             dataset: 数据集名称
             selected_dataset: 数据集对象（可选）
-            configurations: 测试配置列表
-            output_file_path: 存储结果的临时文件路径
+            completed_entries: 续跑时已完成配置的结果
+            parallel_endpoints: 不同端点之间是否并发执行
+            channel: 结果通道
         """
         # 获取一个标准的logger实例
         process_logger = logging.getLogger(f"batch_perf_eval_process.{task_id}")
 
-        def timeout_handler(signum, frame):
-            raise TimeoutError("批量性能评估任务执行超时")
-
-        try:
-            process_logger.info(f"开始执行批量性能评估任务 {task_id}, 配置数量: {len(configurations)}")
-
-            # 设置总任务超时时间（30分钟）
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(30 * 60)  # 30分钟超时
-
-            start_time = time.time()
-            batch_results = []
-
-            for i, config in enumerate(configurations):
-                process_logger.info(f"执行第 {i+1}/{len(configurations)} 个测试配置: {config}")
-
-                # 构建单个测试的evalscope配置
-                task_cfg = {
-                    "url": model.api_base_url.rstrip('/') + '/chat/completions' if not model.api_base_url.endswith('/chat/completions') else model.api_base_url,
-                    "parallel": config.get('concurrency', 1),
-                    "model": model.model_identifier,
-                    "number": config.get('num_requests', 10),
-                    "api": 'openai',
-                    "dataset": dataset,
-                    "stream": True,
-                    "api_key": model.encrypted_api_key
+        def run_group(group: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            entries = []
+            for i, job in enumerate(group):
+                if i > 0:
+                    waited = wait_for_endpoint_drain(job['api_base_url'], job['api_key'])
+                    process_logger.info(f"端点 {job['api_base_url']} 冷却 {waited:.1f} 秒")
+
+                process_logger.info(f"执行第 {job['index'] + 1} 个测试配置 ({job['model_name']}): {job['config']}")
+                task_cfg = BatchPerformanceEvaluationService.build_task_cfg(job, dataset, selected_dataset)
+                status, payload = run_with_timeout(
+                    BatchPerformanceEvaluationService.run_single_configuration_process,
+                    (task_cfg,),
+                    job['timeout_seconds'],
+                    on_progress=lambda sample: channel.progress(**sample)
+                )
+
+                entry = {
+                    'index': job['index'],
+                    'model_id': job['model_id'],
+                    'model_name': job['model_name'],
+                    'config': job['config'],
+                    'status': status,
+                    'result': payload if status == 'success' else None
                 }
+                if status != 'success':
+                    entry['error'] = payload
+                    process_logger.error(f"第 {job['index'] + 1} 个测试配置执行失败: {payload}")
+                else:
+                    process_logger.info(f"第 {job['index'] + 1} 个测试配置执行成功")
 
-                # 添加可选参数
-                if config.get('min_prompt_length') is not None:
-                    task_cfg["min_prompt_length"] = config['min_prompt_length']
-                if config.get('max_prompt_length') is not None:
-                    task_cfg["max_prompt_length"] = config['max_prompt_length']
-                if config.get('min_tokens') is not None:
-                    task_cfg["min_tokens"] = config['min_tokens']
-                if config.get('max_tokens') is not None:
-                    task_cfg["max_tokens"] = config['max_tokens']
-
-                # 如果使用自定义数据集，设置数据集路径
-                if selected_dataset and dataset == "custom_dataset":
-                    task_cfg["dataset_path"] = selected_dataset.file_path
+                # 逐个推送结果，监控线程落库后即可用于断点续跑
+                channel.config_completed(entry)
+                entries.append(entry)
+            return entries
 
-                try:
-                    # 执行单个测试
-                    single_result = run_perf_benchmark(task_cfg)
-                    batch_results.append({
-                        'config': config,
-                        'result': single_result,
-                        'status': 'success'
-                    })
-                    process_logger.info(f"第 {i+1} 个测试配置执行成功")
+        try:
+            # 被中止时连同正在执行的配置子进程一起结束
+            install_termination_handler()
+            groups = group_jobs_by_endpoint(jobs)
+            process_logger.info(f"开始执行批量性能评估任务 {task_id}, 待执行配置: {len(jobs)}, 端点数: {len(groups)}")
 
-                    # 测试间隔休息
-                    if i < len(configurations) - 1:
-                        time.sleep(5)
+            channel.started(pid=os.getpid(), total_configurations=len(jobs) + len(completed_entries))
+            start_time = time.time()
+            batch_results = list(completed_entries)
 
-                except Exception as single_error:
-                    process_logger.error(f"第 {i+1} 个测试配置执行失败: {single_error}")
-                    batch_results.append({
-                        'config': config,
-                        'result': None,
-                        'status': 'failed',
-                        'error': str(single_error)
-                    })
+            if parallel_endpoints and len(groups) > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                    for entries in executor.map(run_group, groups):
+                        batch_results.extend(entries)
+            else:
+                for group in groups:
+                    batch_results.extend(run_group(group))
 
-            # 取消超时信号
-            signal.alarm(0)
+            batch_results.sort(key=lambda entry: entry.get('index', 0))
 
             elapsed_time = time.time() - start_time
             process_logger.info(f"批量性能评估任务 {task_id} 执行耗时: {elapsed_time:.2f}秒")
 
-            # 将结果序列化到文件
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(("SUCCESS", batch_results), f)
-
-            process_logger.info(f"批量性能评估任务 {task_id} 已完成，结果已保存到 {output_file_path}")
+            channel.completed(batch_results, kind='batch')
+            process_logger.info(f"批量性能评估任务 {task_id} 已完成，结果已推送")
 
-        except TimeoutError:
-            signal.alarm(0)
-            error_msg = f"批量性能评估任务 {task_id} 执行超时（30分钟），可能是模型服务不可用"
-            process_logger.error(error_msg)
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(("ERROR", error_msg), f)
         except Exception as e:
-            signal.alarm(0)
             error_msg = f"批量性能评估任务 {task_id} 执行异常: {str(e)}"
             process_logger.error(error_msg)
             process_logger.error(traceback.format_exc())
-            with open(output_file_path, 'wb') as f:
-                pickle.dump(("ERROR", error_msg), f)
+            channel.error(error_msg)
+        finally:
+            channel.close()
+
+    @staticmethod
+    def get_partial_entries(task: PerformanceEvalTask) -> List[Dict[str, Any]]:
+        """读取任务已落库的逐配置结果"""
+        return list((task.get_batch_results() or {}).get('entries', []))
+
+    @staticmethod
+    def record_configuration_result(task: PerformanceEvalTask, entry: Dict[str, Any]) -> None:
+        """单个测试配置执行结束后立即落库，进程崩溃后可据此续跑"""
+        entries = [e for e in BatchPerformanceEvaluationService.get_partial_entries(task)
+                   if e.get('index') != entry.get('index')]
+        entries.append(entry)
+        entries.sort(key=lambda e: e.get('index', 0))
+        summary = BatchPerformanceEvaluationService.parse_batch_results(entries)
+        summary['entries'] = entries
+        summary['partial'] = True
+        task.set_batch_results(summary)
+        db.session.commit()
+
+    @staticmethod
+    def apply_batch_results(task: PerformanceEvalTask, batch_results: List[Dict[str, Any]]) -> None:
+        """将批量评估结果汇总后写入任务"""
+        summary = BatchPerformanceEvaluationService.parse_batch_results(batch_results or [])
+        summary['entries'] = batch_results or []
+        task.set_batch_results(summary)
+        task.status = 'completed' if summary['successful_tests'] > 0 else 'failed'
+        if task.status == 'failed':
+            task.error_message = "所有测试配置均执行失败"
+        task.completed_at = get_beijing_time()
+        PerformanceEvaluationService.save_structured_results(
+            task, BatchPerformanceEvaluationService.build_batch_structured_results(task, batch_results or []))
+        db.session.commit()
+
+    @staticmethod
+    def build_batch_structured_results(task: PerformanceEvalTask,
+                                       entries: List[Dict[str, Any]]) -> List[PerformanceEvalResult]:
+        """为批量任务中每个成功的测试配置生成一行结构化结果"""
+        rows = []
+        for position, entry in enumerate(entries):
+            result = entry.get('result')
+            if entry.get('status') != 'success' or not isinstance(result, (tuple, list)) or len(result) < 2:
+                continue
+            config = dict(entry.get('config') or {})
+            config['model_name'] = entry.get('model_name')
+            rows.append(PerformanceEvaluationService.build_structured_result(
+                task, result[0], result[1], config_index=entry.get('index', position), config=config))
+        return rows
 
     @staticmethod
     def create_configurations_from_script_style(
@@ -1113,11 +1626,13 @@ class BatchPerformanceEvaluationService:
                 config = result['config']
                 test_result = result['result']
 
-                # 假设 test_result 是 (summary_dict, percentile_list) 的元组
-                if isinstance(test_result, tuple) and len(test_result) >= 2:
+                # 假设 test_result 是 (summary_dict, percentile_list) 的元组（落库后为列表）
+                if isinstance(test_result, (tuple, list)) and len(test_result) >= 2:
                     summary_dict, percentile_list = test_result[0], test_result[1]
 
                     test_summary = {
+                        'index': result.get('index'),
+                        'model_name': result.get('model_name'),
                         'config': config,
                         'summary': summary_dict,
                         'percentiles': percentile_list
@@ -1126,8 +1641,10 @@ class BatchPerformanceEvaluationService:
             else:
                 summary['failed_tests'] += 1
                 summary['test_results'].append({
+                    'index': result.get('index'),
+                    'model_name': result.get('model_name'),
                     'config': result['config'],
-                    'status': 'failed',
+                    'status': result.get('status', 'failed'),
                     'error': result.get('error', 'Unknown error')
                 })
 
@@ -0,0 +1,192 @@
+"""
+可合并的指标分布草图
+
+对数分桶直方图（与 DDSketch 相同的分桶方式）：桶 i 覆盖 (gamma^(i-1), gamma^i]，
+任意分位数的相对误差不超过 relative_accuracy。相同精度的草图可以直接按桶相加合并，
+因此可以跨分片、跨任务聚合，并在事后按需计算任意分位数（如 p99.9）。
+"""
+import math
+import struct
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 默认相对误差 1%
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# 小于该值的样本计入零桶
+MIN_INDEXABLE_VALUE = 1e-9
+# 记录分布的指标：延迟类（秒）与 token 数
+SKETCH_FIELDS = ('ttft', 'itl', 'tpot', 'latency', 'input_tokens', 'output_tokens')
+
+_MAGIC = b'PSK1'
+_HEADER = struct.Struct('<dQQdddI')
+_BIN = struct.Struct('<iQ')
+
+
+class LatencySketch:
+    """单个指标的对数分桶直方图"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: Optional[float], weight: int = 1) -> None:
+        if value is None or not isinstance(value, (int, float)) or math.isnan(value) or value < 0:
+            return
+        if value < MIN_INDEXABLE_VALUE:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'LatencySketch') -> 'LatencySketch':
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("只能合并精度相同的草图")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """计算分位数，q 取值 [0, 1]"""
+        if not self.count or not 0 <= q <= 1:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(self.relative_accuracy, self.count, self.zero_count, self.sum,
+                              self.min if self.count else 0.0, self.max if self.count else 0.0, len(self.bins))
+        return header + b''.join(_BIN.pack(index, count) for index, count in sorted(self.bins.items()))
+
+    @classmethod
+    def from_bytes(cls, data: bytes, offset: int = 0) -> Tuple['LatencySketch', int]:
+        accuracy, count, zero_count, total, minimum, maximum, num_bins = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        sketch = cls(accuracy)
+        sketch.count, sketch.zero_count, sketch.sum = count, zero_count, total
+        if count:
+            sketch.min, sketch.max = minimum, maximum
+        for _ in range(num_bins):
+            index, bin_count = _BIN.unpack_from(data, offset)
+            sketch.bins[index] = bin_count
+            offset += _BIN.size
+        return sketch, offset
+
+
+class MetricSketches:
+    """一次压测所有指标的草图集合，序列化后存入 model_efficiency.metric_sketches"""
+
+    def __init__(self, fields: Iterable[str] = SKETCH_FIELDS):
+        self.sketches: Dict[str, LatencySketch] = {field: LatencySketch() for field in fields}
+
+    def __bool__(self):
+        return any(sketch.count for sketch in self.sketches.values())
+
+    def add_sample(self, sample: Dict[str, Any]) -> None:
+        """加入一个成功请求的样本（与遥测样本格式一致）"""
+        if not sample.get('success'):
+            return
+        for field, sketch in self.sketches.items():
+            value = sample.get(field)
+            # itl 为该请求所有 token 间隔的列表，逐个计入
+            for item in (value if isinstance(value, (list, tuple)) else [value]):
+                sketch.add(item)
+
+    def merge(self, other: 'MetricSketches') -> 'MetricSketches':
+        for field, sketch in other.sketches.items():
+            if field in self.sketches:
+                self.sketches[field].merge(sketch)
+            else:
+                self.sketches[field] = LatencySketch(sketch.relative_accuracy).merge(sketch)
+        return self
+
+    def quantiles(self, qs: List[float], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """按需计算分位数，返回 {指标: {'count', 'mean', 'min', 'max', 'p50': ..., ...}}"""
+        result = {}
+        for field in fields or self.sketches.keys():
+            sketch = self.sketches.get(field)
+            if sketch is None:
+                continue
+            stats = {
+                'count': sketch.count,
+                'mean': sketch.mean,
+                'min': sketch.min if sketch.count else None,
+                'max': sketch.max if sketch.count else None,
+            }
+            for q in qs:
+                stats[format_quantile_label(q)] = sketch.quantile(q)
+            result[field] = stats
+        return result
+
+    def to_bytes(self) -> bytes:
+        parts = [_MAGIC, struct.pack('<H', len(self.sketches))]
+        for field, sketch in self.sketches.items():
+            name = field.encode('utf-8')
+            parts.append(struct.pack('<B', len(name)) + name)
+            parts.append(sketch.to_bytes())
+        return zlib.compress(b''.join(parts))
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> Optional['MetricSketches']:
+        if not data:
+            return None
+        raw = zlib.decompress(data)
+        if raw[:4] != _MAGIC:
+            raise ValueError("无法识别的指标草图格式")
+        (num_fields,) = struct.unpack_from('<H', raw, 4)
+        offset = 6
+        sketches = cls(fields=())
+        for _ in range(num_fields):
+            name_length = raw[offset]
+            field = raw[offset + 1:offset + 1 + name_length].decode('utf-8')
+            sketch, offset = LatencySketch.from_bytes(raw, offset + 1 + name_length)
+            sketches.sketches[field] = sketch
+        return sketches
+
+
+def format_quantile_label(q: float) -> str:
+    """0.999 -> 'p99.9'"""
+    return 'p' + f"{q * 100:.4f}".rstrip('0').rstrip('.')
+
+
+def parse_quantiles(value: Optional[str], default: Iterable[float] = (0.5, 0.9, 0.99)) -> List[float]:
+    """解析查询参数，如 '0.5,0.99,0.999' 或 'p50,p99.9'"""
+    if not value:
+        return list(default)
+    quantiles = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        number = float(item[1:]) / 100 if item.startswith('p') else float(item)
+        if not 0 <= number <= 1:
+            raise ValueError(f"分位数超出范围: {item}")
+        quantiles.append(number)
+    return quantiles
@@ -0,0 +1,98 @@
+"""
+性能评估实时遥测
+
+监控线程把工作进程推送的单请求样本放入滑动窗口，定期生成快照，每次追加一行 PerfTelemetrySnapshot
+（任务的 live_metrics 只记录最新序号），供增量轮询接口读取（多个 gunicorn worker 之间通过数据库共享）。
+"""
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# 滑动窗口长度（秒）
+TELEMETRY_WINDOW_SECONDS = 30
+# 快照写库间隔（秒）
+TELEMETRY_FLUSH_INTERVAL_SECONDS = 2
+# 每个任务保留的快照数量
+TELEMETRY_MAX_SNAPSHOTS = 300
+
+# 参与分位数统计的延迟类指标；itl 在样本中是该请求所有 token 间隔的列表
+LATENCY_FIELDS = ('ttft', 'itl', 'tpot', 'latency')
+
+
+def sample_values(sample: Dict[str, Any], field: str) -> List[float]:
+    """样本中某个指标的取值，列表类指标（itl）展开为多个值"""
+    value = sample.get(field)
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if isinstance(v, (int, float))]
+    return [value] if isinstance(value, (int, float)) else []
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class SlidingWindowTelemetry:
+    """基于时间的滑动窗口指标聚合器"""
+
+    def __init__(self, window_seconds: int = TELEMETRY_WINDOW_SECONDS, start_seq: int = 0):
+        self.window_seconds = window_seconds
+        self.samples = deque()
+        self.started_at = time.time()
+        # 续跑时接着已有快照的序号，避免与之前写入的快照重复
+        self.seq = start_seq
+        self.total_requests = 0
+        self.total_failed = 0
+        self.total_output_tokens = 0
+
+    def add(self, sample: Dict[str, Any]) -> None:
+        """加入一个单请求样本"""
+        sample.setdefault('completed_at', time.time())
+        self.samples.append(sample)
+        self.total_requests += 1
+        if not sample.get('success'):
+            self.total_failed += 1
+        self.total_output_tokens += sample.get('output_tokens') or 0
+
+    def _evict(self, now: float) -> None:
+        horizon = now - self.window_seconds
+        while self.samples and (self.samples[0].get('completed_at') or now) < horizon:
+            self.samples.popleft()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """生成当前窗口的指标快照"""
+        now = time.time()
+        self._evict(now)
+        self.seq += 1
+
+        window = list(self.samples)
+        succeeded = [s for s in window if s.get('success')]
+        span = max(1e-6, min(self.window_seconds, now - self.started_at))
+        output_tokens = sum(s.get('output_tokens') or 0 for s in succeeded)
+
+        snapshot = {
+            'seq': self.seq,
+            'timestamp': now,
+            'elapsed': round(now - self.started_at, 2),
+            'window_seconds': self.window_seconds,
+            'window_requests': len(window),
+            'window_errors': len(window) - len(succeeded),
+            'error_rate': round((len(window) - len(succeeded)) / len(window), 4) if window else 0.0,
+            'requests_per_second': round(len(succeeded) / span, 3),
+            'output_tokens_per_second': round(output_tokens / span, 3),
+            'total_requests': self.total_requests,
+            'total_errors': self.total_failed,
+            'total_output_tokens': self.total_output_tokens,
+        }
+        for field in LATENCY_FIELDS:
+            values = sorted(v for s in succeeded for v in sample_values(s, field))
+            snapshot[field] = {
+                'mean': round(sum(values) / len(values), 4) if values else None,
+                'p50': _percentile(values, 0.5),
+                'p90': _percentile(values, 0.9),
+                'p99': _percentile(values, 0.99),
+            }
+        return snapshot
+
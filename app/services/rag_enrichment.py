@@ -0,0 +1,217 @@
+"""
+RAG 数据集上传后的字段补全
+
+上传时只保存原始文件并提交一个 dataset_enrich 任务，由 worker 在后台执行：
+- 有界线程池并发调用模板的 get_context / get_response，宏内的 http.request 按主机限速
+- 单行补全失败时按退避时间重试，重试后仍失败的行不写入数据集
+- 结果按原始行的顺序增量写入临时文件，全部完成后替换原文件并重建行偏移索引
+- 进度写入 Dataset.enrich_completed / enrich_total；补全期间数据集不可用，完成后自动启用
+
+任务失败重试时从头重新补全。
+"""
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.models import Dataset
+from app.services.dataset_service import DatasetService
+from app.utils.line_index import build_line_index
+
+# Dataset.enrich_status
+ENRICH_PENDING = 'pending'
+ENRICH_RUNNING = 'running'
+ENRICH_COMPLETED = 'completed'
+ENRICH_FAILED = 'failed'
+
+# 单行的处理结果
+LINE_ENRICHED = 'enriched'
+LINE_SKIPPED = 'skipped'
+LINE_FAILED = 'failed'
+
+# 每个并发线程最多排队的行数，避免一次性把整个文件读入内存
+QUEUE_DEPTH_PER_WORKER = 4
+# 进度写库的最小间隔（秒）
+PROGRESS_INTERVAL_SECONDS = 2.0
+TEMP_FILE_SUFFIX = '.enriching'
+
+
+def needs_enrichment(dataset_format: str, jinja2_template: Optional[str], filename: str) -> bool:
+    """上传的数据集是否需要后台补全"""
+    return dataset_format == 'RAG' and bool(jinja2_template) and filename.endswith('.jsonl')
+
+
+def _enrich_line(app, line: str, template: str, max_retries: int, backoff: float) -> Tuple[str, str]:
+    """补全一行，返回 (写入结果文件的内容, 处理结果)，在线程池中执行"""
+    try:
+        item = json.loads(line.strip())
+    except json.JSONDecodeError:
+        # 无法解析的行原样保留
+        return (line if line.endswith('\n') else line + '\n'), LINE_SKIPPED
+
+    with app.app_context():
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            try:
+                processed_item = DatasetService.process_rag_dataset_item(item, template)
+            except Exception as e:
+                current_app.logger.warning(f"补全RAG数据集项失败（第 {attempt + 1} 次）: {e}")
+                processed_item = None
+            if processed_item:
+                return json.dumps(processed_item, ensure_ascii=False) + '\n', LINE_ENRICHED
+    return '', LINE_FAILED
+
+
+class _OrderedWriter:
+    """并发补全的结果按原始行号顺序写出"""
+
+    def __init__(self, f_out):
+        self.f_out = f_out
+        self.done = 0
+        self.counts = {LINE_ENRICHED: 0, LINE_SKIPPED: 0, LINE_FAILED: 0}
+        self._buffered: Dict[int, str] = {}
+        self._next_index = 0
+
+    def put(self, index: int, text: str, status: str) -> None:
+        self.done += 1
+        self.counts[status] += 1
+        self._buffered[index] = text
+        while self._next_index in self._buffered:
+            text = self._buffered.pop(self._next_index)
+            if text:
+                self.f_out.write(text)
+            self._next_index += 1
+
+
+def _collect(pending: Dict[Any, int], writer: _OrderedWriter) -> None:
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        writer.put(pending.pop(future), *future.result())
+
+
+def _report_progress(dataset_id: int, completed: int) -> bool:
+    """写入补全进度，返回False表示数据集已被删除"""
+    updated = Dataset.query.filter(Dataset.id == dataset_id).update(
+        {'enrich_completed': completed}, synchronize_session=False)
+    db.session.commit()
+    return updated == 1
+
+
+def enrich_rag_dataset(dataset_id: int) -> None:
+    """
+    补全 RAG 数据集缺失的 retrieved_contexts / response 字段（需在应用上下文中调用）
+
+    Raises:
+        ValueError: 数据集文件没有任何一行补全成功
+    """
+    dataset = Dataset.query.get(dataset_id)
+    if dataset is None:
+        current_app.logger.warning(f"数据集 {dataset_id} 不存在，跳过补全")
+        return
+    if dataset.enrich_status == ENRICH_COMPLETED:
+        return
+
+    app = current_app._get_current_object()
+    concurrency = max(1, int(app.config.get('RAG_ENRICH_CONCURRENCY', 8)))
+    max_retries = max(0, int(app.config.get('RAG_ENRICH_MAX_RETRIES', 2)))
+    backoff = float(app.config.get('RAG_ENRICH_RETRY_BACKOFF_SECONDS', 1.0))
+    file_path = dataset.download_url
+    template = dataset.jinja2_template
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        total = sum(1 for _ in f)
+    dataset.enrich_status = ENRICH_RUNNING
+    dataset.enrich_total = total
+    dataset.enrich_completed = 0
+    dataset.enrich_error = None
+    db.session.commit()
+    current_app.logger.info(f"开始补全RAG数据集 {dataset_id}，共 {total} 行，并发数 {concurrency}")
+
+    temp_path = file_path + TEMP_FILE_SUFFIX
+    pending: Dict[Any, int] = {}
+    deleted = False
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'rag-enrich-{dataset_id}')
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f_in, open(temp_path, 'w', encoding='utf-8') as f_out:
+            writer = _OrderedWriter(f_out)
+            last_report = time.monotonic()
+            lines = enumerate(f_in)
+            while not deleted:
+                for index, line in lines:
+                    pending[pool.submit(_enrich_line, app, line, template, max_retries, backoff)] = index
+                    if len(pending) >= concurrency * QUEUE_DEPTH_PER_WORKER:
+                        break
+                if not pending:
+                    break
+                _collect(pending, writer)
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    f_out.flush()
+                    deleted = not _report_progress(dataset_id, writer.done)
+                    last_report = time.monotonic()
+    except BaseException:
+        _discard(temp_path)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+    if deleted or Dataset.query.get(dataset_id) is None:
+        current_app.logger.warning(f"数据集 {dataset_id} 在补全过程中被删除，放弃补全结果")
+        _discard(temp_path)
+        return
+
+    counts = writer.counts
+    if counts[LINE_ENRICHED] == 0:
+        _discard(temp_path)
+        raise ValueError("没有任何数据补全成功，请检查 Jinja2 模板及其调用的接口是否可用")
+
+    os.replace(temp_path, file_path)
+    build_line_index(file_path)
+    dataset = Dataset.query.get(dataset_id)
+    dataset.enrich_status = ENRICH_COMPLETED
+    dataset.enrich_completed = writer.done
+    dataset.is_active = True
+    if counts[LINE_FAILED]:
+        dataset.enrich_error = f"{counts[LINE_FAILED]} 条数据重试后仍补全失败，已从数据集中移除"
+    db.session.commit()
+    current_app.logger.info(
+        f"RAG数据集 {dataset_id} 补全完成：成功 {counts[LINE_ENRICHED]} 条，"
+        f"失败 {counts[LINE_FAILED]} 条，无法解析 {counts[LINE_SKIPPED]} 条")
+
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def mark_enrichment_failed(dataset_id: int, error: str) -> None:
+    """补全任务放弃重试时调用，数据集保持禁用"""
+    dataset = Dataset.query.get(dataset_id)
+    if dataset is None or dataset.enrich_status == ENRICH_COMPLETED:
+        return
+    dataset.enrich_status = ENRICH_FAILED
+    dataset.enrich_error = error
+    db.session.commit()
+
+
+def get_enrichment_progress(dataset: Dataset) -> Dict[str, Any]:
+    """补全进度，供数据集列表轮询展示"""
+    total = dataset.enrich_total or 0
+    completed = dataset.enrich_completed or 0
+    return {
+        'dataset_id': dataset.id,
+        'status': dataset.enrich_status,
+        'total': total,
+        'completed': completed,
+        'progress_percentage': round(min(100.0, completed / total * 100.0), 1) if total else 0.0,
+        'error': dataset.enrich_error,
+        'is_active': dataset.is_active,
+    }
@@ -0,0 +1,257 @@
+"""
+评估结果导出
+
+按主键做 keyset 分页逐批读取结果，边读边写，内存占用只与批大小有关：
+- csv：流式输出，每批写完立即输出
+- parquet：流式输出，需要安装 pyarrow，每批写成一个 row group，写完立即输出
+- xlsx：不是流式输出。openpyxl 只写模式先把整个工作簿写入临时文件，全部行写完后才输出第一个字节，
+  结果很多时客户端要等待很久才收到响应，可能被代理超时断开。因此未指定格式时，
+  超过 EXPORT_XLSX_MAX_ROWS 条的结果默认导出为 csv（见 choose_export_format）
+"""
+import csv
+import io
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from app.models import ModelEvaluationResult
+from app.services.evaluation_service import EvaluationService
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+FORMAT_XLSX = 'xlsx'
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+
+EXPORT_MIMETYPES = {
+    FORMAT_XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    FORMAT_CSV: 'text/csv; charset=utf-8',
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+}
+
+# 每批读取的结果行数
+DEFAULT_BATCH_SIZE = 500
+# 输出文件时每块的字节数
+FILE_CHUNK_SIZE = 64 * 1024
+# 导出 xlsx 的默认行数上限，超过时默认改为 csv
+DEFAULT_XLSX_MAX_ROWS = 20000
+
+EXPORT_COLUMNS = ['序号', '问题', '模型回答', '参考答案', '得分', '数据集']
+# xlsx 列宽，与导出列一一对应
+XLSX_COLUMN_WIDTHS = [8, 50, 50, 30, 10, 20]
+XLSX_SHEET_NAME = '评估结果'
+
+
+def get_available_formats() -> List[str]:
+    formats = [FORMAT_XLSX, FORMAT_CSV]
+    if PYARROW_AVAILABLE:
+        formats.append(FORMAT_PARQUET)
+    return formats
+
+
+def choose_export_format(requested_format: Optional[str], row_count: int,
+                         xlsx_max_rows: int = DEFAULT_XLSX_MAX_ROWS) -> str:
+    """未指定导出格式时，行数不超过 xlsx_max_rows 导出 xlsx，否则导出可以流式输出的 csv"""
+    if requested_format:
+        return requested_format.lower()
+    return FORMAT_XLSX if row_count <= xlsx_max_rows else FORMAT_CSV
+
+
+def build_results_query(evaluation_id: int, search_query: Optional[str] = None,
+                        min_score: Optional[float] = None, max_score: Optional[float] = None):
+    query = ModelEvaluationResult.query.filter(ModelEvaluationResult.evaluation_id == evaluation_id)
+    if search_query:
+        query = query.filter(ModelEvaluationResult.question.ilike(f"%{search_query}%"))
+    if min_score is not None:
+        query = query.filter(ModelEvaluationResult.score >= min_score)
+    if max_score is not None:
+        query = query.filter(ModelEvaluationResult.score <= max_score)
+    return query
+
+
+def iter_result_batches(query, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[ModelEvaluationResult]]:
+    """按主键 keyset 分页读取，每批的查询代价与已读取的行数无关"""
+    last_id = 0
+    while True:
+        batch = (query.options(joinedload(ModelEvaluationResult.dataset))
+                 .filter(ModelEvaluationResult.id > last_id)
+                 .order_by(ModelEvaluationResult.id.asc())
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def iter_export_rows(query, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """逐批生成导出行（列名与 EXPORT_COLUMNS 一致）"""
+    index = 0
+    for batch in iter_result_batches(query, batch_size):
+        rows = []
+        for result in batch:
+            index += 1
+            # 使用统一的user_prompt获取方法
+            try:
+                formatted_question = EvaluationService._get_user_prompt_for_result(result)
+            except Exception as e:
+                current_app.logger.error(f"获取结果 {result.id} 的userPrompt失败: {str(e)}")
+                formatted_question = result.question
+            rows.append({
+                '序号': index,
+                '问题': formatted_question,
+                '模型回答': result.model_answer,
+                '参考答案': result.reference_answer or '无',
+                '得分': result.score if result.score is not None else '无评分',
+                '数据集': result.dataset.name if result.dataset else '未知数据集'
+            })
+        yield rows
+
+
+def stream_csv(row_batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    # 带 BOM，Excel 直接打开时中文不会乱码
+    buffer.write('\ufeff')
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for rows in row_batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode('utf-8')
+
+
+def write_xlsx(row_batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """写完整个工作簿后再分块输出（首个字节要等全部行写完），大结果集应使用 csv / parquet"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(XLSX_SHEET_NAME)
+    for column_index, width in enumerate(XLSX_COLUMN_WIDTHS, start=1):
+        worksheet.column_dimensions[get_column_letter(column_index)].width = width
+
+    # 只写模式下只给表头设置样式，数据行保持默认样式
+    header_font = Font(bold=True, color='FFFFFF')
+    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    header = []
+    for name in EXPORT_COLUMNS:
+        cell = WriteOnlyCell(worksheet, value=name)
+        cell.font, cell.fill, cell.alignment = header_font, header_fill, header_alignment
+        header.append(cell)
+    worksheet.append(header)
+
+    for rows in row_batches:
+        for row in rows:
+            worksheet.append([row[name] for name in EXPORT_COLUMNS])
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+class _DrainableSink(io.RawIOBase):
+    """只追加的内存缓冲，写入方每写完一段就取走已写的数据"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def stream_parquet(row_batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("导出 parquet 需要安装 pyarrow")
+    # 得分列中的“无评分”写为空值
+    schema = pa.schema([
+        ('序号', pa.int64()),
+        ('问题', pa.string()),
+        ('模型回答', pa.string()),
+        ('参考答案', pa.string()),
+        ('得分', pa.float64()),
+        ('数据集', pa.string()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in row_batches:
+            columns = {name: [row[name] for row in rows] for name in EXPORT_COLUMNS}
+            columns['得分'] = [score if isinstance(score, (int, float)) else None for score in columns['得分']]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+EXPORT_WRITERS = {
+    FORMAT_XLSX: write_xlsx,
+    FORMAT_CSV: stream_csv,
+    FORMAT_PARQUET: stream_parquet,
+}
+
+
+def stream_evaluation_results(evaluation_id: int, export_format: str = FORMAT_XLSX,
+                              search_query: Optional[str] = None,
+                              min_score: Optional[float] = None,
+                              max_score: Optional[float] = None,
+                              batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    导出评估结果（需在请求上下文中迭代，路由中使用 stream_with_context）
+
+    Args:
+        export_format: xlsx / csv / parquet；csv 与 parquet 边读边输出，xlsx 全部写完后才开始输出
+
+    Yields:
+        bytes: 文件内容分块
+    """
+    if export_format not in EXPORT_WRITERS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+    query = build_results_query(evaluation_id, search_query, min_score, max_score)
+    current_app.logger.info(f"开始导出评估 {evaluation_id} 的结果，格式: {export_format}")
+    return EXPORT_WRITERS[export_format](iter_export_rows(query, batch_size))
@@ -0,0 +1,263 @@
+"""
+evalscope review 文件的流式入库
+
+评估运行期间由后台线程按字节偏移量追踪 reviews 目录下的 .jsonl 文件，
+只解析新写入的完整行，按固定大小分块通过 Core executemany 写入 ModelEvaluationResult，
+并在同一事务中更新 ModelEvaluation.completed_prompts；评估结束后再做一次收尾读取。
+内存占用只与分块大小有关，详细结果与进度在评估过程中逐步可见。
+"""
+import glob
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.models import ModelEvaluation, ModelEvaluationResult
+
+# 每次批量写入的行数
+DEFAULT_CHUNK_SIZE = 500
+# 评估运行期间扫描 review 文件的间隔（秒）
+DEFAULT_POLL_INTERVAL_SECONDS = 5
+# evalscope 输出结构中 review 目录的名称
+REVIEWS_DIR = 'reviews'
+
+
+class ReviewFileTailer:
+    """按字节偏移量增量读取一个仍在写入中的 jsonl 文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # 已入库部分的结束位置，由调用方在写入成功后推进
+        self.offset = 0
+
+    def read_lines(self, final: bool = False) -> Iterator[Tuple[str, int]]:
+        """
+        读取 offset 之后的完整行
+
+        Args:
+            final: 评估已结束，文件末尾没有换行符的最后一行也视为完整
+
+        Yields:
+            Tuple[str, int]: (行内容, 该行结束处的偏移量)
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self.offset:
+            current_app.logger.warning(f"review 文件被截断或重写，已入库的部分不再重复读取: {self.path}")
+            self.offset = size
+            return
+        if size == self.offset:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            position = self.offset
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b'\n') and not final:
+                    # 该行还没写完，下次从行首继续读取
+                    break
+                position += len(line)
+                yield line.decode('utf-8', errors='replace').strip(), position
+
+
+def parse_review_score(review_result: Any, log_prefix: str = '') -> Optional[float]:
+    """把 review.result 转换为分数，兼容数值、{'score': x} 以及意图+槽位的复合结果"""
+    if review_result is None:
+        return None
+    try:
+        if isinstance(review_result, dict):
+            # 处理复合结果格式: {"intent_result": true, "slots_result": {"miss_count": 1, "correct_count": 1, "fail_count": 0}}
+            if 'intent_result' in review_result and 'slots_result' in review_result:
+                intent_result = review_result.get('intent_result', False)
+                slots_result = review_result.get('slots_result', {})
+
+                # 计算slot的F1分数
+                correct_count = slots_result.get('correct_count', 0)
+                miss_count = slots_result.get('miss_count', 0)
+                fail_count = slots_result.get('fail_count', 0)
+
+                total_predicted = correct_count + fail_count
+                total_actual = correct_count + miss_count
+
+                if total_predicted > 0 and total_actual > 0:
+                    precision = correct_count / total_predicted
+                    recall = correct_count / total_actual
+                    if precision + recall > 0:
+                        slot_f1 = 2 * precision * recall / (precision + recall)
+                    else:
+                        slot_f1 = 0.0
+                else:
+                    slot_f1 = 0.0
+
+                if correct_count + miss_count + fail_count == 0:
+                    slot_f1 = 1.0
+
+                return float(intent_result) * 0.5 + 0.5 * slot_f1
+            if 'score' in review_result:
+                return float(review_result.get('score', None))
+            current_app.logger.warning(f"{log_prefix} 'score' field not found in dict result '{review_result}'. Setting to None.")
+            return None
+        return float(review_result)
+    except (ValueError, TypeError) as e:
+        current_app.logger.warning(f"{log_prefix} Could not parse score '{review_result}'. Error: {str(e)}. Setting to None.")
+        return None
+
+
+def build_result_row(item: Dict[str, Any], evaluation_id: int, dataset_id: int,
+                     log_prefix: str = '') -> Dict[str, Any]:
+    """把一行 review 记录转换为 evaluation_effectiveness_result 的插入参数"""
+    raw_input = item.get('raw_input', '')
+    raw_pred_answer = ''
+    review_data = {}
+    choices = item.get('choices', [])
+    if choices and isinstance(choices, list) and isinstance(choices[0], dict):
+        choice = choices[0]
+        if isinstance(choice.get('message'), dict):
+            raw_pred_answer = choice['message'].get('content', '')
+        elif 'content' in choice:
+            raw_pred_answer = choice.get('content', '')
+        review_data = choice.get('review') or {}
+
+    return {
+        'evaluation_id': evaluation_id,
+        'dataset_id': dataset_id,
+        'question': str(raw_input),
+        'model_answer': str(raw_pred_answer),
+        'reference_answer': str(review_data.get('gold', '')),
+        'score': parse_review_score(review_data.get('result'), log_prefix),
+        'feedback': str(review_data.get('pred', '')),
+        'user_prompt': None,
+    }
+
+
+class ReviewIngester:
+    """追踪一次评估的所有 review 文件并分块入库"""
+
+    def __init__(self, app, evaluation_id: int, output_dir: str, model_identifier: str,
+                 resolve_dataset: Callable[[str], Optional[int]],
+                 format_prompt: Optional[Callable[[int, Any], str]] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS):
+        """
+        Args:
+            output_dir: evalscope 的 work_dir
+            model_identifier: 被评估模型标识，review 目录使用其最后一段（如 deepseek/xxx -> xxx）
+            resolve_dataset: review 文件名（不含扩展名）-> 数据集ID，无法匹配时返回None
+            format_prompt: (数据集ID, raw_input) -> 格式化后的完整用户提示，随结果一起入库
+        """
+        self.app = app
+        self.evaluation_id = evaluation_id
+        self.output_dir = output_dir
+        self.model_dir_name = model_identifier.split('/')[-1]
+        self.resolve_dataset = resolve_dataset
+        self.format_prompt = format_prompt
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        # 已入库的结果行数、已完成的 prompt 数（含未匹配到数据集的文件）
+        self.ingested = 0
+        self.completed = 0
+        self._tailers: Dict[str, ReviewFileTailer] = {}
+        self._dataset_ids: Dict[str, Optional[int]] = {}
+        self._stopping = threading.Event()
+        self._thread = None
+        self._log_prefix = f"[评估任务 {evaluation_id}]"
+
+    def discover_files(self) -> List[str]:
+        pattern = os.path.join(self.output_dir, '*', REVIEWS_DIR, self.model_dir_name, '*.jsonl')
+        return sorted(glob.glob(pattern))
+
+    def start(self) -> None:
+        """启动后台线程，在评估运行期间定期入库新写入的 review 行"""
+        self._thread = threading.Thread(target=self._poll_loop, name=f'review-ingest-{self.evaluation_id}', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll_loop(self) -> None:
+        with self.app.app_context():
+            while not self._stopping.wait(self.poll_interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"{self._log_prefix} 增量入库 review 文件失败: {e}", exc_info=True)
+
+    def poll(self, final: bool = False) -> int:
+        """扫描一次所有 review 文件，返回本次入库的行数"""
+        before = self.ingested
+        for path in self.discover_files():
+            tailer = self._get_tailer(path)
+            self._ingest_file(tailer, self._dataset_ids[path], final)
+        return self.ingested - before
+
+    def _get_tailer(self, path: str) -> ReviewFileTailer:
+        if path not in self._tailers:
+            filename_stem = os.path.basename(path)[:-6]  # Remove .jsonl
+            dataset_id = self.resolve_dataset(filename_stem)
+            if dataset_id is None:
+                current_app.logger.warning(f"{self._log_prefix} 无法找到filename_stem '{filename_stem}' 对应的数据集，该文件只计入进度")
+            else:
+                current_app.logger.info(f"{self._log_prefix} Processing review file: {path}")
+            self._tailers[path] = ReviewFileTailer(path)
+            self._dataset_ids[path] = dataset_id
+        return self._tailers[path]
+
+    def _ingest_file(self, tailer: ReviewFileTailer, dataset_id: Optional[int], final: bool) -> None:
+        rows, lines = [], 0
+        chunk_end = tailer.offset
+        for line, end_offset in tailer.read_lines(final=final):
+            chunk_end = end_offset
+            if not line:
+                continue
+            lines += 1
+            if dataset_id is not None:
+                try:
+                    item = json.loads(line)
+                    row = build_result_row(item, self.evaluation_id, dataset_id, self._log_prefix)
+                except ValueError as e:
+                    current_app.logger.warning(f"{self._log_prefix} 跳过无法解析的 review 行 ({tailer.path}): {e}")
+                else:
+                    row['user_prompt'] = self._format_prompt(dataset_id, item.get('raw_input'))
+                    rows.append(row)
+            if lines >= self.chunk_size:
+                self._flush(tailer, rows, lines, chunk_end)
+                rows, lines = [], 0
+        self._flush(tailer, rows, lines, chunk_end)
+
+    def _format_prompt(self, dataset_id: int, raw_input: Any) -> Optional[str]:
+        """格式化失败时留空，结果页展示时再补算"""
+        if self.format_prompt is None or raw_input is None:
+            return None
+        try:
+            return self.format_prompt(dataset_id, raw_input)
+        except Exception as e:
+            current_app.logger.warning(f"{self._log_prefix} 格式化用户提示失败: {e}")
+            return None
+
+    def _flush(self, tailer: ReviewFileTailer, rows: List[Dict[str, Any]], lines: int, end_offset: int) -> None:
+        """写入一个分块并更新进度，提交成功后才推进文件偏移量"""
+        if lines:
+            completed = self.completed + lines
+            if rows:
+                db.session.execute(ModelEvaluationResult.__table__.insert(), rows)
+            db.session.execute(
+                ModelEvaluation.__table__.update()
+                .where(ModelEvaluation.__table__.c.id == self.evaluation_id)
+                .values(completed_prompts=completed)
+            )
+            db.session.commit()
+            self.completed = completed
+            self.ingested += len(rows)
+        tailer.offset = end_offset
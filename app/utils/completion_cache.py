@@ -0,0 +1,222 @@
+"""
+确定性模型调用的结果缓存
+
+按 (端点, 模型, messages, 生成参数) 的内容哈希缓存模型回复，只在结果可复现时使用：
+temperature 为 0 或指定了 seed。数据存放在本地 SQLite 文件（WAL 模式，多进程共享），
+按总字节数做 LRU 淘汰，命中/未命中等计数同样持久化，便于观察跨进程的整体命中率。
+读取路径尽量不写库：命中/未命中先在进程内累计、定期合并写入，最近访问时间超过一定间隔才刷新，
+避免每次读取都争抢 SQLite 的写锁。
+
+默认关闭，设置 COMPLETION_CACHE_ENABLED=true 后生效；首次获取缓存需在应用上下文中，
+之后 evalscope 的评测线程等没有应用上下文的地方也可以直接使用。
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app, has_app_context
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 超出容量时淘汰到该比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+# 参与缓存键的生成参数
+KEY_PARAMS = ('temperature', 'top_p', 'top_k', 'max_tokens', 'max_new_tokens', 'seed', 'stop',
+              'presence_penalty', 'frequency_penalty', 'response_format')
+STAT_NAMES = ('hits', 'misses', 'stores', 'evictions')
+# 进程内累计的命中/未命中计数写入数据库的间隔（秒）
+STATS_FLUSH_SECONDS = 10
+# 命中时距离上次记录的访问时间超过该值（秒）才刷新 accessed_at，LRU 的时间精度即为该值
+ACCESS_TOUCH_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def is_cacheable(params: Optional[Dict[str, Any]]) -> bool:
+    """temperature 为 0 或指定了 seed 的调用才可缓存"""
+    if not params:
+        return False
+    if params.get('seed') is not None:
+        return True
+    temperature = params.get('temperature')
+    return temperature is not None and float(temperature) == 0
+
+
+def make_cache_key(endpoint: str, model: str, messages: Any, params: Optional[Dict[str, Any]]) -> str:
+    payload = {
+        'endpoint': (endpoint or '').rstrip('/'),
+        'model': model,
+        'messages': messages,
+        'params': {name: params[name] for name in KEY_PARAMS if params and params.get(name) is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """基于本地 SQLite 文件、按字节数 LRU 淘汰的回复缓存"""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        # 尚未写入数据库的命中/未命中计数
+        self._pending_stats = {'hits': 0, 'misses': 0}
+        self._pending_pid = os.getpid()
+        self._last_flush = time.monotonic()
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_completion_accessed_at ON completion (accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS completion_stat (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.executemany("INSERT OR IGNORE INTO completion_stat (name, value) VALUES (?, 0)",
+                         [(name,) for name in STAT_NAMES + ('bytes',)])
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程、跨 fork 使用：按线程 + 进程号各自建立
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _incr(conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute("UPDATE completion_stat SET value = value + ? WHERE name = ?", (amount, name))
+
+    def _record(self, name: str) -> bool:
+        """进程内累计一次命中/未命中，返回是否到了写入数据库的时间"""
+        with self._stats_lock:
+            if self._pending_pid != os.getpid():
+                # fork 出的子进程不能重复写入父进程尚未写入的计数
+                self._pending_stats = {'hits': 0, 'misses': 0}
+                self._pending_pid = os.getpid()
+            self._pending_stats[name] += 1
+            return time.monotonic() - self._last_flush >= STATS_FLUSH_SECONDS
+
+    def flush_stats(self) -> None:
+        """把进程内累计的命中/未命中计数写入数据库"""
+        with self._stats_lock:
+            if self._pending_pid != os.getpid():
+                self._pending_stats = {'hits': 0, 'misses': 0}
+                self._pending_pid = os.getpid()
+            pending = [(amount, name) for name, amount in self._pending_stats.items() if amount]
+            self._pending_stats = {'hits': 0, 'misses': 0}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE completion_stat SET value = value + ? WHERE name = ?", pending)
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.warning(f"写入模型回复缓存统计失败: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, accessed_at FROM completion WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[1] >= ACCESS_TOUCH_SECONDS:
+                conn.execute("UPDATE completion SET accessed_at = ? WHERE key = ?", (now, key))
+            if self._record('hits' if row is not None else 'misses'):
+                self.flush_stats()
+            return json.loads(row[0]) if row is not None else None
+        except Exception as e:
+            logger.warning(f"读取模型回复缓存失败: {e}")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raw = json.dumps(value, ensure_ascii=False)
+        size = len(raw.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        try:
+            conn = self._connect()
+            now = time.time()
+            # IMMEDIATE 事务串行化多进程的写入，保证总字节数计数准确
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = conn.execute("SELECT size FROM completion WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO completion (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, raw, size, now, now)
+                )
+                self._incr(conn, 'bytes', size - (old[0] if old else 0))
+                self._incr(conn, 'stores')
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            logger.warning(f"写入模型回复缓存失败: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """总字节数超出上限时，按最久未访问的顺序淘汰到上限的 90%"""
+        (total,) = conn.execute("SELECT value FROM completion_stat WHERE name = 'bytes'").fetchone()
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        removed_keys, removed_bytes = [], 0
+        for key, size in conn.execute("SELECT key, size FROM completion ORDER BY accessed_at ASC"):
+            if total - removed_bytes <= target:
+                break
+            removed_keys.append((key,))
+            removed_bytes += size
+        conn.executemany("DELETE FROM completion WHERE key = ?", removed_keys)
+        self._incr(conn, 'bytes', -removed_bytes)
+        self._incr(conn, 'evictions', len(removed_keys))
+
+    def stats(self) -> Dict[str, Any]:
+        """整体统计；其他进程尚未写入的命中/未命中（最多 STATS_FLUSH_SECONDS 秒）不包含在内"""
+        self.flush_stats()
+        conn = self._connect()
+        stats = dict(conn.execute("SELECT name, value FROM completion_stat").fetchall())
+        (stats['entries'],) = conn.execute("SELECT COUNT(*) FROM completion").fetchone()
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = round(stats.get('hits', 0) / lookups, 4) if lookups else None
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    def clear(self) -> None:
+        with self._stats_lock:
+            self._pending_stats = {'hits': 0, 'misses': 0}
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM completion")
+        conn.execute("UPDATE completion_stat SET value = 0")
+        conn.execute("COMMIT")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """获取进程内的回复缓存；未启用时返回None"""
+    global _cache
+    if _cache is None and has_app_context():
+        config = current_app.config
+        if not config.get('COMPLETION_CACHE_ENABLED'):
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache(config['COMPLETION_CACHE_PATH'],
+                                         int(config.get('COMPLETION_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+                # 进程退出前写入尚未合并的命中/未命中计数
+                atexit.register(_cache.flush_stats)
+    return _cache
@@ -0,0 +1,243 @@
+"""
+进程级 HTTP 客户端注册表
+
+按端点复用连接池，避免每次请求都重新建立 TCP/TLS 连接：
+- get_http_session(url)：按 scheme://host 共享的 requests.Session
+- get_openai_client(api_base_url, api_key)：按 (api_base_url, api_key) 共享的 openai.OpenAI
+
+- throttle_host(url)：按主机限制请求速率（数据集模板中的 http.request 使用）
+
+连接池大小即单个主机的并发连接上限（满了之后排队等待而不是新建连接，最长等待 HTTP_POOL_TIMEOUT_SECONDS 秒）。
+共享的 Session 不保存响应中的 Cookie，避免一个用户的登录态被其他用户的请求带上。
+长时间未使用（或超出数量上限）的客户端会从注册表中移出，等待 CLIENT_CLOSE_GRACE_SECONDS 后关闭，
+让移出前已经开始的请求有时间完成；空闲连接由连接池自身的 keep-alive 过期时间关闭。
+注册表按进程号隔离，fork 出的子进程会重新创建自己的客户端。
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http import cookiejar
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+import openai
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+DEFAULT_POOL_MAXSIZE = 20
+# 连接池满时等待空闲连接的最长时间（秒）
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_IDLE_SECONDS = 300
+DEFAULT_MAX_CLIENTS = 64
+# openai 客户端的默认请求超时（秒），与 SDK 默认值一致
+DEFAULT_OPENAI_TIMEOUT = 600
+# 客户端移出注册表后等待多久再关闭（秒），不短于单个请求的最长耗时
+CLIENT_CLOSE_GRACE_SECONDS = DEFAULT_OPENAI_TIMEOUT
+# 单主机每秒请求数上限的默认值
+DEFAULT_HOST_RATE_LIMIT = 10.0
+# 限速表中保留的主机数超过该值时清理已过期的记录
+RATE_LIMITER_PRUNE_SIZE = 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _get_setting(name: str, default: int) -> int:
+    if has_app_context():
+        return int(current_app.config.get(name, default))
+    return default
+
+
+class ClientRegistry:
+    """带空闲淘汰和数量上限的客户端注册表（线程安全）"""
+
+    def __init__(self):
+        self._clients: 'OrderedDict[Any, Tuple[Any, float]]' = OrderedDict()
+        # 已移出、等待关闭的客户端：(客户端, 移出时间)
+        self._retired: List[Tuple[Any, float]] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, key, factory):
+        now = time.time()
+        idle_seconds = _get_setting('HTTP_POOL_IDLE_SECONDS', DEFAULT_IDLE_SECONDS)
+        max_clients = _get_setting('HTTP_MAX_CLIENTS', DEFAULT_MAX_CLIENTS)
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 后父进程的连接不能复用，也不能由子进程关闭
+                self._clients.clear()
+                self._retired = []
+                self._pid = os.getpid()
+            self._evict(now, idle_seconds, max_clients)
+            expired = self._take_expired_retired(now)
+            entry = self._clients.pop(key, None)
+            client = entry[0] if entry else factory()
+            self._clients[key] = (client, now)
+        # 关闭连接可能较慢，放在锁外
+        _close_clients(expired)
+        return client
+
+    def _evict(self, now: float, idle_seconds: float, max_clients: int) -> None:
+        # OrderedDict 按最近使用排序，最久未用的在前面；
+        # 移出后先不关闭，避免打断其他线程仍在进行的请求
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if now - last_used > idle_seconds or len(self._clients) >= max_clients:
+                client, _ = self._clients.pop(key)
+                self._retired.append((client, now))
+            else:
+                break
+
+    def _take_expired_retired(self, now: float) -> List[Any]:
+        """取出移出时间超过 CLIENT_CLOSE_GRACE_SECONDS 的客户端"""
+        expired = [client for client, retired_at in self._retired if now - retired_at >= CLIENT_CLOSE_GRACE_SECONDS]
+        if expired:
+            self._retired = [(client, retired_at) for client, retired_at in self._retired
+                             if now - retired_at < CLIENT_CLOSE_GRACE_SECONDS]
+        return expired
+
+    def clear(self) -> None:
+        with self._lock:
+            self._retired.extend((client, time.time()) for client, _ in self._clients.values())
+            self._clients.clear()
+
+
+def _close_clients(clients: List[Any]) -> None:
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"关闭 HTTP 客户端失败: {e}")
+
+
+_sessions = ClientRegistry()
+_openai_clients = ClientRegistry()
+
+
+def _host_key(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class _BlockAllCookies(cookiejar.CookiePolicy):
+    """既不保存也不回传任何 Cookie；调用方显式传入的 cookies 参数不受影响"""
+    netscape = True
+    rfc2965 = False
+    hide_cookie2 = False
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+    def domain_return_ok(self, domain, request):
+        return False
+
+    def path_return_ok(self, path, request):
+        return False
+
+
+def _bounded_pool_classes(pool_timeout: float) -> dict:
+    """获取连接时默认最多等待 pool_timeout 秒的连接池类（requests 不向 urllib3 传递 pool_timeout）"""
+    def bounded(base):
+        class BoundedPool(base):
+            def _get_conn(self, timeout=None):
+                return super()._get_conn(timeout=pool_timeout if timeout is None else timeout)
+        BoundedPool.__name__ = f"Bounded{base.__name__}"
+        return BoundedPool
+
+    return {'http': bounded(HTTPConnectionPool), 'https': bounded(HTTPSConnectionPool)}
+
+
+class _BoundedPoolAdapter(HTTPAdapter):
+    """连接池满时阻塞等待，但最多等待 pool_timeout 秒，超时抛出 requests.exceptions.ConnectionError"""
+    __attrs__ = HTTPAdapter.__attrs__ + ['_pool_timeout']
+
+    def __init__(self, pool_timeout: float, **kwargs):
+        self._pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _bounded_pool_classes(self._pool_timeout)
+
+    def send(self, request, *args, **kwargs):
+        try:
+            return super().send(request, *args, **kwargs)
+        except EmptyPoolError as e:
+            raise requests.exceptions.ConnectionError(f"等待连接池空闲连接超时: {e}", request=request)
+
+
+def _create_session() -> requests.Session:
+    pool_maxsize = _get_setting('HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+    pool_timeout = _get_setting('HTTP_POOL_TIMEOUT_SECONDS', DEFAULT_POOL_TIMEOUT)
+    adapter = _BoundedPoolAdapter(pool_timeout, pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+    session = requests.Session()
+    # Session 按主机在所有用户之间共享，不能保存服务端下发的 Cookie
+    session.cookies.set_policy(_BlockAllCookies())
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session(url: str) -> requests.Session:
+    """获取 url 所在主机共享的 requests.Session"""
+    return _sessions.get(_host_key(url), _create_session)
+
+
+def get_openai_client(api_base_url: str, api_key: Optional[str]) -> openai.OpenAI:
+    """获取 (api_base_url, api_key) 共享的 OpenAI 客户端"""
+    def factory():
+        pool_maxsize = _get_setting('HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_maxsize,
+                max_keepalive_connections=pool_maxsize,
+                keepalive_expiry=_get_setting('HTTP_POOL_IDLE_SECONDS', DEFAULT_IDLE_SECONDS),
+            ),
+            timeout=DEFAULT_OPENAI_TIMEOUT,
+        )
+        return openai.OpenAI(api_key=api_key, base_url=api_base_url, http_client=http_client)
+
+    return _openai_clients.get((api_base_url, api_key), factory)
+
+
+class HostRateLimiter:
+    """按主机限速（线程安全）：同一主机相邻两次请求的间隔不小于 1/rate 秒"""
+
+    def __init__(self):
+        self._next_slots = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str, rate: float) -> float:
+        """预约下一个可用时间点并等待到该时间，返回等待的秒数"""
+        if rate <= 0:
+            return 0.0
+        key = _host_key(url)
+        with self._lock:
+            now = time.monotonic()
+            if len(self._next_slots) > RATE_LIMITER_PRUNE_SIZE:
+                self._next_slots = {k: v for k, v in self._next_slots.items() if v > now}
+            slot = max(now, self._next_slots.get(key, now))
+            self._next_slots[key] = slot + 1.0 / rate
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+_host_rate_limiter = HostRateLimiter()
+
+
+def throttle_host(url: str) -> float:
+    """按 HTTP_HOST_RATE_LIMIT 限制对 url 所在主机的请求速率（每个进程分别计算）"""
+    rate = DEFAULT_HOST_RATE_LIMIT
+    if has_app_context():
+        rate = float(current_app.config.get('HTTP_HOST_RATE_LIMIT', DEFAULT_HOST_RATE_LIMIT))
+    return _host_rate_limiter.acquire(url, rate)
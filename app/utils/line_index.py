@@ -0,0 +1,192 @@
+"""
+数据集文件的行偏移索引
+
+在 JSONL / CSV 文件旁边保存一个 <文件名>.idx 索引文件，记录每条数据起始位置的字节偏移，
+分页读取时直接定位到目标页，用 mmap 只读取这一页的字节，耗时和内存只与每页条数有关。
+- JSONL：每个非空行是一条数据
+- CSV：第一条记录是表头；按引号配对划分记录（字段内可以包含换行），空行不算数据
+
+索引文件格式：固定长度的头部（魔数、源文件大小、修改时间、数据条数），之后是小端序的 8 字节偏移数组。
+CSV 的偏移数组以表头起始位置开头；数组最后一项是最后一条数据的结束位置。
+源文件的大小或修改时间与头部记录不一致时自动重建。
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+INDEX_SUFFIX = '.idx'
+KIND_JSONL = 'jsonl'
+KIND_CSV = 'csv'
+
+_MAGIC = b'DSLIDX01'
+_HEADER = struct.Struct('<8sqqQ')
+_OFFSET = struct.Struct('<Q')
+# 构建索引时每批写出的偏移个数
+_WRITE_BATCH = 65536
+# 偏移数组中数据之前的记录数（CSV 的表头）
+_LEADING_RECORDS = {KIND_JSONL: 0, KIND_CSV: 1}
+
+
+class LineRange(NamedTuple):
+    """一段连续数据所在的原始字节"""
+    data: bytes
+    header: Optional[bytes]
+    total: int
+
+
+def get_index_path(file_path: str) -> str:
+    return file_path + INDEX_SUFFIX
+
+
+def get_file_kind(file_path: str) -> Optional[str]:
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.jsonl':
+        return KIND_JSONL
+    if ext == '.csv':
+        return KIND_CSV
+    return None
+
+
+def _iter_jsonl_offsets(f: BinaryIO) -> Iterator[int]:
+    position = 0
+    for line in f:
+        if line.strip():
+            yield position
+        position += len(line)
+    yield position
+
+
+def _iter_csv_offsets(f: BinaryIO) -> Iterator[int]:
+    # 引号个数为奇数说明记录还没结束；转义的双引号成对出现，不影响奇偶。
+    # UTF-8 多字节字符中不会出现 0x22，可以直接按字节统计
+    position = 0
+    record_start = None
+    quotes = 0
+    for line in f:
+        if record_start is None:
+            if not line.strip(b'\r\n'):
+                position += len(line)
+                continue
+            record_start = position
+            quotes = 0
+        quotes += line.count(b'"')
+        position += len(line)
+        if quotes % 2 == 0:
+            yield record_start
+            record_start = None
+    if record_start is not None:
+        yield record_start
+    yield position
+
+
+def _build(file_path: str, f: BinaryIO, stat: os.stat_result, kind: str) -> None:
+    index_path = get_index_path(file_path)
+    temp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    offsets = _iter_csv_offsets(f) if kind == KIND_CSV else _iter_jsonl_offsets(f)
+    entries = 0
+    try:
+        with open(temp_path, 'wb') as out:
+            out.write(_HEADER.pack(_MAGIC, 0, 0, 0))
+            batch = array('Q')
+            for offset in offsets:
+                batch.append(offset)
+                entries += 1
+                if len(batch) >= _WRITE_BATCH:
+                    _write_batch(out, batch)
+            _write_batch(out, batch)
+            # 表头缺失的 CSV 没有数据
+            count = max(0, entries - 1 - _LEADING_RECORDS[kind])
+            out.seek(0)
+            out.write(_HEADER.pack(_MAGIC, stat.st_size, stat.st_mtime_ns, count))
+        os.replace(temp_path, index_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_batch(out: BinaryIO, batch: array) -> None:
+    if sys.byteorder != 'little':
+        batch.byteswap()
+    out.write(batch.tobytes())
+    del batch[:]
+
+
+def _open_index(file_path: str, stat: os.stat_result) -> Tuple[Optional[BinaryIO], int]:
+    """打开与源文件当前版本一致的索引，返回 (索引文件, 数据条数)；索引不存在或已过期时返回 (None, 0)"""
+    try:
+        index_file = open(get_index_path(file_path), 'rb')
+    except FileNotFoundError:
+        return None, 0
+    header = index_file.read(_HEADER.size)
+    if len(header) == _HEADER.size:
+        magic, size, mtime_ns, count = _HEADER.unpack(header)
+        if magic == _MAGIC and size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+            return index_file, count
+    index_file.close()
+    return None, 0
+
+
+def _read_offset(index_file: BinaryIO, entry: int) -> int:
+    index_file.seek(_HEADER.size + entry * _OFFSET.size)
+    return _OFFSET.unpack(index_file.read(_OFFSET.size))[0]
+
+
+def build_line_index(file_path: str) -> int:
+    """为 JSONL / CSV 文件构建（或重建）索引，返回数据条数；其他类型的文件返回 -1"""
+    kind = get_file_kind(file_path)
+    if kind is None:
+        return -1
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        _build(file_path, f, stat, kind)
+        index_file, count = _open_index(file_path, stat)
+    if index_file is not None:
+        index_file.close()
+    return count
+
+
+def read_line_range(file_path: str, start: int, stop: int) -> LineRange:
+    """
+    读取第 [start, stop) 条数据所在的原始字节，索引缺失或过期时先重建
+
+    Returns:
+        LineRange: data 为这些数据的字节（JSONL 中可能夹带空行），
+                   header 为 CSV 表头记录的字节（JSONL 为 None），total 为数据总条数
+    """
+    kind = get_file_kind(file_path)
+    if kind is None:
+        raise ValueError(f"不支持建立行索引的文件类型: {file_path}")
+    leading = _LEADING_RECORDS[kind]
+    # 索引与打开的文件描述符按同一份 stat 校验，读取期间源文件被替换也不会错位
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        index_file, total = _open_index(file_path, stat)
+        if index_file is None:
+            _build(file_path, f, stat, kind)
+            index_file, total = _open_index(file_path, stat)
+            if index_file is None:
+                raise RuntimeError(f"构建行索引失败: {file_path}")
+        with index_file:
+            start = max(0, start)
+            stop = min(stop, total)
+            if start >= stop:
+                return LineRange(b'', None, total)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header = None
+                if leading:
+                    header = mm[_read_offset(index_file, 0):_read_offset(index_file, leading)]
+                begin = _read_offset(index_file, leading + start)
+                end = _read_offset(index_file, leading + stop)
+                return LineRange(mm[begin:end], header, total)
+
+
+def remove_line_index(file_path: str) -> None:
+    try:
+        os.remove(get_index_path(file_path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,241 @@
+"""
+跨进程共享缓存
+
+gunicorn 的多个 Web worker 与独立的评估 worker 进程之间共享的键值缓存，支持 TTL、
+按容量的 LRU 淘汰、显式失效，以及可用作跨进程锁的 add（键不存在时才写入）：
+- sqlite（默认）：本机文件，多进程共享，无需额外服务
+- redis：任意 Redis 协议服务（需安装 redis 包），多机部署时使用；容量上限由服务端的
+  maxmemory-policy（如 allkeys-lru）负责
+
+值以 JSON 序列化，按命名空间隔离，例如:
+    get_cache('system_models').get_or_set(key, loader, ttl=600)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from flask import current_app
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+BACKEND_SQLITE = 'sqlite'
+BACKEND_REDIS = 'redis'
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 10000
+# 每个进程每写入多少次做一次过期清理与容量检查；两次检查之间条目数最多超出上限 N×进程数
+EVICT_EVERY_WRITES = 100
+KEY_PREFIX = 'llm_eval'
+
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCacheBackend:
+    """基于本地 SQLite 文件的缓存，WAL 模式下多进程可并发读写"""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entry ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed_at ON cache_entry (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程、跨 fork 使用：按线程 + 进程号各自建立
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM cache_entry WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache_entry SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entry (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl if ttl else None, now)
+        )
+        # 清理与 COUNT(*) 都要扫描整表，按写入次数抽样执行，而不是每次写入都做
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY_WRITES == 0
+        if due:
+            self._evict(conn, now)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """键不存在（或已过期）时写入并返回True，否则返回False；多进程之间原子"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache_entry WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                         (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache_entry (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl if ttl else None, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """清理过期项；超过容量时淘汰最久未访问的条目（每 EVICT_EVERY_WRITES 次写入执行一次）"""
+        conn.execute("DELETE FROM cache_entry WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache_entry").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache_entry WHERE key IN "
+                "(SELECT key FROM cache_entry ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        self._connect().execute("DELETE FROM cache_entry WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+
+class RedisCacheBackend:
+    """Redis 协议缓存（Redis / KeyDB / Dragonfly 等）"""
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(key, value, ex=max(1, int(ttl)) if ttl else None)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(key, value, ex=max(1, int(ttl)) if ttl else None, nx=True))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        keys = []
+        for key in self.client.scan_iter(match=f"{prefix}*", count=500):
+            keys.append(key)
+            if len(keys) >= 500:
+                self.client.delete(*keys)
+                keys = []
+        if keys:
+            self.client.delete(*keys)
+
+
+class SharedCache:
+    """一个命名空间下的缓存；后端异常只记录日志并视为未命中，不影响业务"""
+
+    def __init__(self, namespace: str, backend):
+        self.namespace = namespace
+        self.backend = backend
+        self._prefix = f"{KEY_PREFIX}:{namespace}:"
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}{key}"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            raw = self.backend.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"读取共享缓存失败 ({self.namespace}:{key}): {e}")
+            return default
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = DEFAULT_TTL_SECONDS) -> None:
+        try:
+            self.backend.set(self._key(key), json.dumps(value, ensure_ascii=False), ttl)
+        except Exception as e:
+            logger.warning(f"写入共享缓存失败 ({self.namespace}:{key}): {e}")
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = DEFAULT_TTL_SECONDS) -> bool:
+        """键不存在时写入并返回True，可用作跨进程的互斥锁（ttl 即锁的最长持有时间）；后端异常时返回False"""
+        try:
+            return self.backend.add(self._key(key), json.dumps(value, ensure_ascii=False), ttl)
+        except Exception as e:
+            logger.warning(f"写入共享缓存失败 ({self.namespace}:{key}): {e}")
+            return False
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = DEFAULT_TTL_SECONDS) -> Any:
+        """命中则直接返回，否则调用 loader 计算并写入缓存（loader 返回None时不缓存）"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        try:
+            self.backend.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"删除共享缓存失败 ({self.namespace}:{key}): {e}")
+
+    def invalidate_all(self) -> None:
+        """清空当前命名空间"""
+        try:
+            self.backend.delete_prefix(self._prefix)
+        except Exception as e:
+            logger.warning(f"清空共享缓存失败 ({self.namespace}): {e}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(config):
+    backend_name = config.get('CACHE_BACKEND', BACKEND_SQLITE)
+    if backend_name == BACKEND_REDIS:
+        if REDIS_AVAILABLE and config.get('CACHE_REDIS_URL'):
+            return RedisCacheBackend(config['CACHE_REDIS_URL'])
+        logger.warning("CACHE_BACKEND=redis 但未安装 redis 包或未配置 CACHE_REDIS_URL，回退到 sqlite 缓存")
+    return SQLiteCacheBackend(config['CACHE_SQLITE_PATH'], int(config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
+
+
+def get_cache(namespace: str) -> SharedCache:
+    """获取命名空间缓存（需在应用上下文中调用，后端按进程只创建一次）"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend(current_app.config)
+    return SharedCache(namespace, _backend)
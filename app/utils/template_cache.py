@@ -0,0 +1,72 @@
+"""
+Jinja2 模板编译缓存
+
+自定义数据集的模板在适配器构造、基准注册、RAG 数据逐行补全等路径上会被反复使用。
+按模板内容的哈希缓存编译好的 Template，并缓存解析后的 get_config() 结果，
+模板内容变化时哈希随之变化，不需要显式失效。
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+from jinja2 import Environment, Template
+
+DEFAULT_CACHE_SIZE = 256
+
+_UNSET = object()
+
+
+def template_hash(template_content: str) -> str:
+    return hashlib.sha256((template_content or '').encode('utf-8')).hexdigest()
+
+
+class CompiledTemplateCache:
+    """同一个 Environment 下按内容哈希缓存的已编译模板（线程安全，LRU）"""
+
+    def __init__(self, env_factory: Callable[[], Environment], max_size: int = DEFAULT_CACHE_SIZE):
+        self._env_factory = env_factory
+        self._env = None
+        self.max_size = max_size
+        # 内容哈希 -> [Template, 解析后的 get_config()]
+        self._entries: 'OrderedDict[str, list]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def env(self) -> Environment:
+        if self._env is None:
+            with self._lock:
+                if self._env is None:
+                    self._env = self._env_factory()
+        return self._env
+
+    def _get_entry(self, template_content: str) -> list:
+        key = template_hash(template_content)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        # 编译放在锁外，编译失败时抛出 jinja2 的异常
+        entry = [self.env.from_string(template_content), _UNSET]
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_template(self, template_content: str) -> Template:
+        return self._get_entry(template_content)[0]
+
+    def get_config(self, template_content: str) -> Dict[str, Any]:
+        """模板 get_config() 宏解析后的配置；返回的字典在调用方之间共享，不要修改"""
+        entry = self._get_entry(template_content)
+        if entry[1] is _UNSET:
+            entry[1] = json.loads(entry[0].module.get_config())
+        return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
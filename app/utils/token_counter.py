@@ -0,0 +1,54 @@
+"""
+token 计数
+
+优先使用 tiktoken 的 cl100k_base 编码；未安装或编码文件无法加载（如离线环境）时，
+退化为按字符估算：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token。
+不同模型的分词器并不一致，结果只用于预算控制，不用于计费。
+"""
+import logging
+import threading
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_ENCODING = 'cl100k_base'
+# 每条消息的角色、分隔符等额外开销
+MESSAGE_TOKEN_OVERHEAD = 4
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_unavailable = not TIKTOKEN_AVAILABLE
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_unavailable:
+                try:
+                    _encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+                except Exception as e:
+                    logger.warning(f"加载 tiktoken 编码 {DEFAULT_ENCODING} 失败，改为按字符估算 token 数: {e}")
+                    _encoding_unavailable = True
+    return _encoding
+
+
+def _estimate_tokens(text: str) -> int:
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7af' or '\uf900' <= ch <= '\ufaff')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的 token 数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens(text)
@@ -21,6 +21,11 @@ def main():
     # 初始化数据库
     run_command("python /app/init_database.py", "初始化数据库")
     
+    # APP_ROLE=worker 时只运行评估任务 worker（数据库由 web 容器初始化）
+    if os.environ.get("APP_ROLE") == "worker":
+        print("启动评估任务worker...")
+        os.execvp("python", ["python", "/app/worker.py"])
+
     # 启动Flask应用
     print("启动Flask应用...")
     os.execvp("gunicorn", [
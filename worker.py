@@ -0,0 +1,31 @@
+"""
+评估任务 worker 入口
+
+用法:
+    EVAL_JOB_MODE=queue python worker.py --concurrency 2
+    python worker.py --types perf_eval,perf_batch
+"""
+import argparse
+import logging
+
+from app import create_app
+from app.services.job_worker import JobWorker
+
+app = create_app()
+
+logging.basicConfig(level=logging.INFO)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='运行评估任务 worker')
+    parser.add_argument('--concurrency', type=int, default=app.config.get('EVAL_WORKER_CONCURRENCY', 2),
+                        help='同时执行的任务数 (默认: EVAL_WORKER_CONCURRENCY 或 2)')
+    parser.add_argument('--types', default='', help='只领取指定类型的任务，逗号分隔 (默认: 全部)')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='队列为空时的轮询间隔秒数 (默认: 2)')
+    args = parser.parse_args()
+
+    JobWorker(
+        app,
+        concurrency=args.concurrency,
+        job_types=[t.strip() for t in args.types.split(',') if t.strip()],
+        poll_interval=args.poll_interval
+    ).run()